@@ -1,10 +1,56 @@
 import os
-import shutil
+import stat
+import argparse
 import datetime
 import logging
 import json
+import time
 from pathlib import Path
 
+import archive
+import journal
+import pack
+from backends import (
+    MULTIPART_THRESHOLD,
+    REMOTE_PACK_THRESHOLD,
+    MultipartUpload,
+    PackBuffer,
+    is_remote,
+    join_key,
+    open_backend,
+)
+from catalog import Catalog, update_catalog
+from checkpoint import (
+    Checkpoint,
+    find_unfinished,
+    get_checkpoint_dir,
+    read_completed,
+)
+from chunk_store import ChunkStore, dedup_report
+from copy_engine import DEFAULT_MAX_WORKERS, CopyEngine
+from delta import DeltaCopier
+from fanout import FanOutCopier
+from tail_copy import TailCopier
+from fast_copy import RANGE_SIZE
+from ignore_rules import (
+    DEFAULT_IGNORE_FILE,
+    compile_extensions,
+    load_matcher,
+    parse_size,
+)
+from merkle import MerkleStore, build_tree, diff_trees, record_tree
+from restore import find_snapshot_at, parse_point_in_time, restore_snapshot
+from retention import (
+    RETENTION_BUCKETS,
+    log_prune_stats,
+    policy_enabled,
+    prune_snapshots,
+)
+from throttle import create_throttle, set_idle_priority
+from verify import DEFAULT_VERIFY_WORKERS, verify_snapshot
+from walker import exclude_paths, walk_files
+from watcher import RESCAN, create_watcher, watch_changes
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -35,78 +81,1463 @@ def load_config():
 
 
 def should_include_file(filename, allowed_extensions):
-    """Check if file should be included based on extension"""
-    if not allowed_extensions or "*" in allowed_extensions:
-        return True
+    """Check if file should be included based on extension
+
+    For whole runs use ignore_rules.load_matcher, which compiles the
+    filter once instead of on every call.
+    """
+    extensions = compile_extensions(allowed_extensions)
+    return extensions is None or filename.lower().endswith(extensions)
+
+
+def new_stats():
+    """Create the counters reported at the end of a run"""
+    return {
+        "copied": 0,
+        "skipped": 0,
+        "unchanged": 0,
+        "linked": 0,
+        "resumed": 0,
+        "errors": 0,
+        "bytes": 0,
+        "elapsed": 0.0,
+        "throughput_mb_s": 0.0,
+        "methods": {},
+    }
+
+
+def merge_engine_stats(stats, engine):
+    """Add the copy engine results to the run counters"""
+    stats["copied"] += engine.copied
+    stats["bytes"] += engine.bytes_copied
+    stats["errors"] += len(engine.errors)
+    stats["elapsed"] = engine.elapsed
+    stats["throughput_mb_s"] = engine.throughput_mb_s
+    stats["methods"] = dict(engine.methods)
+    return stats
+
 
-    # Normalize extensions: ensure they start with . and are lowercase
-    normalized_exts = [
-        (
-            ext.strip().lower()
-            if ext.strip().startswith(".")
-            else f".{ext.strip().lower()}"  # Ensure extension starts with .
+def perform_backup(
+    source_dir, backup_dest_dir, allowed_extensions, options=None, changes=None
+):
+    """Execute the backup copy process
+
+    changes optionally limits the run to a set of changed relative paths
+    (watch mode); everything else is carried over from the previous journal.
+    """
+    options = options or {}
+    if options.get("storage_format") == "chunks":
+        return perform_chunk_backup(
+            source_dir, backup_dest_dir, allowed_extensions, options, changes
         )
-        for ext in allowed_extensions
-    ]
+    if options.get("storage_format") == "archive":
+        return perform_archive_backup(
+            source_dir, backup_dest_dir, allowed_extensions, options, changes
+        )
+    return perform_tree_backup(
+        source_dir, backup_dest_dir, allowed_extensions, options, changes
+    )
+
+
+def iter_backup_files(source_dir, backup_root, matcher, changes=None):
+    """Yield (relative_path, full_path, stat_result) of the files a run looks at
+
+    Without changes this is the whole tree; with changes only those paths
+    (walking into changed folders), so the cost follows the size of the change.
+    backup_root may be a list of roots (one per destination) to stay out of.
+    """
+    excluded = exclude_paths(backup_root)
+    if changes is None:
+        yield from walk_files(source_dir, excluded, matcher.include_dir)
+        return
+
+    seen = set()
+    for rel_path in sorted(changes):
+        full_path = os.path.join(source_dir, rel_path)
+        normalized = os.path.normpath(full_path)
+        if any(
+            normalized == root or normalized.startswith(root + os.sep)
+            for root in excluded
+        ):
+            continue
+        try:
+            stat_result = os.stat(full_path)
+        except OSError:
+            continue  # deleted or moved away: dropped by carry_over_entries
+
+        if stat.S_ISDIR(stat_result.st_mode):
+            if not matcher.include_dir(rel_path):
+                continue
+            found = walk_files(
+                full_path,
+                excluded,
+                lambda sub_rel, base=rel_path: matcher.include_dir(
+                    os.path.join(base, sub_rel)
+                ),
+            )
+            found = (
+                (os.path.join(rel_path, sub_rel), sub_path, sub_stat)
+                for sub_rel, sub_path, sub_stat in found
+            )
+        elif stat.S_ISREG(stat_result.st_mode):
+            found = [(rel_path, full_path, stat_result)]
+        else:
+            continue
+
+        for item in found:
+            if item[0] not in seen:
+                seen.add(item[0])
+                yield item
+
+
+def excluded_roots(backup_root, options):
+    """Get the backup roots a run must not walk into, its own and other destinations'"""
+    return [backup_root, *options.get("backup_roots", [])]
 
-    return any(filename.lower().endswith(ext) for ext in normalized_exts)
 
+def carry_over_entries(previous_files, changes):
+    """Keep the journal entries of every file but the changed ones
+
+    changes are changed files, as expand_changes gives them; the entries of
+    the ones still there come back as the run walks them. The change ""
+    (the source folder itself) drops every entry.
+    """
+    if changes is None or "" in changes:
+        return {}
+
+    files = dict(previous_files)
+    for rel_path in changes:
+        files.pop(rel_path, None)
+    return files
+
+
+def expand_changes(source_dir, backup_roots, matcher, changes):
+    """Turn the changed paths of a watch batch into the files they stand for
+
+    A changed folder stands for the files under it now and those the latest
+    journal of each destination has under it, so the run, its journal,
+    Merkle tree and catalog look up each changed file instead of scanning
+    the whole tree for what lies under the changed folders.
+    """
+    found = {
+        rel_path
+        for rel_path, _, _ in iter_backup_files(
+            source_dir, backup_roots, matcher, changes
+        )
+    }
+    for backup_root in backup_roots:
+        snapshots = journal.list_snapshots(backup_root)
+        if snapshots:
+            found |= journal.changed_files(backup_root, snapshots[-1], changes)
+    return found
 
-def perform_backup(source_dir, backup_dest_dir, allowed_extensions):
-    """Execute the backup copy process"""
-    items = os.listdir(source_dir)
-    count = 0
-    skipped_count = 0
 
-    print(f"\n🚀 Starting backup of {len(items)} items...\n")
+def create_engine(options):
+    """Build the copy engine of a run with its worker count and I/O limits"""
+    return CopyEngine(
+        options.get("max_workers", DEFAULT_MAX_WORKERS),
+        create_throttle(options.get("max_mb_s", 0), options.get("max_iops", 0)),
+    )
+
+
+def latest_snapshot_dir(backup_root, exclude=None):
+    """Get the most recent timestamp folder of a backup_<name> root"""
+    if not os.path.isdir(backup_root):
+        return None
+
+    snapshots = sorted(
+        entry.name
+        for entry in os.scandir(backup_root)
+        if entry.is_dir() and not entry.name.startswith(".") and entry.name != exclude
+    )
+    return os.path.join(backup_root, snapshots[-1]) if snapshots else None
+
+
+def load_previous_snapshot(backup_root, snapshot, backup_mode):
+    """Get (name, journal files, folder) of the snapshot a tree run builds on
+
+    The folder is only set in snapshot mode when the latest snapshot has no
+    journal, so its files have to be compared on disk.
+    """
+    previous_snapshot, previous_files = None, {}
+    if backup_mode != "full":
+        previous_snapshot, previous_files = journal.load_journal(backup_root)
+    previous_dir = None
+    if backup_mode == "snapshot":
+        latest_dir = latest_snapshot_dir(backup_root, exclude=snapshot)
+        if latest_dir and os.path.basename(latest_dir) != previous_snapshot:
+            previous_dir = latest_dir
+            previous_snapshot = os.path.basename(latest_dir)
+    return previous_snapshot, previous_files, previous_dir
+
+
+def find_previous_copy(
+    backup_root, previous_files, previous_dir, rel_path, stat_result
+):
+    """Locate an identical copy of a file kept by an earlier snapshot
+
+    The journal answers without touching the destination. previous_dir is
+    only set when the latest snapshot has no journal, in which case the file
+    there is compared by size and mtime (like rsync's quick check).
+    """
+    if previous_dir is None:
+        entry = previous_files.get(rel_path)
+        if journal.is_unchanged(entry, stat_result):
+            return os.path.join(backup_root, entry["snapshot"], rel_path)
+        return None
+
+    candidate = os.path.join(previous_dir, rel_path)
+    try:
+        previous_stat = os.stat(candidate)
+    except OSError:
+        return None
+    if (
+        previous_stat.st_size == stat_result.st_size
+        and previous_stat.st_mtime_ns == stat_result.st_mtime_ns
+    ):
+        return candidate
+    return None
+
+
+class FileClassifier:
+    """Decides what a run does with each selected file
+
+    The runners act on the answer and plan_backup only counts it, so a plan
+    follows the same copy / link / skip / pack / tail / delta ladder as the
+    backup it describes. tail and delta are the run's TailCopier and
+    DeltaCopier (None where a run does without them).
+    """
+
+    def __init__(
+        self,
+        backup_root,
+        previous_files,
+        previous_dir=None,
+        completed=None,
+        storage_format="tree",
+        backup_mode="full",
+        pack_threshold=0,
+        tail=None,
+        delta=None,
+        split_min_size=0,
+    ):
+        self.backup_root = backup_root
+        self.previous_files = previous_files
+        self.previous_dir = previous_dir
+        self.completed = completed if completed is not None else {}
+        self.storage_format = storage_format
+        self.backup_mode = backup_mode
+        self.pack_threshold = pack_threshold
+        self.tail = tail
+        self.delta = delta
+        self.split_min_size = split_min_size
+
+    def classify(self, rel_path, stat_result, allow_link=True):
+        """Get (action, entry, path) for a file the filters selected
+
+        action is "resumed" (entry is the finished one), "unchanged" (entry
+        is reused), "pack", "link" (path is the copy to hardlink), "tail" or
+        "delta" (path is the previous version), "ranges" or "copy". entry is
+        otherwise the previous journal entry, if any. allow_link=False gives
+        the answer for a file whose hardlink failed.
+        """
+        done = self.completed.get(rel_path)
+        if journal.is_unchanged(done, stat_result):
+            return "resumed", done, None
+
+        entry = self.previous_files.get(rel_path)
+        if self.storage_format == "chunks":
+            if journal.is_unchanged(entry, stat_result) and "chunks" in entry:
+                return "unchanged", entry, None
+            if journal.is_appended(entry, stat_result) and entry.get("chunks"):
+                return "tail", entry, None
+            return "copy", entry, None
+        if self.storage_format != "tree":
+            return "copy", entry, None
+
+        # Packed files have no folder copy to link, so snapshot mode
+        # reuses them by reference like incremental mode
+        reusable = self.backup_mode == "incremental" or (
+            entry is not None and "pack" in entry
+        )
+        if reusable and journal.is_unchanged(entry, stat_result):
+            return "unchanged", entry, None
+        if self.pack_threshold > 0 and stat_result.st_size < self.pack_threshold:
+            return "pack", entry, None
+
+        if allow_link and self.backup_mode == "snapshot":
+            previous_copy = find_previous_copy(
+                self.backup_root,
+                self.previous_files,
+                self.previous_dir,
+                rel_path,
+                stat_result,
+            )
+            if previous_copy:
+                return "link", entry, previous_copy
+
+        previous_path = previous_version(
+            self.backup_root, self.previous_files, self.previous_dir, rel_path
+        )
+        if self.tail and self.tail.wants(stat_result, entry, previous_path):
+            return "tail", entry, previous_path
+        if self.delta and self.delta.wants(stat_result, previous_path):
+            return "delta", entry, previous_path
+        if self.split_min_size > 0 and stat_result.st_size >= self.split_min_size:
+            return "ranges", entry, previous_path
+        return "copy", entry, previous_path
+
+
+def perform_tree_backup(
+    source_dir, backup_dest_dir, allowed_extensions, options=None, changes=None
+):
+    """Copy the selected files into the timestamp folder, filtering at every depth
+
+    In "full" mode every file is copied. In "incremental" mode only files
+    that changed since the previous snapshot are copied; the new journal
+    keeps pointing at the snapshot that holds the unchanged ones.
+    In "snapshot" mode unchanged files are hardlinked from the previous
+    snapshot, so every timestamp folder is a complete tree that only costs
+    the changes.
+
+    With changes (watch mode) the run is always incremental, since linking
+    or copying the whole tree would defeat looking only at the changes.
+    """
+    options = options or {}
+    backup_mode = options.get("backup_mode", "full")
+    if changes is not None:
+        backup_mode = "incremental"
+    backup_root = os.path.dirname(os.path.normpath(backup_dest_dir))
+    snapshot = os.path.basename(os.path.normpath(backup_dest_dir))
+    previous_snapshot, previous_files, previous_dir = load_previous_snapshot(
+        backup_root, snapshot, backup_mode
+    )
+    files = carry_over_entries(previous_files, changes)
+    stats = new_stats()
+    matcher = load_matcher(
+        source_dir, allowed_extensions, options.get("ignore_file", DEFAULT_IGNORE_FILE)
+    )
+    engine = create_engine(options)
+    delta = DeltaCopier(
+        options.get("delta_min_size", 0) if backup_mode != "full" else 0,
+        engine.throttle,
+    )
+    tail = TailCopier(backup_mode != "full", engine.throttle)
+    pack_threshold = options.get("pack_threshold", 0)
+    packer = pack.PackWriter(backup_root, snapshot) if pack_threshold > 0 else None
+    split_min_size = options.get("split_min_size", 0)
+    record_checksums = options.get("record_checksums", False)
+    checkpoint = open_checkpoint(backup_root, snapshot, options)
+    if packer:
+        checkpoint.add_syncer(packer.sync)
+    classifier = FileClassifier(
+        backup_root,
+        previous_files,
+        previous_dir,
+        checkpoint.completed,
+        "tree",
+        backup_mode,
+        pack_threshold,
+        tail,
+        delta,
+        split_min_size,
+    )
+
+    if previous_snapshot:
+        print(f"\n🔁 Incremental backup against snapshot {previous_snapshot}\n")
+    else:
+        print(f"\n🚀 Starting full backup of {source_dir}...\n")
     if allowed_extensions and "*" not in allowed_extensions:
         print(f"   Filtering extensions: {allowed_extensions}")
+    created_dirs = set()
 
-    for item in items:
-        # Skip if somehow we are backing up into the source folder
-        if os.path.normpath(os.path.join(source_dir, item)) == os.path.normpath(
-            backup_dest_dir
-        ):
-            continue
+    def record(rel_path, stat_result, checksum=None):
+        # Only files that really reached the destination enter the journal
+        def on_success(size):
+            files[rel_path] = journal.make_entry(stat_result, snapshot)
+            if checksum:
+                files[rel_path]["sha256"] = checksum["sha256"]
+            checkpoint.record(
+                rel_path,
+                files[rel_path],
+                paths=[os.path.join(backup_dest_dir, rel_path)],
+            )
 
-        source_path = os.path.join(source_dir, item)
-        dest_path = os.path.join(backup_dest_dir, item)
+        return on_success
 
+    def record_packed(rel_path, holder, stat_result):
+        # Appending on the collecting thread keeps the pack strictly sequential
+        def on_success(size):
+            name, offset = packer.append(holder.pop("data"))
+            entry = journal.make_entry(stat_result, snapshot)
+            entry["pack"] = name
+            entry["offset"] = offset
+            entry["sha256"] = holder["sha256"]
+            files[rel_path] = entry
+            checkpoint.record(rel_path, entry)
+
+        return on_success
+
+    try:
+        with engine:
+            for rel_path, source_path, stat_result in iter_backup_files(
+                source_dir, excluded_roots(backup_root, options), matcher, changes
+            ):
+                if not matcher.include_file(rel_path, stat_result):
+                    stats["skipped"] += 1
+                    continue
+
+                action, entry, previous_path = classifier.classify(
+                    rel_path, stat_result
+                )
+                if action == "resumed":
+                    files[rel_path] = entry
+                    stats["resumed"] += 1
+                    continue
+                if action == "unchanged":
+                    files[rel_path] = entry
+                    stats["unchanged"] += 1
+                    continue
+
+                try:
+                    if action == "pack":
+                        holder = {}
+                        engine.submit_task(
+                            pack.load_file,
+                            source_path,
+                            holder,
+                            engine.throttle,
+                            on_success=record_packed(rel_path, holder, stat_result),
+                            label=rel_path,
+                        )
+                        continue
+
+                    dest_path = os.path.join(backup_dest_dir, rel_path)
+                    dest_parent = os.path.dirname(dest_path)
+                    if dest_parent not in created_dirs:
+                        os.makedirs(dest_parent, exist_ok=True)
+                        created_dirs.add(dest_parent)
+                    if checkpoint.resuming and os.path.lexists(dest_path):
+                        # Partial copy or stale hardlink: never write through it
+                        os.unlink(dest_path)
+
+                    if action == "link":
+                        if link_file(previous_path, dest_path):
+                            files[rel_path] = journal.make_entry(stat_result, snapshot)
+                            checkpoint.record(rel_path, files[rel_path])
+                            stats["linked"] += 1
+                            continue
+                        action, entry, previous_path = classifier.classify(
+                            rel_path, stat_result, allow_link=False
+                        )
+
+                    if action == "tail":
+                        engine.submit_task(
+                            tail.copy,
+                            source_path,
+                            dest_path,
+                            previous_path,
+                            entry["size"],
+                            stat_result.st_size,
+                            on_success=record(rel_path, stat_result),
+                            label=rel_path,
+                        )
+                        continue
+
+                    if action == "delta":
+                        engine.submit_task(
+                            delta.copy,
+                            source_path,
+                            dest_path,
+                            previous_path,
+                            on_success=record(rel_path, stat_result),
+                            label=rel_path,
+                        )
+                        continue
+
+                    if action == "ranges":
+                        engine.submit_ranges(
+                            source_path,
+                            dest_path,
+                            RANGE_SIZE,
+                            on_success=record(rel_path, stat_result),
+                            label=rel_path,
+                        )
+                        continue
+
+                    checksum = {} if record_checksums else None
+                    engine.submit(
+                        source_path,
+                        dest_path,
+                        on_success=record(rel_path, stat_result, checksum),
+                        label=rel_path,
+                        checksum=checksum,
+                    )
+                except Exception as e:
+                    stats["errors"] += 1
+                    logging.error(f"Failed to copy '{rel_path}': {e}")
+
+        if packer:
+            packer.close()
+        base = previous_snapshot if changes is not None else None
+        journal.save_journal(backup_root, snapshot, files, base, changes)
+        record_tree(backup_root, snapshot, files, base, changes)
+        checkpoint.complete()
+    finally:
+        if packer:
+            packer.close()
+        checkpoint.close()
+    if packer and packer.files:
+        stats["packed"] = packer.files
+        stats["packs"] = packer.packs
+    if tail.files:
+        stats["tail_files"] = tail.files
+        stats["tail_appended"] = tail.bytes_appended
+        stats["tail_reused"] = tail.bytes_reused
+    if delta.files:
+        stats["delta_files"] = delta.files
+        stats["delta_reused"] = delta.bytes_reused
+        stats["delta_written"] = delta.bytes_written
+    return merge_engine_stats(stats, engine)
+
+
+def open_fanout_target(backup_dest_dir, backup_mode, options, changes):
+    """Load the journal, previous snapshot, checkpoint and packer of one destination"""
+    backup_root = os.path.dirname(os.path.normpath(backup_dest_dir))
+    snapshot = os.path.basename(os.path.normpath(backup_dest_dir))
+    previous_snapshot, previous_files, previous_dir = load_previous_snapshot(
+        backup_root, snapshot, backup_mode
+    )
+    checkpoint = open_checkpoint(backup_root, snapshot, options)
+    pack_threshold = options.get("pack_threshold", 0)
+    packer = None
+    if pack_threshold > 0:
+        packer = pack.PackWriter(backup_root, snapshot)
+        checkpoint.add_syncer(packer.sync)
+    return {
+        "dir": backup_dest_dir,
+        "root": backup_root,
+        "snapshot": snapshot,
+        "base": previous_snapshot if changes is not None else None,
+        "files": carry_over_entries(previous_files, changes),
+        # Delta, tail and ranged copies work against a single destination
+        "classifier": FileClassifier(
+            backup_root,
+            previous_files,
+            previous_dir,
+            checkpoint.completed,
+            "tree",
+            backup_mode,
+            pack_threshold,
+        ),
+        "checkpoint": checkpoint,
+        "packer": packer,
+        "created_dirs": set(),
+        "queued": 0,
+        "stats": new_stats(),
+    }
+
+
+def fanout_unused_features(options, backup_mode):
+    """Name the enabled features a multi-destination run does without"""
+    unused = []
+    if options.get("delta_min_size", 0) > 0 and backup_mode != "full":
+        unused.append("delta copies (delta_min_size)")
+    if options.get("split_min_size", 0) > 0:
+        unused.append("ranged copies of large files (split_min_size)")
+    return unused
+
+
+def perform_fanout_backup(
+    source_dir, snapshot_dirs, allowed_extensions, options=None, changes=None
+):
+    """Copy the selected files into several destinations, reading each file once
+
+    Every destination keeps its own journal, checkpoint and previous
+    snapshot, so unchanged files, hardlinks and resumes are decided per
+    destination. The files some destination still needs are read once and
+    written to all of those destinations at the same time; a destination
+    that fails only loses its own copy. Returns (snapshot_dir, stats) for
+    every destination that could be opened.
+
+    Small files go into each destination's packs from a single read. Delta,
+    tail and range copies work against a single destination and are not
+    used here; the run says so when they are enabled.
+    """
+    options = options or {}
+    backup_mode = options.get("backup_mode", "full")
+    if changes is not None:
+        backup_mode = "incremental"
+    matcher = load_matcher(
+        source_dir, allowed_extensions, options.get("ignore_file", DEFAULT_IGNORE_FILE)
+    )
+    targets = []
+    for backup_dest_dir in snapshot_dirs:
         try:
-            if os.path.isfile(source_path):
-                if should_include_file(item, allowed_extensions):
-                    shutil.copy2(source_path, dest_path)
-                    count += 1
-                    print(f"  ✓ File: {item}")
+            targets.append(
+                open_fanout_target(backup_dest_dir, backup_mode, options, changes)
+            )
+        except OSError as e:
+            logging.error(f"❌ Skipping destination {backup_dest_dir}: {e}")
+    if not targets:
+        return []
+    engine = create_engine(options)
+    fanout = FanOutCopier(
+        [target["root"] for target in targets], engine.max_workers, engine.throttle
+    )
+
+    print(f"\n🚀 Backing up {source_dir} to {len(targets)} destinations...\n")
+    if allowed_extensions and "*" not in allowed_extensions:
+        print(f"   Filtering extensions: {allowed_extensions}")
+    unused = fanout_unused_features(options, backup_mode)
+    if unused:
+        logging.warning(f"⚠️  Not used with several destinations: {', '.join(unused)}")
+    if backup_mode != "full":
+        logging.info(
+            "ℹ️  Grown append-only files are copied whole to every destination"
+        )
+    pack_threshold = options.get("pack_threshold", 0)
+
+    def needs_copy(target, rel_path, stat_result):
+        """Settle a file for one destination; return its dest path if it needs a copy
+
+        A small file goes into the destination's pack instead of that path.
+        """
+        stats = target["stats"]
+        files = target["files"]
+        action, entry, previous_copy = target["classifier"].classify(
+            rel_path, stat_result
+        )
+        if action in ("resumed", "unchanged"):
+            files[rel_path] = entry
+            stats[action] += 1
+            return None
+
+        dest_path = os.path.join(target["dir"], rel_path)
+        if action == "pack":
+            return dest_path
+        dest_parent = os.path.dirname(dest_path)
+        if dest_parent not in target["created_dirs"]:
+            os.makedirs(dest_parent, exist_ok=True)
+            target["created_dirs"].add(dest_parent)
+        if target["checkpoint"].resuming and os.path.lexists(dest_path):
+            os.unlink(dest_path)
+
+        if action == "link" and link_file(previous_copy, dest_path):
+            files[rel_path] = journal.make_entry(stat_result, target["snapshot"])
+            target["checkpoint"].record(rel_path, files[rel_path])
+            stats["linked"] += 1
+            return None
+        return dest_path
+
+    def record(rel_path, stat_result, copies, failures, checksum):
+        def on_success(size):
+            for index, dest_path in copies:
+                target = targets[index]
+                if index in failures:
+                    logging.error(
+                        f"Failed to copy '{rel_path}' to {target['root']}: "
+                        f"{failures[index]}"
+                    )
+                    continue
+                entry = journal.make_entry(stat_result, target["snapshot"])
+                if checksum:
+                    entry["sha256"] = checksum["sha256"]
+                target["files"][rel_path] = entry
+                target["checkpoint"].record(rel_path, entry, paths=[dest_path])
+                target["stats"]["copied"] += 1
+                target["stats"]["bytes"] += size
+
+        return on_success
+
+    def record_packed(rel_path, stat_result, copies, holder):
+        # One read, appended to every destination's pack on the collecting thread
+        def on_success(size):
+            data = holder.pop("data")
+            for index, _ in copies:
+                target = targets[index]
+                try:
+                    name, offset = target["packer"].append(data)
+                except OSError as e:
+                    logging.error(
+                        f"Failed to pack '{rel_path}' in {target['root']}: {e}"
+                    )
+                    continue
+                entry = journal.make_entry(stat_result, target["snapshot"])
+                entry["pack"] = name
+                entry["offset"] = offset
+                entry["sha256"] = holder["sha256"]
+                target["files"][rel_path] = entry
+                target["checkpoint"].record(rel_path, entry)
+                target["stats"]["copied"] += 1
+                target["stats"]["bytes"] += size
+
+        return on_success
+
+    try:
+        with engine:
+            for rel_path, source_path, stat_result in iter_backup_files(
+                source_dir,
+                excluded_roots(targets[0]["root"], options),
+                matcher,
+                changes,
+            ):
+                if not matcher.include_file(rel_path, stat_result):
+                    for target in targets:
+                        target["stats"]["skipped"] += 1
+                    continue
+
+                packing = stat_result.st_size < pack_threshold
+                copies = []
+                for index, target in enumerate(targets):
+                    try:
+                        dest_path = needs_copy(target, rel_path, stat_result)
+                    except Exception as e:
+                        target["stats"]["errors"] += 1
+                        logging.error(
+                            f"Failed to copy '{rel_path}' to {target['root']}: {e}"
+                        )
+                        continue
+                    if dest_path is not None:
+                        copies.append((index, dest_path))
+                        target["queued"] += 1
+
+                if copies and packing:
+                    holder = {}
+                    engine.submit_task(
+                        pack.load_file,
+                        source_path,
+                        holder,
+                        engine.throttle,
+                        on_success=record_packed(rel_path, stat_result, copies, holder),
+                        label=rel_path,
+                    )
+                elif copies:
+                    failures = {}
+                    checksum = {} if options.get("record_checksums", False) else None
+                    engine.submit_task(
+                        fanout.copy,
+                        source_path,
+                        copies,
+                        failures,
+                        checksum,
+                        on_success=record(
+                            rel_path, stat_result, copies, failures, checksum
+                        ),
+                        label=rel_path,
+                    )
+        fanout.close()
+
+        for target in targets:
+            # A failing destination must not keep the others from finishing
+            try:
+                if target["packer"]:
+                    target["packer"].close()
+                journal.save_journal(
+                    target["root"],
+                    target["snapshot"],
+                    target["files"],
+                    target["base"],
+                    changes,
+                )
+                record_tree(
+                    target["root"],
+                    target["snapshot"],
+                    target["files"],
+                    target["base"],
+                    changes,
+                )
+                target["checkpoint"].complete()
+            except OSError as e:
+                target["stats"]["errors"] += 1
+                logging.error(f"Could not finish the backup in {target['root']}: {e}")
+    finally:
+        fanout.close()
+        for target in targets:
+            if target["packer"]:
+                target["packer"].close()
+            target["checkpoint"].close()
+
+    results = []
+    for index, target in enumerate(targets):
+        stats = target["stats"]
+        written = fanout.stats[index]
+        stats["errors"] += target["queued"] - stats["copied"]
+        stats["elapsed"] = engine.elapsed
+        if engine.elapsed > 0:
+            stats["throughput_mb_s"] = stats["bytes"] / (1024 * 1024) / engine.elapsed
+        packer = target["packer"]
+        if packer and packer.files:
+            stats["packed"] = packer.files
+            stats["packs"] = packer.packs
+        fanned = stats["copied"] - stats.get("packed", 0)
+        stats["methods"] = {"fanout": fanned} if fanned else {}
+        stats["destination"] = target["root"]
+        stats["write_mb_s"] = written.throughput_mb_s
+        results.append((target["dir"], stats))
+    return results
+
+
+def backup_destinations(
+    source_dir, snapshot_dirs, allowed_extensions, options, changes=None
+):
+    """Back up into one snapshot folder per destination
+
+    Folder trees share a single read of the source; the chunk store and
+    archive formats are built one destination after the other. A
+    destination that fails outright does not stop the others. Returns a
+    list of (snapshot_dir, stats), leaving out failed destinations.
+    """
+    if len(snapshot_dirs) > 1 and options.get("storage_format", "tree") == "tree":
+        return perform_fanout_backup(
+            source_dir, snapshot_dirs, allowed_extensions, options, changes
+        )
+
+    results = []
+    for snapshot_dir in snapshot_dirs:
+        try:
+            stats = perform_backup(
+                source_dir, snapshot_dir, allowed_extensions, options, changes
+            )
+        except OSError as e:
+            logging.error(f"❌ Backup to {snapshot_dir} failed: {e}")
+            continue
+        if len(snapshot_dirs) > 1:
+            stats["destination"] = os.path.dirname(os.path.normpath(snapshot_dir))
+        results.append((snapshot_dir, stats))
+    return results
+
+
+def perform_remote_backup(
+    source_dir, backend, snapshot, allowed_extensions, options, changes=None
+):
+    """Upload the selected files straight to a destination backend
+
+    The layout mirrors a local folder tree: <snapshot>/<path> objects for
+    plain files, .packs/ for small files and the journal in .journal/,
+    uploaded last. Workers read and upload at once, so nothing is staged
+    locally. Large files go up as multipart uploads, and small files are
+    packed so they do not cost one request each. Snapshot mode works like
+    incremental mode, since objects cannot be hardlinked.
+    """
+    backup_mode = options.get("backup_mode", "full")
+    if changes is not None:
+        backup_mode = "incremental"
+    previous_snapshot, previous_files = None, {}
+    if backup_mode != "full":
+        previous_snapshot, previous_files = journal.load_remote_journal(backend)
+    files = carry_over_entries(previous_files, changes)
+    stats = new_stats()
+    matcher = load_matcher(
+        source_dir, allowed_extensions, options.get("ignore_file", DEFAULT_IGNORE_FILE)
+    )
+    engine = create_engine(options)
+    pack_threshold = options.get("remote_pack_threshold", REMOTE_PACK_THRESHOLD)
+    packer = PackBuffer(snapshot)
+    full_packs = []
+    multipart = (
+        backend.supports_multipart
+        and MultipartUpload.supported
+        and engine.max_workers > 1
+    )
+    committed = 0
+
+    if previous_snapshot:
+        print(f"\n🔁 Incremental upload against snapshot {previous_snapshot}\n")
+    else:
+        print(f"\n🚀 Starting full upload of {source_dir} to {backend}...\n")
+
+    def record(rel_path, stat_result):
+        def on_success(size):
+            nonlocal committed
+            files[rel_path] = journal.make_entry(stat_result, snapshot)
+            committed += 1
+
+        return on_success
+
+    def record_packed(rel_path, holder, stat_result):
+        # Packing on the collecting thread; full packs are queued by the walk
+        def on_success(size):
+            entry = journal.make_entry(stat_result, snapshot)
+            full = packer.add(holder.pop("data"), rel_path, entry)
+            if full:
+                full_packs.append(full)
+
+        return on_success
+
+    def load_member(source_path, holder):
+        # Its bytes are counted once, when the pack holding it is uploaded
+        pack.load_file(source_path, holder, engine.throttle)
+        return 0
+
+    def record_pack(members):
+        # Packed files only count once their pack is stored
+        def on_success(size):
+            nonlocal committed
+            for rel_path, entry in members:
+                files[rel_path] = entry
+            committed += len(members)
+
+        return on_success
+
+    def queue_packs():
+        while full_packs:
+            name, data, members = full_packs.pop(0)
+            engine.submit_task(
+                backend.put_bytes,
+                join_key(pack.PACKS_DIR, name),
+                data,
+                on_success=record_pack(members),
+                label=f"{pack.PACKS_DIR}/{name}",
+            )
+
+    with engine:
+        for rel_path, source_path, stat_result in iter_backup_files(
+            source_dir, [], matcher, changes
+        ):
+            if not matcher.include_file(rel_path, stat_result):
+                stats["skipped"] += 1
+                continue
+
+            entry = previous_files.get(rel_path)
+            if journal.is_unchanged(entry, stat_result):
+                files[rel_path] = entry
+                stats["unchanged"] += 1
+                continue
+
+            try:
+                if stat_result.st_size < pack_threshold:
+                    holder = {}
+                    engine.submit_task(
+                        load_member,
+                        source_path,
+                        holder,
+                        on_success=record_packed(rel_path, holder, stat_result),
+                        label=rel_path,
+                    )
+                elif multipart and stat_result.st_size >= MULTIPART_THRESHOLD:
+                    engine.submit_split(
+                        MultipartUpload(
+                            backend,
+                            join_key(snapshot, rel_path),
+                            source_path,
+                            engine.throttle,
+                        ),
+                        on_success=record(rel_path, stat_result),
+                        label=rel_path,
+                    )
                 else:
-                    skipped_count += 1
-            elif os.path.isdir(source_path):
-                # Recursive backup for directories?
-                # For now, we copy the tree, but ideally we should filter inside too.
-                # simple copytree copies everything.
-                # To support filtering inside dirs, we'd need a custom copytree.
-                # For simplicity in this version, let's copy directories as is
-                # OR skip them if user only wants specific files.
-                # Let's keep logic: if it's a dir, we copy it fully for safety
-                # (user might lose nested files otherwise).
-                shutil.copytree(source_path, dest_path)
-                count += 1
-                print(f"  ✓ Folder: {item}")
-        except Exception as e:
-            logging.error(f"Failed to copy '{item}': {e}")
-
-    return count, skipped_count
-
-
-def get_backup_config():
-    """Load and parse backup configuration"""
+                    engine.submit_task(
+                        backend.put_file,
+                        join_key(snapshot, rel_path),
+                        source_path,
+                        engine.throttle,
+                        on_success=record(rel_path, stat_result),
+                        label=rel_path,
+                    )
+            except Exception as e:
+                stats["errors"] += 1
+                logging.error(f"Failed to copy '{rel_path}': {e}")
+            queue_packs()
+
+        # The last pack fills up only once every small file has been read
+        engine.drain()
+        last = packer.flush()
+        if last:
+            full_packs.append(last)
+        queue_packs()
+
+    journal.save_remote_journal(backend, snapshot, files)
+    merge_engine_stats(stats, engine)
+    # Pack uploads are not files of their own
+    stats["copied"] = committed
+    if packer.files:
+        stats["packed"] = packer.files
+        stats["packs"] = packer.packs
+    return stats
+
+
+def backup_remote(source_dir, backup_root, allowed_extensions, options, changes=None):
+    """Back up to a backend destination; returns stats, or None when it failed
+
+    Unlike local folders, these runs keep no checkpoint to resume from, and
+    retention and the catalog do not cover them.
+    """
+    try:
+        with open_backend(backup_root, options) as backend:
+            snapshot = new_remote_snapshot_name(backend)
+            logging.info(f"📂 Destination: {backup_root}/{snapshot}")
+            stats = perform_remote_backup(
+                source_dir, backend, snapshot, allowed_extensions, options, changes
+            )
+    except Exception as e:
+        logging.error(f"❌ Backup to {backup_root} failed: {e}")
+        return None
+    stats["destination"] = backup_root
+    return stats
+
+
+def previous_version(backup_root, previous_files, previous_dir, rel_path):
+    """Get the path of the copy of a file kept by the previous snapshot, if any"""
+    entry = previous_files.get(rel_path)
+    if entry and journal.in_snapshot_folder(entry):
+        return os.path.join(backup_root, entry["snapshot"], rel_path)
+    if previous_dir:
+        return os.path.join(previous_dir, rel_path)
+    return None
+
+
+def open_checkpoint(backup_root, snapshot, options):
+    """Open the resume log of a run, tagged with the settings it runs with"""
+    return Checkpoint(
+        backup_root,
+        snapshot,
+        {
+            "backup_mode": options.get("backup_mode", "full"),
+            "storage_format": options.get("storage_format", "tree"),
+        },
+    )
+
+
+def link_file(existing_path, dest_path):
+    """Hardlink an unchanged file; False means it must be copied instead"""
+    try:
+        os.link(existing_path, dest_path)
+        return True
+    except OSError as e:
+        # Cross-device, FAT/exFAT or link count limit: fall back to a copy
+        logging.debug(f"Hardlink failed for '{dest_path}': {e}")
+        return False
+
+
+def perform_chunk_backup(
+    source_dir, backup_dest_dir, allowed_extensions, options=None, changes=None
+):
+    """Back up into the deduplicated chunk store instead of a copied tree
+
+    The snapshot is only its journal, listing the chunks of each file.
+    Files unchanged since the previous snapshot reuse their chunk list
+    without being read again.
+    """
+    options = options or {}
+    backup_root = os.path.dirname(os.path.normpath(backup_dest_dir))
+    snapshot = os.path.basename(os.path.normpath(backup_dest_dir))
+    previous_snapshot, previous_files = journal.load_journal(backup_root)
+    base = previous_snapshot if changes is not None else None
+    engine = create_engine(options)
+    store = ChunkStore(backup_root, engine.throttle)
+    files = carry_over_entries(previous_files, changes)
+    stats = new_stats()
+    matcher = load_matcher(
+        source_dir, allowed_extensions, options.get("ignore_file", DEFAULT_IGNORE_FILE)
+    )
+    checkpoint = open_checkpoint(backup_root, snapshot, options)
+    classifier = FileClassifier(
+        backup_root,
+        previous_files,
+        completed=checkpoint.completed,
+        storage_format="chunks",
+    )
+
+    print("\n🧩 Starting chunk store backup...\n")
+
+    def record(rel_path, entry):
+        def on_success(size):
+            files[rel_path] = entry
+            checkpoint.record(
+                rel_path, entry, paths=[store.chunk_path(d) for d in entry["chunks"]]
+            )
+
+        return on_success
+
+    try:
+        with engine:
+            for rel_path, source_path, stat_result in iter_backup_files(
+                source_dir, excluded_roots(backup_root, options), matcher, changes
+            ):
+                if not matcher.include_file(rel_path, stat_result):
+                    stats["skipped"] += 1
+                    continue
+
+                action, entry, _ = classifier.classify(rel_path, stat_result)
+                if action in ("resumed", "unchanged"):
+                    files[rel_path] = entry
+                    stats[action] += 1
+                    continue
+
+                try:
+                    new_entry = journal.make_entry(stat_result, snapshot)
+                    if action == "tail":
+                        engine.submit_task(
+                            store.append_file,
+                            source_path,
+                            new_entry,
+                            entry,
+                            on_success=record(rel_path, new_entry),
+                            label=rel_path,
+                        )
+                        continue
+
+                    engine.submit_task(
+                        store.store_file,
+                        source_path,
+                        new_entry,
+                        on_success=record(rel_path, new_entry),
+                        label=rel_path,
+                    )
+                except Exception as e:
+                    stats["errors"] += 1
+                    logging.error(f"Failed to store '{rel_path}': {e}")
+
+        journal.save_journal(backup_root, snapshot, files, base, changes)
+        record_tree(backup_root, snapshot, files, base, changes)
+        checkpoint.complete()
+    finally:
+        checkpoint.close()
+
+    if store.files_appended:
+        stats["tail_files"] = store.files_appended
+    stats["chunks_new"] = store.chunks_new
+    stats["chunks_seen"] = store.chunks_seen
+    stats["bytes_stored"] = store.bytes_new
+    return merge_engine_stats(stats, engine)
+
+
+def perform_archive_backup(
+    source_dir, backup_dest_dir, allowed_extensions, options=None, changes=None
+):
+    """Stream the selected files into a single <timestamp>.zip archive
+
+    Compression runs on the copy engine's workers; the archive is written
+    as results come back, so no copied tree is materialised.
+    """
+    options = options or {}
+    backup_root = os.path.dirname(os.path.normpath(backup_dest_dir))
+    snapshot = os.path.basename(os.path.normpath(backup_dest_dir))
+    archive_name = snapshot + archive.ARCHIVE_SUFFIX
+    archive_path = os.path.join(backup_root, archive_name)
+    checkpoint = open_checkpoint(backup_root, snapshot, options)
+    if checkpoint.resuming and not os.path.exists(archive_path + ".partial"):
+        # The finished members are gone with the partial archive: redo them
+        checkpoint.completed.clear()
+        checkpoint.members.clear()
+    writer = archive.ZipStreamWriter(archive_path, checkpoint.members.values())
+    kept = {member["name"] for member in writer.entries}
+    for rel_path, member in checkpoint.members.items():
+        if member["name"] not in kept:
+            # Recorded but not in the partial archive after all: redo it
+            checkpoint.completed.pop(rel_path, None)
+    checkpoint.add_syncer(writer.sync)
+    files = {}
+    base = None
+    if changes is not None:
+        # Files outside the changes stay in the archives that already hold them
+        base, previous_files = journal.load_journal(backup_root)
+        files = carry_over_entries(previous_files, changes)
+    stats = new_stats()
+    matcher = load_matcher(
+        source_dir, allowed_extensions, options.get("ignore_file", DEFAULT_IGNORE_FILE)
+    )
+    engine = create_engine(options)
+    classifier = FileClassifier(
+        backup_root, {}, completed=checkpoint.completed, storage_format="archive"
+    )
+
+    print(f"\n🗜️  Streaming backup into {archive_name}...\n")
+
+    def record(rel_path, member, stat_result):
+        def on_success(size):
+            writer.write_member(member)
+            stats["bytes_stored"] += member["compressed_size"]
+            entry = journal.make_entry(stat_result, snapshot)
+            entry["archive"] = archive_name
+            files[rel_path] = entry
+            checkpoint.record(rel_path, entry, member)
+
+        return on_success
+
+    stats["bytes_stored"] = 0
+    try:
+        with writer:
+            with engine:
+                for rel_path, source_path, stat_result in iter_backup_files(
+                    source_dir, excluded_roots(backup_root, options), matcher, changes
+                ):
+                    if not matcher.include_file(rel_path, stat_result):
+                        stats["skipped"] += 1
+                        continue
+
+                    action, entry, _ = classifier.classify(rel_path, stat_result)
+                    if action == "resumed":
+                        files[rel_path] = entry
+                        stats["resumed"] += 1
+                        continue
+
+                    try:
+                        member = {"name": archive.member_name(rel_path)}
+                        engine.submit_task(
+                            archive.compress_member,
+                            source_path,
+                            member,
+                            engine.throttle,
+                            on_success=record(rel_path, member, stat_result),
+                            label=rel_path,
+                        )
+                    except Exception as e:
+                        stats["errors"] += 1
+                        logging.error(f"Failed to archive '{rel_path}': {e}")
+
+        journal.save_journal(backup_root, snapshot, files, base, changes)
+        record_tree(backup_root, snapshot, files, base, changes)
+        checkpoint.complete()
+    finally:
+        checkpoint.close()
+    return merge_engine_stats(stats, engine)
+
+
+def plan_backup(source_dir, backup_root, allowed_extensions, options):
+    """Work out what a backup run would do, without writing anything
+
+    Walks the source with the same filters and unchanged checks as
+    perform_backup (including a resumable interrupted run) and counts the
+    files and bytes the run would copy or skip.
+    """
+    backup_mode = options.get("backup_mode", "full")
+    storage_format = options.get("storage_format", "tree")
+    plan = {
+        "files": 0,
+        "copy": 0,
+        "bytes_copy": 0,
+        "unchanged": 0,
+        "bytes_unchanged": 0,
+        "resumed": 0,
+        "bytes_resumed": 0,
+        "skipped": 0,
+        "bytes_skipped": 0,
+        "packed": 0,
+        "tail_files": 0,
+        "delta_files": 0,
+        "delta_bytes": 0,
+        "elapsed": 0.0,
+    }
+    started = time.perf_counter()
+
+    previous_files, previous_dir = {}, None
+    if storage_format == "tree":
+        _, previous_files, previous_dir = load_previous_snapshot(
+            backup_root, None, backup_mode
+        )
+    elif storage_format == "chunks":
+        _, previous_files = journal.load_journal(backup_root)
+
+    completed = {}
+    unfinished, header = find_unfinished(backup_root)
+    if (
+        unfinished
+        and header.get("backup_mode") == backup_mode
+        and header.get("storage_format") == storage_format
+    ):
+        completed = read_completed(backup_root, unfinished)
+
+    matcher = load_matcher(
+        source_dir, allowed_extensions, options.get("ignore_file", DEFAULT_IGNORE_FILE)
+    )
+    tail = delta = None
+    local_roots = [r for r in options.get("backup_roots", []) if not is_remote(r)]
+    if storage_format != "tree" or len(local_roots) <= 1:
+        # Several folder destinations run as a fan-out, without tail and delta
+        tail = TailCopier(backup_mode != "full")
+        delta = DeltaCopier(
+            options.get("delta_min_size", 0) if backup_mode != "full" else 0
+        )
+    classifier = FileClassifier(
+        backup_root,
+        previous_files,
+        previous_dir,
+        completed,
+        storage_format,
+        backup_mode,
+        options.get("pack_threshold", 0),
+        tail,
+        delta,
+    )
+
+    for rel_path, _, stat_result in iter_backup_files(
+        source_dir, excluded_roots(backup_root, options), matcher
+    ):
+        size = stat_result.st_size
+        if not matcher.include_file(rel_path, stat_result):
+            plan["skipped"] += 1
+            plan["bytes_skipped"] += size
+            continue
+
+        plan["files"] += 1
+        action, entry, _ = classifier.classify(rel_path, stat_result)
+        if action == "resumed":
+            plan["resumed"] += 1
+            plan["bytes_resumed"] += size
+            continue
+        if action in ("unchanged", "link"):
+            plan["unchanged"] += 1
+            plan["bytes_unchanged"] += size
+            continue
+
+        plan["copy"] += 1
+        if action == "tail":
+            # Only the new tail is read (if the old part checks out)
+            plan["tail_files"] += 1
+            plan["bytes_copy"] += size - entry["size"]
+            continue
+
+        plan["bytes_copy"] += size
+        if action == "pack":
+            plan["packed"] += 1
+        elif action == "delta":
+            plan["delta_files"] += 1
+            plan["delta_bytes"] += size
+
+    plan["elapsed"] = time.perf_counter() - started
+    return plan
+
+
+def estimate_duration(backup_root, options, plan, history=5):
+    """Estimate how long a planned run takes from the throughput of past runs
+
+    Returns (seconds, runs_used); seconds is None without usable history.
+    Both the byte rate and the file rate of past runs are applied, and the
+    slower of the two wins, so many small files are not estimated as one
+    big one. A bandwidth limit caps the byte rate.
+    """
+    runs = [
+        run
+        for run in journal.load_runs(backup_root)
+        if run.get("elapsed", 0) > 0 and run.get("files", 0) > 0
+    ]
+    same_format = [
+        run
+        for run in runs
+        if run.get("storage_format") == options.get("storage_format", "tree")
+    ]
+    runs = (same_format or runs)[-history:]
+    if not runs:
+        return None, 0
+
+    elapsed = sum(run["elapsed"] for run in runs)
+    byte_rate = sum(run["bytes"] for run in runs) / elapsed
+    file_rate = sum(run["files"] for run in runs) / elapsed
+    if options.get("max_mb_s", 0) > 0:
+        byte_rate = min(byte_rate, options["max_mb_s"] * 1024 * 1024)
+
+    seconds = plan["copy"] / file_rate
+    if byte_rate > 0:
+        seconds = max(seconds, plan["bytes_copy"] / byte_rate)
+    return seconds, len(runs)
+
+
+def format_duration(seconds):
+    """Format a duration as 1h 02m, 3m 05s or 42s"""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def print_plan(plan, eta, runs_used):
+    """Print a dry-run plan (stdout only, so the launcher can show it)"""
+    mb = 1024 * 1024
+    print("=" * 50)
+    print("🧪 Dry run: nothing was copied")
+    print(f"Files selected:   {plan['files']}")
+    print(f"To copy:          {plan['copy']} files, {plan['bytes_copy'] / mb:.1f} MB")
+    print(
+        f"Unchanged:        {plan['unchanged']} files, "
+        f"{plan['bytes_unchanged'] / mb:.1f} MB"
+    )
+    if plan["resumed"]:
+        print(
+            f"Already done:     {plan['resumed']} files, "
+            f"{plan['bytes_resumed'] / mb:.1f} MB (interrupted run)"
+        )
+    print(
+        f"Filtered out:     {plan['skipped']} files, "
+        f"{plan['bytes_skipped'] / mb:.1f} MB"
+    )
+    if plan["packed"]:
+        print(f"Into packs:       {plan['packed']} small files")
+    if plan["tail_files"]:
+        print(f"Grown logs:       {plan['tail_files']} files (only the new tail)")
+    if plan["delta_files"]:
+        print(
+            f"Delta transfer:   {plan['delta_files']} large files, "
+            f"{plan['delta_bytes'] / mb:.1f} MB (only changed blocks are written)"
+        )
+    if eta is None:
+        print("Estimated time:   unknown (no past runs to measure)")
+    else:
+        print(
+            f"Estimated time:   {format_duration(eta)} "
+            f"(from the last {runs_used} runs)"
+        )
+    print(f"Planned in:       {plan['elapsed']:.1f}s")
+    print("=" * 50)
+
+
+def parse_int(value, default):
+    """Parse a numeric config value (the launcher saves text fields as str)"""
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_float(value, default):
+    """Parse a decimal config value (a comma also works as decimal point)"""
+    try:
+        return float(str(value).strip().replace(",", "."))
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_size_option(value, default):
+    """Parse a size config value such as "64MB" (plain numbers are bytes)"""
+    try:
+        return parse_size(value)
+    except ValueError:
+        return default
+
+
+def parse_destinations(value):
+    """Split the dest_dir setting into folders (a list, or text split by ";")"""
+    if isinstance(value, list):
+        items = value
+    else:
+        items = str(value or "").replace("\n", ";").split(";")
+    destinations = []
+    for item in items:
+        item = str(item).strip()
+        if item and item not in destinations:
+            destinations.append(item)
+    return destinations
+
+
+def get_backup_config(remote_ok=False):
+    """Load and parse backup configuration
+
+    Commands that only work on local folders leave remote_ok off, so a
+    backend URL as the first destination is reported instead of used.
+    """
     config = load_config()
     if not config:
         logging.error("❌ Cannot proceed without configuration.")
-        return None, None, None
+        return None, None, None, None
 
     source_dir = config.get("source_dir", "")
-    dest_dir_base = config.get("dest_dir", "")
+    # Several destinations get the same backup; the first one is the one
+    # restore, verify, prune and the other commands work with
+    destinations = parse_destinations(config.get("dest_dir", ""))
+    dest_dir_base = destinations[0] if destinations else ""
     include_extensions_config = config.get(
         "include_extensions", ["*"]
     )  # Default is list ["*"]
@@ -142,15 +1573,631 @@ def get_backup_config():
         logging.error(
             "   Please configure Source and Destination folders in the launcher."
         )
-        return None, None, None
+        return None, None, None, None
+    if is_remote(dest_dir_base) and not remote_ok:
+        logging.error(
+            f"❌ This command needs a local folder as the first destination, "
+            f"not {dest_dir_base}"
+        )
+        return None, None, None, None
+
+    options = {
+        "backup_mode": str(config.get("backup_mode", "full")).strip().lower(),
+        "max_workers": parse_int(config.get("max_workers"), DEFAULT_MAX_WORKERS),
+        "storage_format": str(config.get("storage_format", "tree")).strip().lower(),
+        "ignore_file": str(config.get("ignore_file", DEFAULT_IGNORE_FILE)).strip(),
+        "retention": {
+            name: parse_int(config.get(f"keep_{name}"), 0)
+            for name, _ in RETENTION_BUCKETS
+        },
+        "delta_min_size": parse_size_option(config.get("delta_min_size"), 0),
+        "pack_threshold": parse_size_option(config.get("pack_threshold"), 0),
+        "remote_pack_threshold": parse_size_option(
+            config.get("remote_pack_threshold"), REMOTE_PACK_THRESHOLD
+        ),
+        "split_min_size": parse_size_option(config.get("split_min_size"), 0),
+        "record_checksums": str(config.get("record_checksums", "no")).strip().lower()
+        == "yes",
+        "s3_endpoint": str(config.get("s3_endpoint", "") or "").strip(),
+        "max_mb_s": parse_float(config.get("max_mb_s"), 0.0),
+        "max_iops": parse_int(config.get("max_iops"), 0),
+        "idle_priority": str(config.get("idle_priority", "no")).strip().lower()
+        == "yes",
+        "backup_roots": [get_backup_root(source_dir, d) for d in destinations],
+    }
+
+    return source_dir, dest_dir_base, allowed_extensions, options
+
+
+def get_backup_root(source_dir, dest_dir_base):
+    """Get the backup_<source_name> folder holding all snapshots of a source"""
+    source_name = os.path.basename(os.path.normpath(source_dir))
+    if is_remote(dest_dir_base):
+        return f"{dest_dir_base.rstrip('/')}/backup_{source_name}"
+    return os.path.join(dest_dir_base, f"backup_{source_name}")
+
+
+def new_snapshot_name(backup_root):
+    """Get a timestamp name no folder, archive or journal of backup_root uses yet"""
+    base = datetime.datetime.now().strftime(journal.SNAPSHOT_TIME_FORMAT)
+    name, counter = base, 1
+    while (
+        os.path.exists(os.path.join(backup_root, name))
+        or os.path.exists(os.path.join(backup_root, f"{name}.zip"))
+        or os.path.exists(
+            os.path.join(journal.get_journal_dir(backup_root), f"{name}.json")
+        )
+    ):
+        counter += 1
+        name = f"{base}_{counter}"
+    return name
+
+
+def new_remote_snapshot_name(backend):
+    """Get a timestamp name no journal of a backend destination uses yet"""
+    base = datetime.datetime.now().strftime(journal.SNAPSHOT_TIME_FORMAT)
+    taken = set(journal.list_remote_snapshots(backend))
+    name, counter = base, 1
+    while name in taken:
+        counter += 1
+        name = f"{base}_{counter}"
+    return name
+
+
+def parse_args(argv=None):
+    """Parse the command line (no command runs a backup, as the launcher does)"""
+    parser = argparse.ArgumentParser(description="PyFlow Suite Backup Tool")
+    subparsers = parser.add_subparsers(dest="command")
+
+    restore_parser = subparsers.add_parser("restore", help="Restore a snapshot")
+    restore_parser.add_argument("target", help="Folder to restore into")
+    restore_parser.add_argument(
+        "--snapshot", help="Timestamp of the snapshot (latest by default)"
+    )
+    restore_parser.add_argument(
+        "--at",
+        help="Restore the snapshot taken at or before this time "
+        "(YYYY-MM-DD [HH:MM[:SS]])",
+    )
+    restore_parser.add_argument(
+        "--path",
+        action="append",
+        dest="paths",
+        help="Only restore paths under this prefix or matching this glob "
+        "(repeatable)",
+    )
+
+    subparsers.add_parser("report", help="Show the chunk store dedup ratio")
+
+    verify_parser = subparsers.add_parser(
+        "verify", help="Check a snapshot for corruption or missing files"
+    )
+    verify_parser.add_argument(
+        "--snapshot", help="Timestamp of the snapshot (latest by default)"
+    )
+    verify_parser.add_argument(
+        "--source",
+        action="store_true",
+        help="Compare with the source folder instead of the snapshot's checksums",
+    )
+    verify_parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_VERIFY_WORKERS,
+        help="Hashing threads (all cores by default)",
+    )
+
+    prune_parser = subparsers.add_parser(
+        "prune", help="Delete snapshots outside the retention policy"
+    )
+    prune_parser.add_argument(
+        "--dry-run", action="store_true", help="Only list what would be deleted"
+    )
+
+    query_parser = subparsers.add_parser(
+        "query", help="Search the catalog of files across all snapshots"
+    )
+    queries = query_parser.add_subparsers(dest="query", required=True)
+    find_parser = queries.add_parser("find", help="Find files by name")
+    find_parser.add_argument("pattern", help="Name glob (* and ?), or part of the name")
+    find_parser.add_argument("--limit", type=int, default=100)
+    history_parser = queries.add_parser("history", help="List the versions of a file")
+    history_parser.add_argument("path", help="Path relative to the source folder")
+    growth_parser = queries.add_parser(
+        "growth", help="Files that grew the most between two snapshots"
+    )
+    growth_parser.add_argument(
+        "--since", help="Older snapshot (the one before --until by default)"
+    )
+    growth_parser.add_argument("--until", help="Newer snapshot (latest by default)")
+    growth_parser.add_argument("--limit", type=int, default=20)
+    queries.add_parser("rebuild", help="Recreate the catalog from the journals")
+
+    diff_parser = subparsers.add_parser(
+        "diff", help="List the files that differ between two snapshots"
+    )
+    diff_parser.add_argument(
+        "snapshots",
+        nargs="*",
+        help="Old and new snapshot (the last two by default; "
+        "with --source, the snapshot to compare)",
+    )
+    diff_parser.add_argument(
+        "--source",
+        action="store_true",
+        help="Compare a snapshot (latest by default) with the live source folder",
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch", help="Keep backing up changes as they happen"
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        help="Seconds without changes before a snapshot is taken",
+    )
+    watch_parser.add_argument(
+        "--max-delay",
+        type=float,
+        default=30.0,
+        help="Longest wait for changes to settle before snapshotting anyway",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=30.0,
+        help="Scan interval when inotify is not available",
+    )
+    subparsers.add_parser(
+        "plan",
+        help="Only report what a backup would copy and how long it would take",
+    )
+    return parser.parse_args(argv)
+
+
+def run_restore(args):
+    """Restore a snapshot of the configured source"""
+    source_dir, dest_dir_base, _, options = get_backup_config(remote_ok=True)
+    if not source_dir:
+        return
+
+    backup_root = get_backup_root(source_dir, dest_dir_base)
+    if not is_remote(backup_root):
+        return restore_from(backup_root, args, options)
+    try:
+        with open_backend(backup_root, options) as backend:
+            restore_from(backup_root, args, options, backend)
+    except Exception as e:
+        logging.error(f"❌ Restore from {backup_root} failed: {e}")
+
+
+def restore_from(backup_root, args, options, backend=None):
+    """Pick the snapshot the restore arguments ask for and restore it"""
+    snapshot = args.snapshot
+    if args.at:
+        try:
+            when = parse_point_in_time(args.at)
+        except ValueError as e:
+            logging.error(f"❌ {e}")
+            return
+        snapshot = find_snapshot_at(backup_root, when, backend)
+        if not snapshot:
+            logging.error(f"❌ No snapshot taken at or before {when}")
+            return
+
+    restore_snapshot(
+        backup_root,
+        snapshot,
+        args.target,
+        args.paths,
+        options["max_workers"],
+        backend,
+    )
+
+
+def run_report(args):
+    """Print how much the chunk store saves across all snapshots"""
+    source_dir, dest_dir_base, _, _ = get_backup_config()
+    if not source_dir:
+        return
+
+    report = dedup_report(get_backup_root(source_dir, dest_dir_base))
+    mb = 1024 * 1024
+    print("\n" + "=" * 50)
+    print(f"Snapshots:        {report['snapshots']}")
+    print(f"Logical size:     {report['logical_bytes'] / mb:.1f} MB")
+    print(
+        f"Stored size:      {report['stored_bytes'] / mb:.1f} MB "
+        f"({report['stored_chunks']} chunks)"
+    )
+    print(f"Dedup ratio:      {report['dedup_ratio']:.2f}x")
+    print("=" * 50)
+
+
+def run_watch(args):
+    """Back up the configured source continuously, one small snapshot per batch"""
+    source_dir, dest_dir_base, allowed_extensions, options = get_backup_config(
+        remote_ok=True
+    )
+    if not source_dir:
+        return
+    if not os.path.exists(source_dir):
+        logging.error(f"❌ Source folder does not exist: {source_dir}")
+        return
+
+    backup_roots = [r for r in options["backup_roots"] if not is_remote(r)]
+    for backup_root in options["backup_roots"]:
+        if backup_root not in backup_roots:
+            logging.warning(f"⚠️  Watch mode skips backend destination {backup_root}")
+    if not backup_roots:
+        logging.error("❌ Watch mode needs at least one local destination folder")
+        return
+    for backup_root in backup_roots:
+        os.makedirs(backup_root, exist_ok=True)
+    apply_io_limits(options)
+    # Snapshot mode would hardlink the whole tree for every batch
+    options = dict(options, backup_mode="incremental")
+
+    def take_snapshot(changes):
+        snapshot_dirs = [
+            os.path.join(backup_root, new_snapshot_name(backup_root))
+            for backup_root in backup_roots
+        ]
+        for snapshot_dir, stats in backup_destinations(
+            source_dir, snapshot_dirs, allowed_extensions, options, changes
+        ):
+            backup_root = os.path.dirname(snapshot_dir)
+            print_summary(stats)
+            log_prune_stats(prune_snapshots(backup_root, options["retention"]))
+            update_catalog(backup_root, changes)
+
+    # One full pass first, so the journal describes the tree being watched
+    logging.info(f"📁 Source: {source_dir}")
+    for backup_root in backup_roots:
+        logging.info(f"📂 Destination: {backup_root}")
+    take_snapshot(None)
+
+    matcher = load_matcher(source_dir, allowed_extensions, options["ignore_file"])
+    watcher = create_watcher(
+        source_dir, matcher.include_dir, backup_roots, args.interval
+    )
+
+    def on_batch(changes):
+        if changes is RESCAN:
+            logging.warning("⚠️  Change events were lost, rescanning the source")
+        elif "" in changes:
+            # An event on the source folder itself stands for the whole tree
+            logging.info("🔔 The source folder itself changed, rescanning it")
+            changes = RESCAN
+        else:
+            logging.info(f"🔔 {len(changes)} paths changed")
+            changes = expand_changes(source_dir, backup_roots, matcher, changes)
+        take_snapshot(changes)
+
+    try:
+        watch_changes(watcher, on_batch, args.debounce, args.max_delay)
+    except KeyboardInterrupt:
+        logging.info("👋 Watch mode stopped")
+    finally:
+        watcher.close()
+
+
+def run_verify(args):
+    """Verify a snapshot of the configured source and print the outcome"""
+    source_dir, dest_dir_base, _, _ = get_backup_config()
+    if not source_dir:
+        return
+
+    stats = verify_snapshot(
+        get_backup_root(source_dir, dest_dir_base),
+        args.snapshot,
+        source_dir if args.source else None,
+        args.workers,
+    )
+    if stats is None:
+        return
+
+    print("\n" + "=" * 50)
+    print(f"Verified:         {stats['ok']} files")
+    print(f"Mismatched:       {stats['mismatch']}")
+    print(f"Missing:          {stats['missing']}")
+    if args.source:
+        print(f"Changed since:    {stats['changed']} (not compared)")
+    print(
+        f"Read:             {stats['bytes'] / (1024 * 1024):.1f} MB in "
+        f"{stats['elapsed']:.1f}s ({stats['throughput_mb_s']:.1f} MB/s)"
+    )
+    if stats["recorded"]:
+        print(f"Checksums saved:  {stats['recorded']} files")
+    print("=" * 50)
+    if stats["problems"]:
+        logging.warning(f"⚠️  {len(stats['problems'])} problems found.")
+    else:
+        logging.info("✅ Snapshot is intact.")
+
+
+def format_mtime(mtime_ns):
+    """Format a journal mtime for query output"""
+    return datetime.datetime.fromtimestamp(mtime_ns / 1e9).strftime("%Y-%m-%d %H:%M")
+
+
+def run_query(args):
+    """Answer a catalog query about the configured source's snapshots"""
+    source_dir, dest_dir_base, _, _ = get_backup_config()
+    if not source_dir:
+        return
+
+    backup_root = get_backup_root(source_dir, dest_dir_base)
+    if not journal.list_snapshots(backup_root):
+        logging.error("❌ No snapshots found")
+        return
+
+    mb = 1024 * 1024
+    with Catalog(backup_root) as catalog:
+        if args.query == "rebuild":
+            catalog.rebuild()
+            logging.info("🗂️  Catalog rebuilt from the journals")
+            return
+        # Catch up with snapshots taken before the catalog existed
+        catalog.sync()
+
+        if args.query == "find":
+            rows = catalog.find(args.pattern, args.limit)
+            for path, size, mtime_ns, first, last in rows:
+                print(
+                    f"{path}  {size / mb:.2f} MB  {format_mtime(mtime_ns)}  "
+                    f"[{first} .. {last}]"
+                )
+            logging.info(f"🔎 {len(rows)} files found")
+        elif args.query == "history":
+            rows = catalog.history(args.path)
+            for size, mtime_ns, digest, first, last in rows:
+                print(
+                    f"{format_mtime(mtime_ns)}  {size / mb:.2f} MB  "
+                    f"[{first} .. {last}]  {(digest or '')[:16]}"
+                )
+            logging.info(f"🕒 {len(rows)} versions of {args.path}")
+        elif args.query == "growth":
+            try:
+                since, until, rows = catalog.growth(args.since, args.until, args.limit)
+            except ValueError as e:
+                logging.error(f"❌ {e}")
+                return
+            if since is None:
+                logging.info("ℹ️  Growth needs at least two snapshots.")
+                return
+            print(f"Growth from {since} to {until}:")
+            for path, old_size, new_size, grown in rows:
+                print(
+                    f"+{grown / mb:.2f} MB  {path}  "
+                    f"({old_size / mb:.2f} -> {new_size / mb:.2f} MB)"
+                )
+
+
+def source_tree(source_dir, backup_root, allowed_extensions, options):
+    """Build the Merkle tree of the live source, with a backup's filters"""
+    matcher = load_matcher(source_dir, allowed_extensions, options["ignore_file"])
+    leaves = {}
+    for rel_path, _, stat_result in iter_backup_files(
+        source_dir, excluded_roots(backup_root, options), matcher
+    ):
+        if matcher.include_file(rel_path, stat_result):
+            leaves[rel_path] = (stat_result.st_size, stat_result.st_mtime_ns)
+    return build_tree(leaves)
+
+
+def run_diff(args):
+    """List what changed between two snapshots, or a snapshot and the source"""
+    source_dir, dest_dir_base, allowed_extensions, options = get_backup_config()
+    if not source_dir:
+        return
+
+    backup_root = get_backup_root(source_dir, dest_dir_base)
+    snapshots = journal.list_snapshots(backup_root)
+    wanted = 1 if args.source else 2
+    if len(args.snapshots) > wanted:
+        logging.error(f"❌ Give at most {wanted} snapshot(s)")
+        return
+    names = args.snapshots or snapshots[-wanted:]
+    if len(names) < wanted or any(name not in snapshots for name in names):
+        logging.error("❌ Snapshot not found")
+        return
+
+    store = MerkleStore(backup_root)
+    started = time.perf_counter()
+    try:
+        old_root = store.root(names[0])
+        if args.source:
+            if not os.path.exists(source_dir):
+                logging.error(f"❌ Source folder does not exist: {source_dir}")
+                return
+            new_root, nodes = source_tree(
+                source_dir, backup_root, allowed_extensions, options
+            )
+            load_new = nodes.__getitem__
+            target = source_dir
+        else:
+            new_root, load_new, target = store.root(names[1]), store.load, names[1]
+        changes = sorted(
+            diff_trees(store.load, old_root, load_new, new_root),
+            key=lambda change: change[1],
+        )
+    except OSError as e:
+        logging.error(f"❌ Cannot read the Merkle trees: {e}")
+        return
+    elapsed = time.perf_counter() - started
+
+    marks = {"added": "+", "removed": "-", "modified": "~"}
+    for status, path in changes:
+        print(f"{marks[status]} {path}")
+    counts = {status: 0 for status in marks}
+    for status, _ in changes:
+        counts[status] += 1
+    logging.info(
+        f"🌳 {names[0]} -> {target}: {counts['added']} added, "
+        f"{counts['removed']} removed, {counts['modified']} modified "
+        f"({elapsed * 1000:.0f} ms)"
+    )
+
+
+def run_plan():
+    """Plan a backup of the configured source without copying anything"""
+    source_dir, dest_dir_base, allowed_extensions, options = get_backup_config()
+    if not source_dir:
+        return
+    if not os.path.exists(source_dir):
+        logging.error(f"❌ Source folder does not exist: {source_dir}")
+        return
+
+    backup_root = get_backup_root(source_dir, dest_dir_base)
+    plan = plan_backup(source_dir, backup_root, allowed_extensions, options)
+    eta, runs_used = estimate_duration(backup_root, options, plan)
+    print_plan(plan, eta, runs_used)
+
+
+def run_prune(args):
+    """Apply the configured retention policy to the source's snapshots"""
+    source_dir, dest_dir_base, _, options = get_backup_config()
+    if not source_dir:
+        return
+    if not policy_enabled(options["retention"]):
+        logging.info("ℹ️  No retention policy configured, nothing to prune.")
+        return
 
-    return source_dir, dest_dir_base, allowed_extensions
+    stats = prune_snapshots(
+        get_backup_root(source_dir, dest_dir_base),
+        options["retention"],
+        args.dry_run,
+    )
+    log_prune_stats(stats)
 
 
 def main():
+    args = parse_args()
+    if args.command == "restore":
+        return run_restore(args)
+    if args.command == "report":
+        return run_report(args)
+    if args.command == "watch":
+        return run_watch(args)
+    if args.command == "verify":
+        return run_verify(args)
+    if args.command == "prune":
+        return run_prune(args)
+    if args.command == "query":
+        return run_query(args)
+    if args.command == "diff":
+        return run_diff(args)
+    if args.command == "plan":
+        return run_plan()
+
+    run_backup()
+
+
+def print_summary(stats):
+    """Log the outcome of one backup run"""
+    print("\n" + "=" * 50)
+    if "destination" in stats:
+        logging.info(f"📂 Destination: {stats['destination']}")
+    logging.info(f"✅ Backup completed! {stats['copied']} items copied.")
+    logging.info(
+        f"📊 {stats['bytes'] / (1024 * 1024):.1f} MB in {stats['elapsed']:.1f}s "
+        f"({stats['throughput_mb_s']:.1f} MB/s)"
+    )
+    if "write_mb_s" in stats:
+        logging.info(
+            f"💽 Write speed of this destination: {stats['write_mb_s']:.1f} MB/s"
+        )
+    if stats["methods"]:
+        methods = ", ".join(f"{k}: {v}" for k, v in sorted(stats["methods"].items()))
+        logging.info(f"🛠️  Copy methods: {methods}")
+    if stats["resumed"] > 0:
+        logging.info(
+            f"⏯️  Already done by the interrupted run: {stats['resumed']} files."
+        )
+    if stats["unchanged"] > 0:
+        logging.info(f"ℹ️  Unchanged since last snapshot: {stats['unchanged']} files.")
+    if stats["linked"] > 0:
+        logging.info(f"🔗 Hardlinked from previous snapshot: {stats['linked']} files.")
+    if "chunks_seen" not in stats and "bytes_stored" in stats:
+        logging.info(
+            f"🗜️  Archive size: {stats['bytes_stored'] / (1024 * 1024):.1f} MB."
+        )
+    if "chunks_seen" in stats:
+        logging.info(
+            f"🧩 {stats['chunks_new']} new of {stats['chunks_seen']} chunks, "
+            f"{stats['bytes_stored'] / (1024 * 1024):.1f} MB written to the store."
+        )
+    if "packed" in stats:
+        logging.info(
+            f"📦 Packed {stats['packed']} small files into {stats['packs']} pack files."
+        )
+    if "tail_appended" in stats:
+        mb = 1024 * 1024
+        logging.info(
+            f"📜 Append-only growth: {stats['tail_files']} files, "
+            f"{stats['tail_appended'] / mb:.1f} MB of new tail copied, "
+            f"{stats['tail_reused'] / mb:.1f} MB reused."
+        )
+    elif "tail_files" in stats:
+        logging.info(
+            f"📜 Append-only growth: {stats['tail_files']} files chunked "
+            "from their old end only."
+        )
+    if "delta_files" in stats:
+        mb = 1024 * 1024
+        logging.info(
+            f"🧮 Delta transfer: {stats['delta_files']} large files, "
+            f"{stats['delta_reused'] / mb:.1f} MB reused, "
+            f"{stats['delta_written'] / mb:.1f} MB written."
+        )
+    if stats["skipped"] > 0:
+        logging.info(
+            f"ℹ️  Skipped {stats['skipped']} files (extension filter / ignore rules)."
+        )
+    if stats["errors"] > 0:
+        logging.warning(f"⚠️  {stats['errors']} items failed to copy.")
+    print("=" * 50)
+
+
+def apply_io_limits(options):
+    """Log the configured throttle and switch to idle priority if asked"""
+    throttle = create_throttle(options["max_mb_s"], options["max_iops"])
+    if throttle:
+        logging.info(f"🐢 I/O limit: {throttle}")
+    if options["idle_priority"]:
+        applied = set_idle_priority()
+        logging.info(f"💤 Idle priority: {', '.join(applied) or 'not supported'}")
+
+
+def choose_snapshot(backup_root, options):
+    """Get the snapshot name of a run: an interrupted one to resume, or a new one"""
+    unfinished, header = find_unfinished(backup_root)
+    if not unfinished:
+        return new_snapshot_name(backup_root)
+    if (
+        header.get("backup_mode") == options["backup_mode"]
+        and header.get("storage_format") == options["storage_format"]
+    ):
+        logging.info(f"⏯️  Found interrupted backup {unfinished}, resuming it")
+        return unfinished
+
+    logging.warning(
+        f"⚠️  Interrupted backup {unfinished} used other settings; "
+        "starting a new one"
+    )
+    os.remove(os.path.join(get_checkpoint_dir(backup_root), f"{unfinished}.log"))
+    return new_snapshot_name(backup_root)
+
+
+def run_backup():
+    """Run a backup of the configured source"""
     logging.info("Starting Backup Tool...")
 
-    source_dir, dest_dir_base, allowed_extensions = get_backup_config()
+    source_dir, dest_dir_base, allowed_extensions, options = get_backup_config(
+        remote_ok=True
+    )
 
     if not source_dir:
         input("Press Enter to exit...")
@@ -161,34 +2208,59 @@ def main():
         input("Press Enter to exit...")
         return
 
-    # Construct destination
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    source_name = os.path.basename(os.path.normpath(source_dir))
-    backup_dest_dir = os.path.join(dest_dir_base, f"backup_{source_name}", timestamp)
-
     logging.info(f"📁 Source: {source_dir}")
-    logging.info(f"📂 Destination: {backup_dest_dir}")
+    snapshot_dirs = []
+    remote_roots = [r for r in options["backup_roots"] if is_remote(r)]
+    for backup_root in options["backup_roots"]:
+        if backup_root in remote_roots:
+            continue
+        backup_dest_dir = os.path.join(
+            backup_root, choose_snapshot(backup_root, options)
+        )
+        logging.info(f"📂 Destination: {backup_dest_dir}")
 
-    # Create destination directory
-    try:
-        os.makedirs(backup_dest_dir, exist_ok=True)
-    except OSError as e:
-        logging.error(f"Error creating backup directory '{backup_dest_dir}': {e}")
+        # Create destination directory (chunk store and archives only need the root)
+        if options["storage_format"] in ("chunks", "archive"):
+            dir_to_create = backup_root
+        else:
+            dir_to_create = backup_dest_dir
+        try:
+            os.makedirs(dir_to_create, exist_ok=True)
+        except OSError as e:
+            logging.error(f"Error creating backup directory '{backup_dest_dir}': {e}")
+            continue
+        snapshot_dirs.append(backup_dest_dir)
+
+    if not snapshot_dirs and not remote_roots:
         input("Press Enter to exit...")
         return
 
+    logging.info(f"⚙️  Mode: {options['backup_mode']}")
+    logging.info(f"🧵 Copy workers: {options['max_workers']}")
+    logging.info(f"🗄️  Storage: {options['storage_format']}")
+    apply_io_limits(options)
+
     # Run backup
-    count, skipped = perform_backup(source_dir, backup_dest_dir, allowed_extensions)
+    for backup_dest_dir, stats in backup_destinations(
+        source_dir, snapshot_dirs, allowed_extensions, options
+    ):
+        backup_root, timestamp = os.path.split(backup_dest_dir)
+        journal.record_run(backup_root, timestamp, options["storage_format"], stats)
 
-    print("\n" + "=" * 50)
-    logging.info(f"✅ Backup completed! {count} items copied.")
-    if skipped > 0:
-        logging.info(f"ℹ️  Skipped {skipped} files (extension filter).")
-    print("=" * 50)
+        print_summary(stats)
+        log_prune_stats(prune_snapshots(backup_root, options["retention"]))
+        update_catalog(backup_root)
 
-    # Auto close
-    import time
+    # Backend destinations keep their own journal; checkpoints, retention
+    # and the catalog only cover local folders
+    if remote_roots and policy_enabled(options["retention"]):
+        logging.warning("⚠️  Retention skips backend destinations; prune them by hand")
+    for backup_root in remote_roots:
+        stats = backup_remote(source_dir, backup_root, allowed_extensions, options)
+        if stats:
+            print_summary(stats)
 
+    # Auto close
     time.sleep(5)
 
 
@@ -0,0 +1,548 @@
+"""
+Streaming zip archive output for the Backup Tool
+Members are compressed on the copy engine's worker threads into spooled
+buffers, then appended to a single .zip by the caller's thread. Formats that
+are already compressed are stored as-is so no CPU is wasted on them.
+
+The writer emits standard zip (with zip64 extensions for big members), so any
+unzip tool and Python's zipfile can read the result.
+
+Next to each archive, <timestamp>.zip.idx lists the members sorted by name
+with their data offset, sizes, CRC and compression frames: deflate streams
+get a full flush every FRAME_SIZE bytes, so each frame inflates on its own.
+A restore binary-searches the index in place and seeks straight to the
+data, and large members are inflated frame by frame on several workers.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+import zipfile
+
+from fast_copy import RangedTask, preallocate
+
+ARCHIVE_SUFFIX = ".zip"
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+READ_SIZE = 1024 * 1024
+FRAME_SIZE = 16 * READ_SIZE
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+COMPRESS_LEVEL = 6
+
+# Extensions whose content is already compressed
+STORED_EXTENSIONS = {
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".webp",
+    ".mp3",
+    ".mp4",
+    ".mkv",
+    ".mov",
+    ".avi",
+    ".zip",
+    ".gz",
+    ".bz2",
+    ".xz",
+    ".zst",
+    ".7z",
+    ".rar",
+    ".xlsx",
+    ".docx",
+    ".pptx",
+}
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+FLAG_UTF8 = 0x0800
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+VERSION_MADE_BY = (3 << 8) | VERSION_ZIP64  # Unix
+
+
+def is_precompressed(path):
+    """Check if a file format is already compressed"""
+    return os.path.splitext(path)[1].lower() in STORED_EXTENSIONS
+
+
+def compress_member(source_path, member, throttle=None):
+    """Read and compress one file into a spooled buffer (runs on a worker)
+
+    Fills member with the data the writer needs and returns the file size.
+    """
+    stored = is_precompressed(source_path)
+    compressor = (
+        None if stored else zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    )
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    crc = 0
+    size = 0
+    # [uncompressed offset, compressed offset, CRC-32] of each frame
+    frames = [[0, 0, 0]]
+
+    stat_result = os.stat(source_path)
+    with open(source_path, "rb") as f:
+        if throttle:
+            f = throttle.reader(f)
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            frames[-1][2] = zlib.crc32(block, frames[-1][2])
+            size += len(block)
+            spool.write(compressor.compress(block) if compressor else block)
+            if size - frames[-1][0] >= FRAME_SIZE:
+                if compressor:
+                    # A full flush resets the window, so inflating can start here
+                    spool.write(compressor.flush(zlib.Z_FULL_FLUSH))
+                frames.append([size, spool.tell(), 0])
+    if compressor:
+        spool.write(compressor.flush())
+    if len(frames) > 1 and frames[-1][0] == size:
+        frames.pop()  # the file ended on a frame boundary
+
+    member.update(
+        {
+            "spool": spool,
+            "crc": crc,
+            "size": size,
+            "compressed_size": spool.tell(),
+            "method": zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED,
+            "mtime": stat_result.st_mtime,
+            "mode": stat_result.st_mode,
+        }
+    )
+    if len(frames) > 1:
+        member["frames"] = frames
+    return size
+
+
+def dos_datetime(timestamp):
+    """Convert a POSIX timestamp to zip's (date, time) fields"""
+    dt = datetime.datetime.fromtimestamp(timestamp)
+    if dt.year < 1980:
+        dt = datetime.datetime(1980, 1, 1)
+    dos_date = ((dt.year - 1980) << 9) | (dt.month << 5) | dt.day
+    dos_time = (dt.hour << 11) | (dt.minute << 5) | (dt.second // 2)
+    return dos_date, dos_time
+
+
+class ZipStreamWriter:
+    """Appends precompressed members to a zip file written front to back"""
+
+    def __init__(self, archive_path, resume_members=None):
+        self.archive_path = archive_path
+        self.partial_path = archive_path + ".partial"
+        self.entries = []
+
+        if resume_members and os.path.exists(self.partial_path):
+            # Keep the members an interrupted run finished that really are in
+            # the file; later ones (and any torn tail) are dropped and redone
+            self.fp = open(self.partial_path, "r+b")
+            size = os.fstat(self.fp.fileno()).st_size
+            self.entries = [
+                m
+                for m in resume_members
+                if m["data_offset"] + m["compressed_size"] <= size
+            ]
+            end = max(
+                (m["data_offset"] + m["compressed_size"] for m in self.entries),
+                default=0,
+            )
+            self.fp.truncate(end)
+            self.fp.seek(end)
+        else:
+            self.fp = open(self.partial_path, "wb")
+
+    def sync(self):
+        """Flush the members written so far to disk (checkpoint batches)"""
+        if not self.fp.closed:
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+
+    def write_member(self, member):
+        """Write a member produced by compress_member"""
+        name = member["name"].encode("utf-8")
+        offset = self.fp.tell()
+        dos_date, dos_time = dos_datetime(member["mtime"])
+        zip64 = (
+            member["size"] >= ZIP64_LIMIT or member["compressed_size"] >= ZIP64_LIMIT
+        )
+
+        if zip64:
+            extra = struct.pack(
+                "<HHQQ", 0x0001, 16, member["size"], member["compressed_size"]
+            )
+            sizes = (ZIP64_LIMIT, ZIP64_LIMIT)
+        else:
+            extra = b""
+            sizes = (member["compressed_size"], member["size"])
+
+        self.fp.write(
+            struct.pack(
+                "<IHHHHHIIIHH",
+                0x04034B50,
+                VERSION_ZIP64 if zip64 else VERSION_DEFAULT,
+                FLAG_UTF8,
+                member["method"],
+                dos_time,
+                dos_date,
+                member["crc"],
+                sizes[0],
+                sizes[1],
+                len(name),
+                len(extra),
+            )
+        )
+        self.fp.write(name)
+        self.fp.write(extra)
+        data_offset = self.fp.tell()
+
+        spool = member.pop("spool")
+        spool.seek(0)
+        shutil.copyfileobj(spool, self.fp, READ_SIZE)
+        spool.close()
+
+        member.update(
+            {
+                "offset": offset,
+                "data_offset": data_offset,
+                "dos_date": dos_date,
+                "dos_time": dos_time,
+            }
+        )
+        self.entries.append(member)
+
+    def close(self):
+        """Write the central directory and publish the archive"""
+        cd_offset = self.fp.tell()
+
+        for member in self.entries:
+            self._write_central_entry(member)
+
+        cd_size = self.fp.tell() - cd_offset
+        count = len(self.entries)
+
+        if (
+            count >= ZIP_FILECOUNT_LIMIT
+            or cd_offset >= ZIP64_LIMIT
+            or cd_size >= ZIP64_LIMIT
+        ):
+            zip64_end_offset = self.fp.tell()
+            self.fp.write(
+                struct.pack(
+                    "<IQHHIIQQQQ",
+                    0x06064B50,
+                    44,
+                    VERSION_MADE_BY,
+                    VERSION_ZIP64,
+                    0,
+                    0,
+                    count,
+                    count,
+                    cd_size,
+                    cd_offset,
+                )
+            )
+            self.fp.write(struct.pack("<IIQI", 0x07064B50, 0, zip64_end_offset, 1))
+            count = min(count, ZIP_FILECOUNT_LIMIT)
+            cd_size = min(cd_size, ZIP64_LIMIT)
+            cd_offset = min(cd_offset, ZIP64_LIMIT)
+
+        self.fp.write(
+            struct.pack(
+                "<IHHHHIIH", 0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0
+            )
+        )
+        self.fp.close()
+        index_tmp = self.write_index()
+        os.replace(self.partial_path, self.archive_path)
+        os.replace(index_tmp, self.archive_path + INDEX_SUFFIX)
+
+    def write_index(self):
+        """Write the sidecar index to a temporary file and return its path
+
+        One JSON line per member, sorted by name, so the index can be
+        binary-searched without being loaded.
+        """
+        tmp_path = self.archive_path + INDEX_SUFFIX + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            header = {"version": INDEX_VERSION, "members": len(self.entries)}
+            f.write(json.dumps(header) + "\n")
+            for member in sorted(self.entries, key=lambda m: m["name"]):
+                record = [
+                    member["name"],
+                    member["data_offset"],
+                    member["compressed_size"],
+                    member["size"],
+                    member["crc"],
+                    member["method"],
+                    member.get("frames", []),
+                ]
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return tmp_path
+
+    def _write_central_entry(self, member):
+        name = member["name"].encode("utf-8")
+        zip64_fields = []
+        size = member["size"]
+        compressed_size = member["compressed_size"]
+        offset = member["offset"]
+
+        if size >= ZIP64_LIMIT:
+            zip64_fields.append(size)
+            size = ZIP64_LIMIT
+        if compressed_size >= ZIP64_LIMIT:
+            zip64_fields.append(compressed_size)
+            compressed_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            zip64_fields.append(offset)
+            offset = ZIP64_LIMIT
+
+        extra = b""
+        if zip64_fields:
+            extra = struct.pack(
+                f"<HH{len(zip64_fields)}Q",
+                0x0001,
+                8 * len(zip64_fields),
+                *zip64_fields,
+            )
+
+        self.fp.write(
+            struct.pack(
+                "<IHHHHHHIIIHHHHHII",
+                0x02014B50,
+                VERSION_MADE_BY,
+                VERSION_ZIP64 if zip64_fields else VERSION_DEFAULT,
+                FLAG_UTF8,
+                member["method"],
+                member["dos_time"],
+                member["dos_date"],
+                member["crc"],
+                compressed_size,
+                size,
+                len(name),
+                len(extra),
+                0,
+                0,
+                0,
+                (member["mode"] & 0xFFFF) << 16,
+                offset,
+            )
+        )
+        self.fp.write(name)
+        self.fp.write(extra)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep the .partial file so an interrupted run can resume it;
+            # the checkpoint still logs its last batch, so sync it first
+            self.sync()
+            self.fp.close()
+
+
+def member_name(rel_path):
+    """Get the zip member name of a source-relative path"""
+    return rel_path.replace(os.sep, "/")
+
+
+def get_index_path(archive_path):
+    """Get the sidecar index of an archive"""
+    return archive_path + INDEX_SUFFIX
+
+
+class ArchiveIndex:
+    """Sorted member index of one archive, searched in place
+
+    Records are [name, data_offset, compressed_size, size, crc, method,
+    frames]. Lines are ASCII (JSON escapes the rest), so byte offsets can
+    be bisected directly.
+    """
+
+    def __init__(self, index_path):
+        self.fp = open(index_path, "rb")
+        try:
+            header = json.loads(self.fp.readline())
+            if header.get("version") != INDEX_VERSION:
+                raise ValueError(f"unsupported archive index version in {index_path}")
+        except Exception:
+            self.fp.close()
+            raise
+        self.start = self.fp.tell()
+        self.end = os.fstat(self.fp.fileno()).st_size
+
+    def close(self):
+        self.fp.close()
+
+    def _first_at_least(self, name):
+        """Get the offset of the first line whose member name is >= name"""
+        lo, hi = self.start, self.end  # lo and hi always sit on line starts
+        while lo < hi:
+            mid = (lo + hi) // 2
+            self.fp.seek(mid)
+            if mid > lo:
+                self.fp.readline()  # move to the next line start
+            pos = self.fp.tell()
+            if pos >= hi:
+                pos = lo
+                self.fp.seek(lo)
+            if json.loads(self.fp.readline())[0] < name:
+                lo = self.fp.tell()
+            else:
+                hi = pos
+        return lo
+
+    def find(self, name):
+        """Get the record of a member, or None"""
+        self.fp.seek(self._first_at_least(name))
+        line = self.fp.readline()
+        if line:
+            record = json.loads(line)
+            if record[0] == name:
+                return record
+        return None
+
+    def iter_prefix(self, prefix):
+        """Yield the records of the members whose name starts with prefix"""
+        self.fp.seek(self._first_at_least(prefix))
+        for line in self.fp:
+            record = json.loads(line)
+            if not record[0].startswith(prefix):
+                return
+            yield record
+
+    def records(self):
+        """Yield every record, in name order"""
+        self.fp.seek(self.start)
+        for line in self.fp:
+            yield json.loads(line)
+
+
+def iter_member_data(chunks, method):
+    """Yield the uncompressed data of a member from its raw chunks
+
+    Inflates in READ_SIZE pieces, so highly compressed data never
+    balloons in memory.
+    """
+    if method != zipfile.ZIP_DEFLATED:
+        yield from chunks
+        return
+    inflater = zlib.decompressobj(-15)
+    for data in chunks:
+        while data:
+            out = inflater.decompress(data, READ_SIZE)
+            if out:
+                yield out
+            data = inflater.unconsumed_tail
+    out = inflater.flush()
+    if out:
+        yield out
+
+
+def iter_raw_chunks(archive_file, offset, length, name):
+    """Yield the raw bytes of a member in READ_SIZE chunks"""
+    archive_file.seek(offset)
+    while length > 0:
+        data = archive_file.read(min(READ_SIZE, length))
+        if not data:
+            raise OSError(f"archive is truncated in member '{name}'")
+        length -= len(data)
+        yield data
+
+
+def read_member(archive_file, record, dest_path, mtime_ns=None):
+    """Extract one member by seeking to it with its index record
+
+    archive_file is an open binary file of the archive (not shared across
+    threads). Returns the file size; the CRC and size are checked.
+    """
+    name, data_offset, compressed_size, size, expected_crc, method, _ = record
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    crc = 0
+    written = 0
+    chunks = iter_raw_chunks(archive_file, data_offset, compressed_size, name)
+    with open(dest_path, "wb") as out:
+        for piece in iter_member_data(chunks, method):
+            crc = zlib.crc32(piece, crc)
+            written += len(piece)
+            out.write(piece)
+    if written != size or crc != expected_crc:
+        raise OSError(f"member '{name}' failed its CRC check")
+    if mtime_ns is not None:
+        os.utime(dest_path, ns=(mtime_ns, mtime_ns))
+    return size
+
+
+class FrameExtract(RangedTask):
+    """One large member inflated frame by frame by several workers"""
+
+    def __init__(self, archive_path, record, dest_path, mtime_ns=None):
+        self.name, self.data_offset, self.compressed_size, self.size = record[:4]
+        self.method = record[5]
+        self.dest_path = dest_path
+        self.mtime_ns = mtime_ns
+        frames = record[6]
+        # Each part: (uncompressed offset, length, compressed offset, length, crc)
+        ends = [frame[:2] for frame in frames[1:]]
+        ends.append([self.size, self.compressed_size])
+        parts = [
+            (start, end - start, cstart, cend - cstart, crc)
+            for (start, cstart, crc), (end, cend) in zip(frames, ends)
+        ]
+        self.src_fd = os.open(archive_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            self.dst_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            preallocate(self.dst_fd, self.size)
+        except OSError:
+            self.close()
+            raise
+        self.start(parts)
+
+    def copy_range(self, offset, length, coffset, clength, expected_crc):
+        """Inflate one frame and write it at its offset (runs on a worker)"""
+        data = os.pread(self.src_fd, clength, self.data_offset + coffset)
+        if len(data) != clength:
+            raise OSError(f"archive is truncated in member '{self.name}'")
+        crc = 0
+        position = offset
+        for piece in iter_member_data((data,), self.method):
+            crc = zlib.crc32(piece, crc)
+            view = memoryview(piece)
+            while view:
+                written = os.pwrite(self.dst_fd, view, position)
+                view = view[written:]
+                position += written
+        if position - offset != length or crc != expected_crc:
+            raise OSError(f"member '{self.name}' failed its CRC check")
+        return length
+
+    def finish(self):
+        """Check the reassembled file and give it its recorded mtime"""
+        try:
+            if self.bytes_done != self.size:
+                raise OSError(f"'{self.dest_path}' was not fully written")
+        finally:
+            self.close()
+        if self.mtime_ns is not None:
+            os.utime(self.dest_path, ns=(self.mtime_ns, self.mtime_ns))
+        return self.size
+
+
+def extract_member(zf, rel_path, dest_path, mtime_ns=None):
+    """Extract one file from an open backup archive to dest_path"""
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    with zf.open(member_name(rel_path)) as src, open(dest_path, "wb") as out:
+        shutil.copyfileobj(src, out, READ_SIZE)
+    if mtime_ns is not None:
+        os.utime(dest_path, ns=(mtime_ns, mtime_ns))
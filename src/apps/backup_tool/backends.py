@@ -0,0 +1,492 @@
+"""
+Backup destination backends for the Backup Tool
+A destination is a local folder, file:///path, sftp://user@host[:port]/path
+or s3://bucket/prefix (any S3-compatible store; the endpoint comes from the
+s3_endpoint setting, so MinIO, Ceph or a local stand-in server work too).
+Backends store objects under "/"-separated keys. The copy engine's workers
+call them directly from the source, so uploads are pipelined without a local
+staging tree; each backend keeps a pool of connections for those workers.
+
+paramiko (SFTP) and boto3 (S3) are only imported when such a destination is
+configured.
+"""
+
+import abc
+import importlib
+import io
+import os
+import stat
+import threading
+import urllib.parse
+import uuid
+
+import fast_copy
+from fast_copy import RANGE_SIZE, RangedTask
+
+REMOTE_SCHEMES = ("file", "sftp", "s3")
+MULTIPART_THRESHOLD = RANGE_SIZE
+MAX_PARTS = 10000  # S3 limit per multipart upload
+REMOTE_PACK_THRESHOLD = 1024 * 1024  # smaller files are packed by default
+REMOTE_PACK_SIZE = 64 * 1024 * 1024
+
+
+def is_remote(destination):
+    """Check if a destination is a backend URL rather than a local folder"""
+    scheme = destination.split("://", 1)[0].lower() if "://" in destination else ""
+    return scheme in REMOTE_SCHEMES
+
+
+def join_key(*parts):
+    """Join key parts with "/" whatever the platform's path separator"""
+    return "/".join(p.replace(os.sep, "/").strip("/") for p in parts if p)
+
+
+def import_optional(module, feature):
+    """Import an optional dependency, explaining what needs it when missing"""
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        package = module.split(".")[0]
+        raise ImportError(
+            f"{feature} destinations need the '{package}' package "
+            f"(pip install {package})"
+        ) from None
+
+
+class Backend(abc.ABC):
+    """Object storage under one root; every method may run on a worker"""
+
+    supports_multipart = False
+
+    def __init__(self, url):
+        self.url = url
+
+    @abc.abstractmethod
+    def put_file(self, key, source_path, throttle=None):
+        """Upload a file; returns its size"""
+
+    @abc.abstractmethod
+    def put_bytes(self, key, data):
+        """Store a small object in one request; returns its size"""
+
+    @abc.abstractmethod
+    def get_bytes(self, key):
+        """Get a whole object; FileNotFoundError when it does not exist"""
+
+    @abc.abstractmethod
+    def get_range(self, key, offset, length):
+        """Get length bytes of an object starting at offset"""
+
+    @abc.abstractmethod
+    def get_file(self, key, dest_path):
+        """Download an object to a local file; returns its size"""
+
+    @abc.abstractmethod
+    def list(self, prefix):
+        """List the keys under a prefix"""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __str__(self):
+        return self.url
+
+
+class LocalBackend(Backend):
+    """Objects as plain files under a local folder"""
+
+    def __init__(self, url, root):
+        super().__init__(url)
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def put_file(self, key, source_path, throttle=None):
+        dest_path = self.path(key)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        size, _ = fast_copy.copy_file(source_path, dest_path, throttle)
+        return size
+
+    def put_bytes(self, key, data):
+        dest_path = self.path(key)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, dest_path)
+        return len(data)
+
+    def get_bytes(self, key):
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def get_range(self, key, offset, length):
+        with open(self.path(key), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def get_file(self, key, dest_path):
+        size, _ = fast_copy.copy_file(self.path(key), dest_path)
+        return size
+
+    def list(self, prefix):
+        folder = self.path(prefix)
+        keys = []
+        for dirpath, _, filenames in os.walk(folder):
+            rel_dir = os.path.relpath(dirpath, self.root)
+            for name in filenames:
+                keys.append(join_key("" if rel_dir == "." else rel_dir, name))
+        return keys
+
+
+class SFTPBackend(Backend):
+    """Objects as files on an SFTP server, one channel per worker thread
+
+    All channels share a single SSH connection. Authentication uses the SSH
+    agent and the default keys in ~/.ssh.
+    """
+
+    def __init__(self, url, host, port, username, root):
+        super().__init__(url)
+        paramiko = import_optional("paramiko", "SFTP")
+        self.paramiko = paramiko
+        self.root = root.rstrip("/") or "/"
+        self.client = paramiko.SSHClient()
+        self.client.load_system_host_keys()
+        self.client.connect(host, port=port or 22, username=username)
+        self.transport = self.client.get_transport()
+        self.local = threading.local()
+        self.channels = []
+        self.created = set()
+        self.lock = threading.Lock()
+
+    def sftp(self):
+        """Get the calling thread's SFTP channel"""
+        channel = getattr(self.local, "sftp", None)
+        if channel is None:
+            channel = self.paramiko.SFTPClient.from_transport(self.transport)
+            self.local.sftp = channel
+            with self.lock:
+                self.channels.append(channel)
+        return channel
+
+    def path(self, key):
+        return f"{self.root}/{key}"
+
+    def _makedirs(self, folder):
+        missing = []
+        while folder not in self.created and folder not in ("", "/"):
+            missing.append(folder)
+            folder = folder.rsplit("/", 1)[0]
+        for folder in reversed(missing):
+            try:
+                self.sftp().mkdir(folder)
+            except OSError:
+                pass  # exists already, or made by another worker meanwhile
+            with self.lock:
+                self.created.add(folder)
+
+    def _upload(self, key, file_obj):
+        dest_path = self.path(key)
+        self._makedirs(dest_path.rsplit("/", 1)[0])
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        attributes = self.sftp().putfo(file_obj, tmp_path)
+        self.sftp().posix_rename(tmp_path, dest_path)
+        return attributes.st_size
+
+    def put_file(self, key, source_path, throttle=None):
+        with open(source_path, "rb") as f:
+            return self._upload(key, throttle.reader(f) if throttle else f)
+
+    def put_bytes(self, key, data):
+        return self._upload(key, io.BytesIO(data))
+
+    def get_bytes(self, key):
+        try:
+            with self.sftp().open(self.path(key), "rb") as f:
+                return f.read()
+        except IOError as e:
+            raise FileNotFoundError(key) from e
+
+    def get_range(self, key, offset, length):
+        with self.sftp().open(self.path(key), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def get_file(self, key, dest_path):
+        self.sftp().get(self.path(key), dest_path)
+        return os.path.getsize(dest_path)
+
+    def list(self, prefix):
+        keys = []
+        stack = [prefix.strip("/")]
+        while stack:
+            folder = stack.pop()
+            try:
+                entries = self.sftp().listdir_attr(self.path(folder))
+            except IOError:
+                continue
+            for entry in entries:
+                key = join_key(folder, entry.filename)
+                if stat.S_ISDIR(entry.st_mode):
+                    stack.append(key)
+                else:
+                    keys.append(key)
+        return keys
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+        self.client.close()
+
+
+class S3Backend(Backend):
+    """Objects in an S3-compatible bucket under a key prefix
+
+    boto3 clients are thread-safe; the connection pool is sized for the
+    copy workers. Credentials come from the usual AWS environment
+    variables or profile.
+    """
+
+    supports_multipart = True
+
+    def __init__(
+        self, url, bucket, prefix, endpoint_url=None, max_workers=4, client=None
+    ):
+        """client replaces the boto3 client (a stand-in for tests)"""
+        super().__init__(url)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.transfer = None
+        if client is None:
+            boto3 = import_optional("boto3", "S3")
+            config = import_optional("botocore.config", "S3").Config(
+                max_pool_connections=max(10, max_workers * 2),
+                retries={"max_attempts": 5, "mode": "standard"},
+            )
+            self.transfer = import_optional("boto3.s3.transfer", "S3").TransferConfig(
+                multipart_threshold=MULTIPART_THRESHOLD,
+                multipart_chunksize=RANGE_SIZE,
+                use_threads=False,  # the copy engine runs uploads in parallel
+            )
+            client = boto3.client(
+                "s3", endpoint_url=endpoint_url or None, config=config
+            )
+        self.client = client
+
+    def object_key(self, key):
+        return join_key(self.prefix, key)
+
+    def put_file(self, key, source_path, throttle=None):
+        with open(source_path, "rb") as f:
+            self.client.upload_fileobj(
+                throttle.reader(f) if throttle else f,
+                self.bucket,
+                self.object_key(key),
+                Config=self.transfer,
+            )
+        return os.path.getsize(source_path)
+
+    def put_bytes(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=data)
+        return len(data)
+
+    def get_bytes(self, key):
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.object_key(key)
+            )
+        except self.client.exceptions.NoSuchKey as e:
+            raise FileNotFoundError(key) from e
+        return response["Body"].read()
+
+    def get_range(self, key, offset, length):
+        response = self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.object_key(key),
+            Range=f"bytes={offset}-{offset + length - 1}",
+        )
+        return response["Body"].read()
+
+    def get_file(self, key, dest_path):
+        self.client.download_file(
+            self.bucket, self.object_key(key), dest_path, Config=self.transfer
+        )
+        return os.path.getsize(dest_path)
+
+    def list(self, prefix):
+        base = self.object_key(prefix)
+        skip = len(self.prefix) + 1 if self.prefix else 0
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=base + "/"):
+            keys.extend(item["Key"][skip:] for item in page.get("Contents", ()))
+        return keys
+
+    def start_multipart(self, key):
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=self.object_key(key)
+        )
+        return response["UploadId"]
+
+    def put_part(self, key, upload_id, number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.object_key(key),
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=data,
+        )
+        return response["ETag"]
+
+    def complete_multipart(self, key, upload_id, etags):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.object_key(key),
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": number, "ETag": etags[number]}
+                    for number in sorted(etags)
+                ]
+            },
+        )
+
+    def abort_multipart(self, key, upload_id):
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.object_key(key), UploadId=upload_id
+        )
+
+
+class MultipartUpload(RangedTask):
+    """One big file uploaded as parts by several workers at once"""
+
+    def __init__(self, backend, key, source_path, throttle=None, part_size=RANGE_SIZE):
+        self.backend = backend
+        self.key = key
+        self.source_path = source_path
+        self.throttle = throttle
+        self.upload_id = None
+        self.etags = {}
+        self.src_fd = os.open(source_path, os.O_RDONLY)
+        try:
+            self.source_stat = os.fstat(self.src_fd)
+            self.size = self.source_stat.st_size
+            self.upload_id = backend.start_multipart(key)
+        except Exception:
+            self.close()
+            raise
+        part_size = max(part_size, -(-self.size // MAX_PARTS))
+        self.start(
+            [
+                (number, offset, min(part_size, self.size - offset))
+                for number, offset in enumerate(range(0, self.size, part_size), 1)
+            ]
+        )
+
+    def copy_range(self, number, offset, length):
+        """Read one part and upload it (runs on a worker)"""
+        if self.throttle:
+            self.throttle.acquire(length)
+        data = os.pread(self.src_fd, length, offset)
+        if len(data) != length:
+            raise OSError(f"'{self.source_path}' shrank during the upload")
+        self.etags[number] = self.backend.put_part(
+            self.key, self.upload_id, number, data
+        )
+        return length
+
+    def finish(self):
+        """Complete the upload once every part is in and the source held still"""
+        try:
+            current = os.stat(self.source_path)
+            if self.bytes_done != self.size or (
+                current.st_size,
+                current.st_mtime_ns,
+            ) != (self.source_stat.st_size, self.source_stat.st_mtime_ns):
+                raise OSError(f"'{self.source_path}' changed during the upload")
+            self.backend.complete_multipart(self.key, self.upload_id, self.etags)
+            self.upload_id = None
+        finally:
+            self.close()
+        return self.size
+
+    def close(self):
+        super().close()
+        if self.upload_id is not None:
+            # Best effort: the store drops the uploaded parts
+            upload_id, self.upload_id = self.upload_id, None
+            try:
+                self.backend.abort_multipart(self.key, upload_id)
+            except Exception:
+                pass
+
+
+class PackBuffer:
+    """Collects small files into pack objects (collector thread only)
+
+    Entries only become valid once their pack is uploaded, so each pack
+    carries the journal entries it holds.
+    """
+
+    def __init__(self, snapshot, max_pack_size=REMOTE_PACK_SIZE):
+        self.snapshot = snapshot
+        self.max_pack_size = max_pack_size
+        self.buffer = bytearray()
+        self.members = []
+        self.packs = 0
+        self.files = 0
+
+    def add(self, data, rel_path, entry):
+        """Add a file; returns a full pack (name, data, members) or None"""
+        full = None
+        if self.buffer and len(self.buffer) + len(data) > self.max_pack_size:
+            full = self.flush()
+        entry["pack"] = f"{self.snapshot}_{self.packs + 1:04d}.pack"
+        entry["offset"] = len(self.buffer)
+        self.buffer += data
+        self.members.append((rel_path, entry))
+        self.files += 1
+        return full
+
+    def flush(self):
+        """Get the pending pack (name, data, members), or None when empty"""
+        if not self.members:
+            return None
+        self.packs += 1
+        pack = (
+            f"{self.snapshot}_{self.packs:04d}.pack",
+            bytes(self.buffer),
+            self.members,
+        )
+        self.buffer = bytearray()
+        self.members = []
+        return pack
+
+
+def open_backend(url, options=None):
+    """Connect to the backend a destination URL names"""
+    options = options or {}
+    parsed = urllib.parse.urlsplit(url)
+    scheme = parsed.scheme.lower()
+    path = urllib.parse.unquote(parsed.path)
+    if scheme == "file":
+        return LocalBackend(url, path)
+    if scheme == "sftp":
+        return SFTPBackend(url, parsed.hostname, parsed.port, parsed.username, path)
+    if scheme == "s3":
+        return S3Backend(
+            url,
+            parsed.netloc,
+            path,
+            options.get("s3_endpoint"),
+            options.get("max_workers", 4),
+        )
+    raise ValueError(f"unsupported destination '{url}'")
@@ -0,0 +1,423 @@
+"""
+SQLite catalog of every file version across the snapshots of a source
+backup_<name>/catalog.sqlite keeps one row per file *version* (path, size,
+mtime, hash) with the range of snapshots that contain it, so the catalog
+grows with the changes rather than with snapshots x files. Versions still
+in the latest snapshot have an open range, so a new snapshot only writes
+the rows of the files it changed. It is synced
+from the snapshot journals at the end of every run, in batched
+transactions, and answers find-by-name, version history and growth
+queries from indexes. Each path points at its latest version, and names
+are also kept in an FTS5 trigram index (when SQLite has one), so finding
+a name by any part of it does not scan every path.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+
+import journal
+
+CATALOG_FILE = "catalog.sqlite"
+BATCH_SIZE = 10000
+LIVE = 2**63 - 1  # last_snapshot of versions the latest snapshot still holds
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    files INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL COLLATE NOCASE,
+    latest INTEGER
+);
+CREATE INDEX IF NOT EXISTS paths_name ON paths (name);
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    path_id INTEGER NOT NULL REFERENCES paths (id),
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    first_snapshot INTEGER NOT NULL,
+    last_snapshot INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_path ON versions (path_id, first_snapshot);
+CREATE INDEX IF NOT EXISTS versions_first ON versions (first_snapshot);
+CREATE INDEX IF NOT EXISTS versions_last ON versions (last_snapshot);
+"""
+
+# External-content index of paths.name; new paths are added per batch and
+# removed ones by the trigger
+NAME_INDEX = """
+CREATE VIRTUAL TABLE IF NOT EXISTS paths_fts USING fts5(
+    name, content='paths', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS paths_fts_delete AFTER DELETE ON paths BEGIN
+    INSERT INTO paths_fts (paths_fts, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+"""
+
+STAGING = """
+CREATE TEMP TABLE staged_closed (version_id INTEGER PRIMARY KEY);
+CREATE TEMP TABLE staged_added (
+    path TEXT, name TEXT, size INTEGER, mtime_ns INTEGER, hash TEXT
+);
+"""
+
+
+def get_catalog_path(backup_root):
+    """Get the catalog database of a backup_<name> root"""
+    return os.path.join(backup_root, CATALOG_FILE)
+
+
+def content_hash(entry):
+    """Get a content hash for a journal entry, if the backup knows one"""
+    if "sha256" in entry:
+        return entry["sha256"]
+    if "chunks" in entry:
+        # The chunk list identifies the content as well as a file hash would
+        return "chunks:" + hashlib.sha256("".join(entry["chunks"]).encode()).hexdigest()
+    return None
+
+
+class Catalog:
+    """Indexed history of the files of one backup_<name> root"""
+
+    def __init__(self, backup_root):
+        self.backup_root = backup_root
+        self.db = sqlite3.connect(get_catalog_path(backup_root))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.executescript(STAGING)
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            with self.db:
+                self._migrate(version)
+                self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.name_index = self._open_name_index()
+
+    def _migrate(self, version):
+        if version < 1:
+            # Older catalogs closed the live versions at the latest snapshot
+            self.db.execute(
+                "UPDATE versions SET last_snapshot = ? "
+                "WHERE last_snapshot = (SELECT MAX(id) FROM snapshots)",
+                (LIVE,),
+            )
+        if version < 2:
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(paths)")]
+            if "latest" not in columns:
+                self.db.execute("ALTER TABLE paths ADD COLUMN latest INTEGER")
+            self.db.execute(
+                "UPDATE paths SET latest = "
+                "(SELECT MAX(id) FROM versions WHERE path_id = paths.id)"
+            )
+
+    def _open_name_index(self):
+        """Create the trigram index of names; False when SQLite lacks FTS5"""
+        exists = self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'paths_fts'"
+        ).fetchone()
+        try:
+            with self.db:
+                self.db.executescript(NAME_INDEX)
+                if not exists:
+                    self.db.execute(
+                        "INSERT INTO paths_fts (paths_fts) VALUES ('rebuild')"
+                    )
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def snapshot_ids(self):
+        """Map snapshot name -> id, in the order snapshots were added"""
+        return dict(self.db.execute("SELECT name, id FROM snapshots ORDER BY id"))
+
+    def sync(self, changes=None):
+        """Bring the catalog in line with the snapshot journals
+
+        New snapshots are appended; pruned ones are forgotten. If an older
+        snapshot shows up that the catalog skipped, it is rebuilt, since
+        version ranges rely on snapshots being added in time order.
+        changes are the changed files of the newest snapshot (watch mode).
+        """
+        snapshots = journal.list_snapshots(self.backup_root)
+        known = self.snapshot_ids()
+        gone = [name for name in known if name not in set(snapshots)]
+        if gone:
+            self.forget(gone)
+            known = self.snapshot_ids()
+
+        missing = [name for name in snapshots if name not in known]
+        if missing and known and missing[0] < max(known):
+            logging.info("🗂️  Catalog is out of order, rebuilding it")
+            self.rebuild()
+            return len(snapshots)
+
+        for name in missing:
+            _, files = journal.load_journal(self.backup_root, name)
+            self.add_snapshot(name, files, changes if len(missing) == 1 else None)
+        return len(missing)
+
+    def rebuild(self):
+        """Recreate the catalog from all snapshot journals"""
+        with self.db:
+            self.db.execute("DELETE FROM versions")
+            self.db.execute("DELETE FROM paths")
+            self.db.execute("DELETE FROM snapshots")
+        for name in journal.list_snapshots(self.backup_root):
+            _, files = journal.load_journal(self.backup_root, name)
+            self.add_snapshot(name, files)
+
+    def add_snapshot(self, name, files, changes=None):
+        """Record a snapshot, closing the versions it replaced and adding new ones
+
+        Unchanged versions stay live without being written. changes (watch
+        mode) limits the comparison to the changed files.
+        """
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO snapshots (name, files, bytes) VALUES (?, ?, ?)",
+                (name, len(files), sum(e["size"] for e in files.values())),
+            )
+        snapshot_id = cursor.lastrowid
+
+        previous_id = self.db.execute(
+            "SELECT MAX(id) FROM snapshots WHERE id < ?", (snapshot_id,)
+        ).fetchone()[0]
+        if previous_id is None or (changes is not None and "" in changes):
+            changes = None
+        if changes is not None:
+            files = {
+                rel_path: files[rel_path] for rel_path in changes if rel_path in files
+            }
+        live = {}
+        if previous_id is not None:
+            for version_id, path, size, mtime_ns, digest in self._live_versions(
+                changes
+            ):
+                live[path] = (version_id, size, mtime_ns, digest)
+
+        closed = []
+        added = []
+        for rel_path, entry in files.items():
+            path = rel_path.replace(os.sep, "/")
+            digest = content_hash(entry)
+            known = live.pop(path, None)
+            if (
+                known
+                and known[1] == entry["size"]
+                and known[2] == entry["mtime_ns"]
+                and (known[3] is None or digest is None or known[3] == digest)
+            ):
+                continue
+            if known:
+                closed.append((known[0],))
+            name = path.rsplit("/", 1)[-1]
+            added.append((path, name, entry["size"], entry["mtime_ns"], digest))
+
+            if len(closed) >= BATCH_SIZE or len(added) >= BATCH_SIZE:
+                self._write_batch(snapshot_id, previous_id, closed, added)
+                closed, added = [], []
+        # Whatever is left was removed from the source
+        closed.extend((known[0],) for known in live.values())
+        self._write_batch(snapshot_id, previous_id, closed, added)
+
+    def _live_versions(self, changes=None):
+        """Yield (id, path, size, mtime_ns, hash) of the live versions
+
+        With changes, only those of the changed paths and the files under them.
+        """
+        query = (
+            "SELECT v.id, p.path, v.size, v.mtime_ns, v.hash FROM versions v "
+            "JOIN paths p ON p.id = v.path_id "
+        )
+        if changes is None:
+            yield from self.db.execute(query + "WHERE v.last_snapshot = ?", (LIVE,))
+            return
+        for change in changes:
+            path = change.replace(os.sep, "/")
+            # "/" sorts right before "0", so the range holds what lies under
+            # path; +v.last_snapshot keeps SQLite on the path index
+            yield from self.db.execute(
+                query + "WHERE (p.path = ? OR (p.path > ? AND p.path < ?)) "
+                "AND +v.last_snapshot = ?",
+                (path, path + "/", path + "0", LIVE),
+            )
+
+    def _write_batch(self, snapshot_id, previous_id, closed, added):
+        # Rows go through temp tables so the joins run inside SQLite
+        # instead of one statement per file
+        with self.db:
+            self.db.executemany("INSERT INTO staged_closed VALUES (?)", closed)
+            self.db.execute(
+                "UPDATE versions SET last_snapshot = ? "
+                "WHERE id IN (SELECT version_id FROM staged_closed)",
+                (previous_id,),
+            )
+            self.db.executemany(
+                "INSERT INTO staged_added VALUES (?, ?, ?, ?, ?)", added
+            )
+            last_path, last_version = self.db.execute(
+                "SELECT (SELECT MAX(id) FROM paths), (SELECT MAX(id) FROM versions)"
+            ).fetchone()
+            self.db.execute(
+                "INSERT OR IGNORE INTO paths (path, name) "
+                "SELECT path, name FROM staged_added"
+            )
+            if self.name_index:
+                self.db.execute(
+                    "INSERT INTO paths_fts (rowid, name) "
+                    "SELECT id, name FROM paths WHERE id > ?",
+                    (last_path or 0,),
+                )
+            self.db.execute(
+                "INSERT INTO versions "
+                "(path_id, size, mtime_ns, hash, first_snapshot, last_snapshot) "
+                "SELECT p.id, s.size, s.mtime_ns, s.hash, ?, ? "
+                "FROM staged_added s JOIN paths p ON p.path = s.path",
+                (snapshot_id, LIVE),
+            )
+            # Versions are added in snapshot order: the new ones are the latest
+            self.db.execute(
+                "UPDATE paths SET latest = "
+                "(SELECT MAX(id) FROM versions WHERE path_id = paths.id) "
+                "WHERE id IN (SELECT path_id FROM versions WHERE id > ?)",
+                (last_version or 0,),
+            )
+            self.db.execute("DELETE FROM staged_closed")
+            self.db.execute("DELETE FROM staged_added")
+
+    def forget(self, names):
+        """Drop pruned snapshots and the versions no remaining snapshot holds"""
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM snapshots WHERE name = ?", ((n,) for n in names)
+            )
+            self.db.execute(
+                "DELETE FROM versions WHERE NOT EXISTS (SELECT 1 FROM snapshots s "
+                "WHERE s.id BETWEEN versions.first_snapshot AND versions.last_snapshot)"
+            )
+            # Versions closed by a pruned newest snapshot are live again
+            self.db.execute(
+                "UPDATE versions SET last_snapshot = ? WHERE last_snapshot < ? "
+                "AND last_snapshot >= (SELECT MAX(id) FROM snapshots)",
+                (LIVE, LIVE),
+            )
+            self.db.execute(
+                "UPDATE paths SET latest = "
+                "(SELECT MAX(id) FROM versions WHERE path_id = paths.id) "
+                "WHERE NOT EXISTS (SELECT 1 FROM versions WHERE id = paths.latest)"
+            )
+            self.db.execute("DELETE FROM paths WHERE latest IS NULL")
+
+    def _snapshot_range(self, first_id, last_id):
+        """Get the names of the first and last surviving snapshots of a range"""
+        row = self.db.execute(
+            "SELECT MIN(id), MAX(id) FROM snapshots WHERE id BETWEEN ? AND ?",
+            (first_id, last_id),
+        ).fetchone()
+        names = dict(
+            self.db.execute(
+                "SELECT id, name FROM snapshots WHERE id IN (?, ?)", row
+            ).fetchall()
+        )
+        return names.get(row[0]), names.get(row[1])
+
+    def find(self, pattern, limit=100):
+        """Find the latest version of files whose name matches a glob
+
+        A pattern without wildcards matches any name containing it. The
+        trigram index answers patterns with three or more characters in a
+        row without scanning; it cannot take an ESCAPE clause, so there
+        literal % and _ act as wildcards and the exact match narrows it down.
+        """
+        glob = pattern.replace("*", "%").replace("?", "_")
+        like = pattern.replace("\\", "\\\\").replace("%", r"\%").replace("_", r"\_")
+        like = like.replace("*", "%").replace("?", "_")
+        if "*" not in pattern and "?" not in pattern:
+            glob, like = f"%{glob}%", f"%{like}%"
+        query = (
+            "SELECT p.path, v.size, v.mtime_ns, v.first_snapshot, v.last_snapshot "
+            "FROM paths p JOIN versions v ON v.id = p.latest "
+            "WHERE p.name LIKE ? ESCAPE '\\' "
+        )
+        params = [like]
+        if self.name_index:
+            query += "AND p.id IN (SELECT rowid FROM paths_fts WHERE name LIKE ?) "
+            params.append(glob)
+        # +p.path keeps SQLite from walking the path index to avoid a sort
+        rows = self.db.execute(
+            query + "ORDER BY +p.path LIMIT ?", (*params, limit)
+        ).fetchall()
+        return [
+            (path, size, mtime_ns, *self._snapshot_range(first, last))
+            for path, size, mtime_ns, first, last in rows
+        ]
+
+    def history(self, path):
+        """List the versions of one file, oldest first"""
+        rows = self.db.execute(
+            "SELECT v.size, v.mtime_ns, v.hash, v.first_snapshot, v.last_snapshot "
+            "FROM versions v JOIN paths p ON p.id = v.path_id "
+            "WHERE p.path = ? ORDER BY v.first_snapshot",
+            (path.replace(os.sep, "/").strip("/"),),
+        ).fetchall()
+        return [
+            (size, mtime_ns, digest, *self._snapshot_range(first, last))
+            for size, mtime_ns, digest, first, last in rows
+        ]
+
+    def growth(self, since=None, until=None, limit=20):
+        """List the files that grew the most between two snapshots
+
+        Defaults to the last two snapshots. Only versions created after
+        `since` can have grown, so the index on first_snapshot keeps this
+        fast however many files are unchanged.
+        """
+        ids = self.snapshot_ids()
+        names = list(ids)
+        if len(names) < 2 and not since:
+            return None, None, []
+        until = until or names[-1]
+        since = since or names[names.index(until) - 1]
+        if since not in ids or until not in ids:
+            raise ValueError("unknown snapshot")
+
+        rows = self.db.execute(
+            "SELECT p.path, COALESCE(a.size, 0), b.size, b.size - COALESCE(a.size, 0) "
+            "AS grown FROM versions b JOIN paths p ON p.id = b.path_id "
+            "LEFT JOIN versions a ON a.path_id = b.path_id "
+            "AND ? BETWEEN a.first_snapshot AND a.last_snapshot "
+            "WHERE b.first_snapshot > ? AND b.first_snapshot <= ? "
+            "AND b.last_snapshot >= ? AND grown > 0 ORDER BY grown DESC LIMIT ?",
+            (ids[since], ids[since], ids[until], ids[until], limit),
+        ).fetchall()
+        return since, until, rows
+
+
+def update_catalog(backup_root, changes=None):
+    """Sync the catalog of a backup root after a run, logging failures"""
+    try:
+        with Catalog(backup_root) as catalog:
+            added = catalog.sync(changes)
+        if added:
+            logging.info(f"🗂️  Catalog updated with {added} snapshot(s)")
+    except sqlite3.Error as e:
+        logging.warning(f"⚠️  Could not update the catalog: {e}")
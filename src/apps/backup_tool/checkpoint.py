@@ -0,0 +1,174 @@
+"""
+Checkpoint journal for resumable backups
+While a run is in progress, every completed file is appended to
+backup_<name>/.checkpoint/<timestamp>.log before the run moves on. If the run
+is interrupted, the next one finds the log, reuses the same timestamp and
+skips the files it already lists. The log is removed once the snapshot
+journal is saved.
+
+Records are written in batches, each only after the data it vouches for
+(copied files, open archive or pack files) has been synced to disk, so a
+reboot can cost the last few seconds of work but never leaves the log
+pointing at data that was lost.
+"""
+
+import json
+import logging
+import os
+import time
+
+CHECKPOINT_DIR = ".checkpoint"
+FSYNC_INTERVAL = 2.0  # seconds between fsyncs of the log
+SYNC_ALL_FILES = 64  # from this many files per batch, one os.sync() is cheaper
+
+
+def get_checkpoint_dir(backup_root):
+    """Get the folder holding in-progress checkpoints of a backup_<name> root"""
+    return os.path.join(backup_root, CHECKPOINT_DIR)
+
+
+def find_unfinished(backup_root):
+    """Get (snapshot, header) of an interrupted run, or (None, None)"""
+    checkpoint_dir = get_checkpoint_dir(backup_root)
+    if not os.path.isdir(checkpoint_dir):
+        return None, None
+
+    logs = sorted(name for name in os.listdir(checkpoint_dir) if name.endswith(".log"))
+    if not logs:
+        return None, None
+
+    snapshot = logs[-1][: -len(".log")]
+    try:
+        with open(os.path.join(checkpoint_dir, logs[-1]), "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+    except (OSError, ValueError):
+        header = {}
+    return snapshot, header
+
+
+class Checkpoint:
+    """Append-only log of the files a run has finished"""
+
+    def __init__(self, backup_root, snapshot, header=None):
+        self.path = os.path.join(get_checkpoint_dir(backup_root), f"{snapshot}.log")
+        self.completed = {}
+        self.members = {}  # relative path -> archive member
+        self.resuming = os.path.exists(self.path)
+
+        if self.resuming:
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self.fp = open(self.path, "a", encoding="utf-8")
+        self.last_sync = time.monotonic()
+        self.pending = []
+        self.dirty = []
+        self.syncers = []
+        if not self.resuming:
+            header = {"snapshot": snapshot, "started": time.time(), **(header or {})}
+            self.fp.write(json.dumps(header) + "\n")
+            self.commit()
+
+    def _load(self):
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            valid_size += len(f.readline())  # header
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn last line from a crash: that file is redone
+                record = json.loads(line)
+                self.completed[record["path"]] = record["entry"]
+                if "member" in record:
+                    self.members[record["path"]] = record["member"]
+                valid_size += len(line)
+
+        # Cut the torn tail so new records start on a clean line
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_size)
+
+        logging.info(
+            f"⏯️  Resuming interrupted run: {len(self.completed)} files already done"
+        )
+
+    def add_syncer(self, sync):
+        """Register a callable flushing an open data file (archive, pack)"""
+        self.syncers.append(sync)
+
+    def record(self, rel_path, entry, member=None, paths=()):
+        """Log a finished file (call only from the collecting thread)
+
+        paths are the files holding its data; the record reaches the log
+        with the next batch, once they and the registered writers are synced.
+        """
+        record = {"path": rel_path, "entry": entry}
+        if member is not None:
+            record["member"] = member
+        self.pending.append(record)
+        self.dirty.extend(paths)
+        if time.monotonic() - self.last_sync >= FSYNC_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        """Sync the data of the pending records, then log and sync them"""
+        if self.pending:
+            for sync in self.syncers:
+                sync()
+            sync_files(self.dirty)
+            for record in self.pending:
+                self.fp.write(json.dumps(record) + "\n")
+            self.pending = []
+            self.dirty = []
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        """Flush the log to disk, keeping it for a later resume"""
+        if not self.fp.closed:
+            self.commit()
+            self.fp.close()
+
+    def complete(self):
+        """Drop the log once the snapshot journal has been written"""
+        self.pending = []
+        self.dirty = []
+        self.close()
+        os.remove(self.path)
+
+
+def sync_files(paths):
+    """Flush the data of written files to disk"""
+    if not paths:
+        return
+    if len(paths) >= SYNC_ALL_FILES and hasattr(os, "sync"):
+        os.sync()
+        return
+    # Windows only flushes handles opened for writing
+    flags = os.O_RDWR | getattr(os, "O_BINARY", 0) if os.name == "nt" else os.O_RDONLY
+    for path in paths:
+        try:
+            fd = os.open(path, flags)
+        except (FileNotFoundError, PermissionError):
+            continue  # replaced meanwhile, or read-only on Windows
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def read_completed(backup_root, snapshot):
+    """Get the entries an interrupted run finished, without touching its log"""
+    completed = {}
+    path = os.path.join(get_checkpoint_dir(backup_root), f"{snapshot}.log")
+    try:
+        with open(path, "rb") as f:
+            f.readline()  # header
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                record = json.loads(line)
+                completed[record["path"]] = record["entry"]
+    except (OSError, ValueError):
+        pass
+    return completed
@@ -0,0 +1,217 @@
+"""
+Content-addressed chunk store for the Backup Tool
+Splits files with content-defined chunking and keeps every unique chunk once
+in backup_<name>/.chunks, shared by all snapshots. The snapshot journal lists
+the chunks of each file, so a snapshot is only a small manifest.
+"""
+
+import hashlib
+import os
+import random
+import threading
+import uuid
+
+import journal
+
+CHUNKS_DIR = ".chunks"
+
+# Chunk size bounds: cuts are searched after MIN_CHUNK_SIZE and forced at
+# MAX_CHUNK_SIZE, with an average of about MIN_CHUNK_SIZE + 2**WINDOW_BITS.
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+WINDOW_BITS = 20
+READ_SIZE = 8 * 1024 * 1024
+
+# Rolling hash: every byte contributes one pseudo-random bit, and the hash is
+# the last WINDOW_BITS bits. A cut happens where the hash is zero. Mapping the
+# bytes with translate() and searching the zero run with find() keeps the scan
+# in C instead of a per-byte Python loop.
+_rng = random.Random(0x5EED)
+_bits = [0] * 128 + [1] * 128
+_rng.shuffle(_bits)
+ROLLING_TABLE = bytes(_bits)
+
+
+def find_cut(
+    buffer,
+    eof,
+    min_size=MIN_CHUNK_SIZE,
+    max_size=MAX_CHUNK_SIZE,
+    window_bits=WINDOW_BITS,
+):
+    """Get the length of the next chunk in buffer, or None if more data is needed"""
+    if len(buffer) < max_size and not eof:
+        return None
+    if len(buffer) <= min_size:
+        return len(buffer)
+
+    window = buffer[min_size - window_bits : max_size]
+    pos = window.translate(ROLLING_TABLE).find(b"\x00" * window_bits)
+    if pos >= 0:
+        return min_size + pos
+    return min(len(buffer), max_size)
+
+
+def iter_chunks(
+    file_obj,
+    min_size=MIN_CHUNK_SIZE,
+    max_size=MAX_CHUNK_SIZE,
+    window_bits=WINDOW_BITS,
+):
+    """Yield content-defined chunks of a binary file
+
+    The size parameters let other users (delta transfer) cut finer blocks
+    with the same rolling hash.
+    """
+    buffer = bytearray()
+    eof = False
+
+    while not eof or buffer:
+        if not eof:
+            data = file_obj.read(READ_SIZE)
+            if data:
+                buffer += data
+            else:
+                eof = True
+
+        while buffer:
+            cut = find_cut(buffer, eof, min_size, max_size, window_bits)
+            if cut is None:
+                break
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+
+
+class ChunkStore:
+    """Stores chunks by SHA-256 and rebuilds files from chunk lists"""
+
+    def __init__(self, backup_root, throttle=None):
+        self.backup_root = backup_root
+        self.throttle = throttle
+        self.chunks_dir = os.path.join(backup_root, CHUNKS_DIR)
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.chunks_seen = 0
+        self.chunks_new = 0
+        self.bytes_seen = 0
+        self.bytes_new = 0
+        self.files_appended = 0
+
+    def chunk_path(self, digest):
+        """Get the path of a chunk (fanned out by the first two hex digits)"""
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def put_chunk(self, data):
+        """Store a chunk if it is new and return its digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        is_new = not os.path.exists(path)
+
+        if is_new:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self.chunks_seen += 1
+            self.bytes_seen += len(data)
+            if is_new:
+                self.chunks_new += 1
+                self.bytes_new += len(data)
+        return digest
+
+    def store_file(self, source_path, entry):
+        """Chunk a file into the store and record its chunk list in entry"""
+        size = 0
+        chunks = []
+        with open(source_path, "rb") as f:
+            for data in iter_chunks(self.throttle.reader(f) if self.throttle else f):
+                chunks.append(self.put_chunk(data))
+                size += len(data)
+        entry["chunks"] = chunks
+        return size
+
+    def append_file(self, source_path, entry, previous_entry):
+        """Chunk only the tail of a file that grew since previous_entry
+
+        Cut points depend only on the data after the previous cut, so
+        chunking again from the start of the old last chunk gives the same
+        list as chunking the whole file. The digests of the first and the
+        old last chunk check that the old part is unchanged; if either does
+        not match, the whole file is stored.
+        """
+        chunks = previous_entry["chunks"]
+        if not chunks or not all(
+            os.path.exists(self.chunk_path(d)) for d in (chunks[0], chunks[-1])
+        ):
+            return self.store_file(source_path, entry)
+
+        first_size = os.path.getsize(self.chunk_path(chunks[0]))
+        start = previous_entry["size"] - os.path.getsize(self.chunk_path(chunks[-1]))
+        size = 0
+        new_chunks = []
+        with open(source_path, "rb") as f:
+            reader = self.throttle.reader(f) if self.throttle else f
+            if len(chunks) > 1:
+                first = reader.read(first_size)
+                if hashlib.sha256(first).hexdigest() != chunks[0]:
+                    return self.store_file(source_path, entry)
+
+            f.seek(start)
+            last = reader.read(previous_entry["size"] - start)
+            if hashlib.sha256(last).hexdigest() != chunks[-1]:
+                return self.store_file(source_path, entry)
+
+            f.seek(start)
+            for data in iter_chunks(reader):
+                new_chunks.append(self.put_chunk(data))
+                size += len(data)
+        entry["chunks"] = chunks[:-1] + new_chunks
+        with self._lock:
+            self.files_appended += 1
+        return size
+
+    def restore_file(self, entry, dest_path):
+        """Rebuild a file from its chunk list"""
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        with open(dest_path, "wb") as out:
+            for digest in entry["chunks"]:
+                with open(self.chunk_path(digest), "rb") as f:
+                    out.write(f.read())
+        os.utime(dest_path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        return entry["size"]
+
+
+def dedup_report(backup_root):
+    """Compare logical snapshot size with the bytes really kept in the store"""
+    store_dir = os.path.join(backup_root, CHUNKS_DIR)
+    snapshots = journal.list_snapshots(backup_root)
+    logical_bytes = 0
+    referenced = set()
+
+    for snapshot in snapshots:
+        _, files = journal.load_journal(backup_root, snapshot)
+        for entry in files.values():
+            if "chunks" in entry:
+                logical_bytes += entry["size"]
+                referenced.update(entry["chunks"])
+
+    stored_bytes = 0
+    stored_chunks = 0
+    if os.path.isdir(store_dir):
+        for root, _, names in os.walk(store_dir):
+            for name in names:
+                if not name.endswith(".tmp"):
+                    stored_chunks += 1
+                    stored_bytes += os.path.getsize(os.path.join(root, name))
+
+    return {
+        "snapshots": len(snapshots),
+        "logical_bytes": logical_bytes,
+        "stored_bytes": stored_bytes,
+        "stored_chunks": stored_chunks,
+        "referenced_chunks": len(referenced),
+        "dedup_ratio": logical_bytes / stored_bytes if stored_bytes else 0.0,
+    }
@@ -0,0 +1,128 @@
+"""
+Delta transfer for large modified files
+Like rsync, a big file that changed is rebuilt from the copy kept by the
+previous snapshot: both versions are cut into content-defined blocks (the
+chunk store's rolling hash, so inserted bytes only shift the boundaries
+around them), blocks the old copy already has are reused and only the new
+blocks are written.
+
+The new file starts as a reflink clone of the old copy where the filesystem
+allows it (Btrfs, XFS), so unchanged blocks at the same offset cost nothing.
+Moved blocks are copied with copy_file_range, which shares extents on those
+filesystems and runs server-side on NFS/SMB destinations.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+
+import fast_copy
+from chunk_store import iter_chunks
+
+# Finer blocks than the chunk store (about 128 KiB on average), so a small
+# edit only rewrites a little data around it
+BLOCK_MIN_SIZE = 64 * 1024
+BLOCK_MAX_SIZE = 512 * 1024
+BLOCK_WINDOW_BITS = 16
+
+
+def iter_blocks(file_obj):
+    """Yield the delta blocks of a binary file"""
+    return iter_chunks(file_obj, BLOCK_MIN_SIZE, BLOCK_MAX_SIZE, BLOCK_WINDOW_BITS)
+
+
+def block_signatures(file_obj):
+    """Map sha256 -> (offset, length) of the content-defined blocks of a file"""
+    signatures = {}
+    offset = 0
+    for block in iter_blocks(file_obj):
+        signatures.setdefault(hashlib.sha256(block).digest(), (offset, len(block)))
+        offset += len(block)
+    return signatures
+
+
+def copy_range(old, new, src_offset, dst_offset, length):
+    """Copy a byte range from the old copy into the new file"""
+    if hasattr(os, "copy_file_range"):
+        try:
+            while length > 0:
+                sent = os.copy_file_range(
+                    old.fileno(), new.fileno(), length, src_offset, dst_offset
+                )
+                if sent == 0:
+                    break
+                src_offset += sent
+                dst_offset += sent
+                length -= sent
+            return
+        except OSError as e:
+            if e.errno not in fast_copy.UNSUPPORTED_ERRNOS:
+                raise
+
+    old.seek(src_offset)
+    write_at(new, dst_offset, old.read(length))
+
+
+def write_at(new, offset, data):
+    """Write data at offset of an unbuffered file, looping on short writes"""
+    new.seek(offset)
+    view = memoryview(data)
+    while view:
+        view = view[new.write(view) :]
+
+
+class DeltaCopier:
+    """Rebuilds new versions of large files from their previous copies"""
+
+    def __init__(self, min_size, throttle=None):
+        self.min_size = min_size
+        self.throttle = throttle
+        self._lock = threading.Lock()
+        self.files = 0
+        self.bytes_reused = 0
+        self.bytes_written = 0
+
+    def wants(self, stat_result, previous_path):
+        """Check if a file is worth a delta against its previous copy"""
+        return (
+            self.min_size > 0
+            and stat_result.st_size >= self.min_size
+            and previous_path is not None
+            and os.path.isfile(previous_path)
+        )
+
+    def copy(self, source_path, dest_path, previous_path):
+        """Write source_path to dest_path reusing previous_path (runs on a worker)"""
+        reused = written = 0
+        with open(previous_path, "rb") as old:
+            signatures = block_signatures(self._reader(old))
+
+            with open(dest_path, "wb", buffering=0) as new:
+                cloned = fast_copy.clone_file(old, new)
+                with open(source_path, "rb") as src:
+                    offset = 0
+                    for block in iter_blocks(self._reader(src)):
+                        length = len(block)
+                        match = signatures.get(hashlib.sha256(block).digest())
+                        if match and match[1] == length:
+                            if not (cloned and match[0] == offset):
+                                copy_range(old, new, match[0], offset, length)
+                            reused += length
+                        else:
+                            if self.throttle:
+                                self.throttle.acquire(length)
+                            write_at(new, offset, block)
+                            written += length
+                        offset += length
+                new.truncate(offset)
+
+        shutil.copystat(source_path, dest_path)
+        with self._lock:
+            self.files += 1
+            self.bytes_reused += reused
+            self.bytes_written += written
+        return offset
+
+    def _reader(self, file_obj):
+        return self.throttle.reader(file_obj) if self.throttle else file_obj
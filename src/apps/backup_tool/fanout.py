@@ -0,0 +1,127 @@
+"""
+Read-once, write-many copies for multi-destination backups
+When a source is backed up to several volumes (local disk and a NAS), each
+file is read once and every buffer is handed to one writer per destination
+at the same time, so the source is not read again per destination and a
+slow volume does not hold the others back by more than one buffer.
+
+A destination that fails is dropped for that file only; the copies to the
+other destinations carry on. Write time and bytes are kept per destination.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+BUFFER_SIZE = 8 * 1024 * 1024
+
+
+class DestinationStats:
+    """Bytes and write time of one destination (updated by writer threads)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.write_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, nbytes, seconds):
+        with self._lock:
+            self.bytes += nbytes
+            self.write_time += seconds
+
+    @property
+    def throughput_mb_s(self):
+        """Write throughput of this destination in MB/s"""
+        if self.write_time <= 0:
+            return 0.0
+        return self.bytes / (1024 * 1024) / self.write_time
+
+
+def write_all(fd, data):
+    """Write a whole buffer to a raw fd, looping on short writes"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+class FanOutCopier:
+    """Copies files to several destinations with a single read of each"""
+
+    def __init__(self, destinations, max_workers, throttle=None):
+        self.stats = [DestinationStats(name) for name in destinations]
+        self.throttle = throttle
+        # One writer per destination for every copy worker
+        self.writers = ThreadPoolExecutor(
+            max_workers=max(1, max_workers) * len(destinations)
+        )
+
+    def close(self):
+        self.writers.shutdown()
+
+    def _write(self, index, fd, data):
+        started = time.perf_counter()
+        write_all(fd, data)
+        self.stats[index].add(len(data), time.perf_counter() - started)
+
+    def copy(self, source_path, targets, failures, checksum=None):
+        """Copy source_path to each (index, dest_path) target (runs on a worker)
+
+        Failed targets end up in failures as index -> error; the copy only
+        raises when no destination could be written. A checksum dict gets
+        the "sha256" of the data read.
+        """
+        digest = hashlib.sha256() if checksum is not None else None
+        fds = {}
+        for index, dest_path in targets:
+            try:
+                fds[index] = os.open(
+                    dest_path,
+                    os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+                    0o666,
+                )
+            except OSError as e:
+                failures[index] = e
+
+        size = 0
+        pending = {}
+        try:
+            with open(source_path, "rb") as src:
+                reader = self.throttle.reader(src) if self.throttle else src
+                data = reader.read(BUFFER_SIZE)
+                while data and fds:
+                    pending = {
+                        self.writers.submit(self._write, index, fd, data): index
+                        for index, fd in fds.items()
+                    }
+                    size += len(data)
+                    if digest is not None:
+                        digest.update(data)
+                    # Read the next buffer while the writers are busy
+                    data = reader.read(BUFFER_SIZE)
+                    wait(pending)
+                    for future, index in pending.items():
+                        if future.exception() is not None:
+                            failures[index] = future.exception()
+                            os.close(fds.pop(index))
+        finally:
+            wait(pending)  # never close an fd a writer is still using
+            for fd in fds.values():
+                os.close(fd)
+
+        if digest is not None and not data:  # every byte went through it
+            checksum["sha256"] = digest.hexdigest()
+        done = [(i, path) for i, path in targets if i not in failures]
+        if not done:
+            raise next(iter(failures.values()), OSError("no destination written"))
+        for index, dest_path in done:
+            try:
+                shutil.copystat(source_path, dest_path)
+            except OSError as e:
+                failures[index] = e
+        return size
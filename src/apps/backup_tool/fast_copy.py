@@ -0,0 +1,402 @@
+"""
+Fast file copy for the Backup Tool
+Uses the cheapest primitive the platform and filesystems allow, in order:
+reflink clone (FICLONE on Btrfs/XFS), os.copy_file_range, os.sendfile and
+finally a large-buffer read/write loop. Each copy reports the method used.
+With a throttle, data moves in THROTTLED_CHUNK_SIZE steps charged to it.
+
+Sparse files (VM images, database files) are copied extent by extent with
+SEEK_DATA/SEEK_HOLE instead: only the data is read and written, and the
+holes stay holes at the destination.
+
+RangeCopy splits one huge file into byte ranges that several workers copy
+at once with positional reads and writes, so a single file can use the
+bandwidth of striped or networked storage. Each range is read back after
+it is written and its CRC-32 compared with that of the source data.
+"""
+
+import abc
+import errno
+import os
+import shutil
+import sys
+import zlib
+
+from throttle import THROTTLED_CHUNK_SIZE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+BUFFER_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024 * 1024  # per copy_file_range/sendfile call
+RANGE_SIZE = 64 * 1024 * 1024  # per worker task of a RangeCopy
+
+# Errors meaning "this method does not work here", not "the copy failed"
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EBADF,
+    errno.ETXTBSY,
+}
+
+# (method, source device, destination device) pairs known not to work, so
+# the failed attempt is paid once per filesystem pair instead of per file
+_unsupported = set()
+
+
+def _reflink(src_fd, dst_fd, size, throttle=None):
+    if throttle:
+        throttle.acquire(0)  # metadata only: one operation, no data moved
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd, dst_fd, size, throttle=None):
+    step = THROTTLED_CHUNK_SIZE if throttle else CHUNK_SIZE
+    copied = 0
+    while copied < size:
+        count = min(step, size - copied)
+        if throttle:
+            throttle.acquire(count)
+        sent = os.copy_file_range(src_fd, dst_fd, count)
+        if sent == 0:
+            break
+        copied += sent
+
+
+def _sendfile(src_fd, dst_fd, size, throttle=None):
+    step = THROTTLED_CHUNK_SIZE if throttle else CHUNK_SIZE
+    copied = 0
+    while copied < size:
+        count = min(step, size - copied)
+        if throttle:
+            throttle.acquire(count)
+        sent = os.sendfile(dst_fd, src_fd, copied, count)
+        if sent == 0:
+            break
+        copied += sent
+
+
+def is_sparse(stat_result):
+    """Check if a file has fewer blocks allocated than its size needs"""
+    return (
+        SPARSE_SUPPORTED
+        and hasattr(stat_result, "st_blocks")
+        and stat_result.st_blocks * 512 < stat_result.st_size
+    )
+
+
+def iter_data_extents(fd, start, end):
+    """Yield (offset, length) of the data between start and end, skipping holes
+
+    Uses only the offsets lseek returns, never the file position, so
+    workers can share the fd.
+    """
+    offset = start
+    while offset < end:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return  # nothing but a hole up to end of file
+            raise
+        if data >= end:
+            return
+        hole = min(os.lseek(fd, data, os.SEEK_HOLE), end)
+        yield data, hole - data
+        offset = hole
+
+
+def copy_extent(src_fd, dst_fd, offset, length, throttle=None, crc=None):
+    """Copy a byte range to the same offset with pread/pwrite
+
+    With crc (a running CRC-32), returns it updated with the data copied.
+    """
+    step = THROTTLED_CHUNK_SIZE if throttle else BUFFER_SIZE
+    end = offset + length
+    while offset < end:
+        count = min(step, end - offset)
+        if throttle:
+            throttle.acquire(count)
+        data = os.pread(src_fd, count, offset)
+        if not data:
+            raise OSError("source file shrank during the copy")
+        if crc is not None:
+            crc = zlib.crc32(data, crc)
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(dst_fd, view, offset)
+            view = view[written:]
+            offset += written
+    return crc
+
+
+def crc_extent(fd, offset, length, crc=0):
+    """Update a running CRC-32 with a byte range of a file, read with pread"""
+    end = offset + length
+    while offset < end:
+        data = os.pread(fd, min(BUFFER_SIZE, end - offset), offset)
+        if not data:
+            break
+        crc = zlib.crc32(data, crc)
+        offset += len(data)
+    return crc
+
+
+def _sparse(src_fd, dst_fd, size, throttle=None):
+    for offset, length in iter_data_extents(src_fd, 0, size):
+        copy_extent(src_fd, dst_fd, offset, length, throttle)
+    # Extending the file leaves the trailing hole unallocated
+    os.ftruncate(dst_fd, size)
+
+
+def _buffered(src_fd, dst_fd, size, throttle=None, digest=None):
+    buffer = bytearray(THROTTLED_CHUNK_SIZE if throttle else BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(src_fd, "rb", buffering=0, closefd=False) as src, open(
+        dst_fd, "wb", closefd=False
+    ) as dst:
+        while True:
+            if throttle:
+                throttle.acquire(len(buffer))
+            read = src.readinto(buffer)
+            if not read:
+                break
+            if digest is not None:
+                digest.update(view[:read])
+            dst.write(view[:read])
+
+
+SPARSE_SUPPORTED = all(
+    hasattr(os, name) for name in ("SEEK_DATA", "SEEK_HOLE", "pread", "pwrite")
+)
+
+METHODS = []
+if fcntl is not None and sys.platform.startswith("linux"):
+    METHODS.append(("reflink", _reflink))
+if hasattr(os, "copy_file_range"):
+    METHODS.append(("copy_file_range", _copy_file_range))
+if hasattr(os, "sendfile") and os.name != "nt":
+    METHODS.append(("sendfile", _sendfile))
+
+
+def clone_file(src, dst):
+    """Make open file dst share the data of src (reflink); False if unsupported"""
+    if not METHODS or METHODS[0][0] != "reflink":
+        return False
+    devices = (os.fstat(src.fileno()).st_dev, os.fstat(dst.fileno()).st_dev)
+    if ("reflink", *devices) in _unsupported:
+        return False
+    try:
+        _reflink(src.fileno(), dst.fileno(), 0)
+        return True
+    except OSError as e:
+        if e.errno not in UNSUPPORTED_ERRNOS:
+            raise
+        _unsupported.add(("reflink", *devices))
+        return False
+
+
+def _copy_fastest(src_fd, dst_fd, size, sparse, devices, throttle=None):
+    """Copy with the first method that works for this filesystem pair"""
+    for name, func in METHODS:
+        if size == 0 or (name, *devices) in _unsupported:
+            continue
+        if sparse and name != "reflink":
+            continue
+        try:
+            func(src_fd, dst_fd, size, throttle)
+            return name
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            _unsupported.add((name, *devices))
+            # Start the next method from a clean, empty destination
+            os.lseek(src_fd, 0, os.SEEK_SET)
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+            os.ftruncate(dst_fd, 0)
+
+    if sparse and ("sparse", *devices) not in _unsupported:
+        try:
+            _sparse(src_fd, dst_fd, size, throttle)
+            return "sparse"
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            _unsupported.add(("sparse", *devices))
+            os.lseek(src_fd, 0, os.SEEK_SET)
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+            os.ftruncate(dst_fd, 0)
+    _buffered(src_fd, dst_fd, size, throttle)
+    return "buffered"
+
+
+def copy_file(source_path, dest_path, throttle=None, digest=None):
+    """Copy data and metadata of one file; returns (size, method)
+
+    With a hashlib digest, the data goes through a read/write loop that
+    feeds it (method "hashed"), since kernel-side copies never show the
+    bytes. Sparse files keep their extent copy and leave digest untouched.
+    """
+    with open(source_path, "rb") as src, open(dest_path, "wb") as dst:
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+        src_stat = os.fstat(src_fd)
+        size = src_stat.st_size
+        devices = (src_stat.st_dev, os.fstat(dst_fd).st_dev)
+        # Only a reflink keeps holes; the other methods would fill them in
+        sparse = size > 0 and is_sparse(src_stat)
+
+        if digest is not None and not sparse:
+            _buffered(src_fd, dst_fd, size, throttle, digest)
+            method = "hashed"
+        else:
+            method = _copy_fastest(src_fd, dst_fd, size, sparse, devices, throttle)
+
+    shutil.copystat(source_path, dest_path)
+    return size, method
+
+
+def preallocate(fd, size):
+    """Reserve size bytes for a file, so parallel writes do not fragment it"""
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+    os.ftruncate(fd, size)
+
+
+class RangedTask(abc.ABC):
+    """One file written as independent parts by several workers
+
+    Built on the caller's thread, which also calls range_done()/fail() as
+    parts come back; copy_range(*part) runs on the workers. Subclasses set
+    ranges and size, open src_fd/dst_fd and implement copy_range and finish.
+    """
+
+    supported = hasattr(os, "pread") and hasattr(os, "pwrite")
+    src_fd = None
+    dst_fd = None
+
+    def start(self, ranges):
+        self.ranges = ranges
+        self.remaining = len(ranges)
+        self.bytes_done = 0
+        self.failed = False
+
+    def range_done(self, size):
+        """Account for a finished part; returns the file size once all are in"""
+        self.remaining -= 1
+        self.bytes_done += size
+        if self.remaining:
+            return None
+        if self.failed:
+            self.close()
+            return None
+        return self.finish()
+
+    def fail(self):
+        """Account for a failed part; True for the first failure of the file"""
+        first = not self.failed
+        self.failed = True
+        self.remaining -= 1
+        if not self.remaining:
+            self.close()
+        return first
+
+    @abc.abstractmethod
+    def copy_range(self, *part):
+        """Process one part (runs on a worker); returns the bytes it handled"""
+
+    @abc.abstractmethod
+    def finish(self):
+        """Check and finalize the file once every part is in; returns its size"""
+
+    def close(self):
+        for name in ("src_fd", "dst_fd"):
+            fd = getattr(self, name)
+            if fd is not None:
+                os.close(fd)
+                setattr(self, name, None)
+
+
+class RangeCopy(RangedTask):
+    """One large file copied as byte ranges by several workers (pread/pwrite)"""
+
+    def __init__(self, source_path, dest_path, range_size=RANGE_SIZE, throttle=None):
+        self.source_path = source_path
+        self.dest_path = dest_path
+        self.throttle = throttle
+        self.src_fd = os.open(source_path, os.O_RDONLY)
+        try:
+            self.source_stat = os.fstat(self.src_fd)
+            self.size = self.source_stat.st_size
+            # Read access too, for the check of each written range
+            self.dst_fd = os.open(dest_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC)
+            self.sparse = is_sparse(self.source_stat)
+            if self.sparse:
+                os.ftruncate(self.dst_fd, self.size)  # all hole until written
+            else:
+                preallocate(self.dst_fd, self.size)
+        except OSError:
+            self.close()
+            raise
+        self.checks = {}  # range offset -> (source CRC-32, written CRC-32)
+        self.start(
+            [
+                (offset, min(range_size, self.size - offset))
+                for offset in range(0, self.size, range_size)
+            ]
+        )
+
+    def copy_range(self, offset, length):
+        """Copy one byte range at the same offset and read it back (runs on a worker)"""
+        extents = [(offset, length)]
+        if self.sparse:
+            extents = list(iter_data_extents(self.src_fd, offset, offset + length))
+        source_crc = written_crc = 0
+        for start, count in extents:
+            source_crc = copy_extent(
+                self.src_fd, self.dst_fd, start, count, self.throttle, source_crc
+            )
+        for start, count in extents:
+            written_crc = crc_extent(self.dst_fd, start, count, written_crc)
+        self.checks[offset] = (source_crc, written_crc)
+        return length
+
+    def finish(self):
+        """Check the reassembled file and give it the source's metadata
+
+        Every range must have been written in full and read back with the
+        CRC-32 of the source data it was copied from.
+        """
+        try:
+            if (
+                self.bytes_done != self.size
+                or os.fstat(self.dst_fd).st_size != self.size
+            ):
+                raise OSError(f"'{self.dest_path}' was not fully written")
+            for offset, _ in self.ranges:
+                source_crc, written_crc = self.checks.get(offset, (0, None))
+                if source_crc != written_crc:
+                    raise OSError(
+                        f"'{self.dest_path}' does not match its source "
+                        f"in the range at byte {offset}"
+                    )
+            current = os.stat(self.source_path)
+            if (current.st_size, current.st_mtime_ns) != (
+                self.source_stat.st_size,
+                self.source_stat.st_mtime_ns,
+            ):
+                raise OSError(f"'{self.source_path}' changed during the copy")
+        finally:
+            self.close()
+        shutil.copystat(self.source_path, self.dest_path)
+        return self.size
@@ -0,0 +1,215 @@
+"""
+Include/exclude rules for the Backup Tool
+Compiles the extension filter and a .backupignore file (gitignore-style globs
+plus max_size, min_size and modified_within rules) once per run into a
+matcher the walker asks about every folder and file.
+
+Example .backupignore:
+    # build output and dependencies
+    node_modules/
+    __pycache__/
+    *.tmp
+    /build/**
+    !build/keep.txt
+    max_size 2GB
+    modified_within 90d
+"""
+
+import logging
+import os
+import re
+import time
+
+DEFAULT_IGNORE_FILE = ".backupignore"
+
+SIZE_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4}
+TIME_UNITS = {"": 1, "S": 1, "M": 60, "H": 3600, "D": 86400, "W": 7 * 86400}
+SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*$")
+RULE_PATTERN = re.compile(
+    r"^(max_size|min_size|modified_within)\s*[:=]?\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)$"
+)
+
+
+def compile_extensions(allowed_extensions):
+    """Normalise the extension filter into a tuple for str.endswith (None = all)"""
+    if not allowed_extensions or "*" in allowed_extensions:
+        return None
+
+    return tuple(
+        (
+            ext.strip().lower()
+            if ext.strip().startswith(".")
+            else f".{ext.strip().lower()}"
+        )
+        for ext in allowed_extensions
+        if ext.strip()
+    )
+
+
+def parse_quantity(value, unit, units):
+    """Convert '500' + 'MB' style values using a unit table"""
+    factor = units.get(unit.upper())
+    if factor is None:
+        raise ValueError(f"unknown unit '{unit}'")
+    return float(value) * factor
+
+
+def parse_size(text):
+    """Convert a size such as '64MB' or '1.5 GB' into bytes"""
+    match = SIZE_PATTERN.match(str(text))
+    if not match:
+        raise ValueError(f"invalid size '{text}'")
+    return int(parse_quantity(match.group(1), match.group(2), SIZE_UNITS))
+
+
+def glob_to_regex(pattern):
+    """Translate a gitignore-style glob into a regex fragment"""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            parts.append("[^/]*")
+        elif c == "?":
+            parts.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                parts.append(f"[{body}]")
+                i = end
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return "".join(parts)
+
+
+def compile_glob(line):
+    """Compile one ignore line into (base_pattern, negated, dir_only)"""
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+
+    # Like gitignore, a slash anywhere but the end anchors to the source root
+    anchored = "/" in line
+    line = line.lstrip("/")
+    prefix = "^" if anchored else "^(?:.*/)?"
+
+    return prefix + glob_to_regex(line), negated, dir_only
+
+
+class BackupMatcher:
+    """Decides which folders to enter and which files to back up"""
+
+    def __init__(self, allowed_extensions=None, ignore_lines=(), now=None):
+        self.extensions = compile_extensions(allowed_extensions)
+        self.globs = []
+        self.max_size = None
+        self.min_size = None
+        self.min_mtime = None
+        now = time.time() if now is None else now
+
+        for raw_line in ignore_lines:
+            line = raw_line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            rule = RULE_PATTERN.match(line)
+            try:
+                if rule:
+                    name, value, unit = rule.groups()
+                    if name == "max_size":
+                        self.max_size = parse_quantity(value, unit, SIZE_UNITS)
+                    elif name == "min_size":
+                        self.min_size = parse_quantity(value, unit, SIZE_UNITS)
+                    else:
+                        window = parse_quantity(value, unit, TIME_UNITS)
+                        self.min_mtime = now - window
+                else:
+                    base, negated, dir_only = compile_glob(line)
+                    # The optional tail matches everything inside a matched folder
+                    regex = re.compile(base + "(/.*)?$")
+                    self.globs.append((regex, negated, dir_only, base))
+            except (ValueError, re.error) as e:
+                logging.warning(f"Ignoring invalid backup rule '{line}': {e}")
+
+        # Without negations, a single alternation answers in one regex call
+        self.combined = None
+        if self.globs and not any(negated for _, negated, _, _ in self.globs):
+            file_patterns = [
+                base + ("/.*$" if dir_only else "(?:/.*)?$")
+                for _, _, dir_only, base in self.globs
+            ]
+            dir_patterns = [base + "(?:/.*)?$" for _, _, _, base in self.globs]
+            self.combined = (
+                re.compile("|".join(f"(?:{p})" for p in file_patterns)),
+                re.compile("|".join(f"(?:{p})" for p in dir_patterns)),
+            )
+
+    def _is_ignored(self, path, is_dir):
+        if self.combined:
+            file_regex, dir_regex = self.combined
+            return bool((dir_regex if is_dir else file_regex).match(path))
+
+        # Last matching rule wins, as in gitignore
+        for regex, negated, dir_only, _ in reversed(self.globs):
+            match = regex.match(path)
+            if match and (is_dir or not dir_only or match.group(1)):
+                return not negated
+        return False
+
+    def include_dir(self, rel_path):
+        """Check if the walker should descend into a folder"""
+        if not self.globs:
+            return True
+        return not self._is_ignored(rel_path.replace(os.sep, "/"), True)
+
+    def include_file(self, rel_path, stat_result=None):
+        """Check if a file passes the extension filter and the ignore rules"""
+        if self.extensions and not rel_path.lower().endswith(self.extensions):
+            return False
+
+        if stat_result is not None:
+            if self.max_size is not None and stat_result.st_size > self.max_size:
+                return False
+            if self.min_size is not None and stat_result.st_size < self.min_size:
+                return False
+            if self.min_mtime is not None and stat_result.st_mtime < self.min_mtime:
+                return False
+
+        if self.globs and self._is_ignored(rel_path.replace(os.sep, "/"), False):
+            return False
+        return True
+
+
+def load_matcher(source_dir, allowed_extensions, ignore_file=DEFAULT_IGNORE_FILE):
+    """Build the matcher for a run from the config and the ignore file
+
+    A relative ignore_file is looked up inside source_dir.
+    """
+    lines = []
+    if ignore_file:
+        ignore_path = ignore_file
+        if not os.path.isabs(ignore_path):
+            ignore_path = os.path.join(source_dir, ignore_path)
+        if os.path.isfile(ignore_path):
+            with open(ignore_path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            logging.info(f"📋 Loaded backup rules from {ignore_path}")
+
+    return BackupMatcher(allowed_extensions, lines)
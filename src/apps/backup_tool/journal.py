@@ -0,0 +1,346 @@
+"""
+Snapshot journal for the Backup Tool
+Keeps one JSON record per snapshot with (path, size, mtime_ns, inode) of every
+file it contains, so the next run can tell which files changed. runs.jsonl
+next to the journals keeps the throughput of past runs for dry-run estimates.
+
+Watch-mode snapshots only change a few files, so their journal can be a
+delta: the entries that differ from a full "base" journal plus the paths
+removed since. Loading resolves the delta, and the parsed base stays in
+memory with a sorted index of its paths, so a batch writes and reads only
+the changes and finds the files under a changed folder without a scan.
+"""
+
+import bisect
+import datetime
+import json
+import os
+
+JOURNAL_DIR = ".journal"
+RUNS_FILE = "runs.jsonl"
+SNAPSHOT_TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+MAX_DELTA_SHARE = 0.25  # above this share of changed files a full journal is written
+BASE_CACHE_SIZE = 4  # parsed base journals kept in memory
+
+_bases = {}  # journal file -> [(mtime_ns, size), parsed record, sorted paths]
+
+
+def get_journal_dir(backup_root):
+    """Get the folder holding the journals of a backup_<name> root"""
+    return os.path.join(backup_root, JOURNAL_DIR)
+
+
+def list_snapshots(backup_root):
+    """List completed snapshots (oldest first) that have a journal"""
+    journal_dir = get_journal_dir(backup_root)
+    if not os.path.isdir(journal_dir):
+        return []
+
+    return sorted(
+        name[: -len(".json")]
+        for name in os.listdir(journal_dir)
+        if name.endswith(".json")
+    )
+
+
+def snapshot_time(snapshot):
+    """Get the time a snapshot was taken from its timestamp name, or None"""
+    try:
+        return datetime.datetime.strptime(snapshot[:19], SNAPSHOT_TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def journal_path(backup_root, snapshot):
+    """Get the journal file of a snapshot"""
+    return os.path.join(get_journal_dir(backup_root), f"{snapshot}.json")
+
+
+def read_record(backup_root, snapshot, keep=False):
+    """Read the raw record of a journal file
+
+    keep holds a full journal in memory (until the file changes), for the
+    deltas built on it. Cached records are shared: callers must not modify them.
+    """
+    path = journal_path(backup_root, snapshot)
+    stat_result = os.stat(path)
+    signature = (stat_result.st_mtime_ns, stat_result.st_size)
+    cached = _bases.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if keep and "base" not in data:
+        _bases.pop(path, None)
+        _bases[path] = [signature, data, None]
+        while len(_bases) > BASE_CACHE_SIZE:
+            del _bases[next(iter(_bases))]
+    return data
+
+
+def load_journal(backup_root, snapshot=None):
+    """Load the journal of a snapshot (latest one by default)
+
+    Returns (snapshot_name, files) or (None, {}) when there is no journal.
+    The entries may be shared with a cached base journal: callers replace
+    an entry instead of editing it in place.
+    """
+    if snapshot is None:
+        snapshots = list_snapshots(backup_root)
+        if not snapshots:
+            return None, {}
+        snapshot = snapshots[-1]
+
+    try:
+        data = read_record(backup_root, snapshot)
+        if "base" not in data:
+            return snapshot, dict(data.get("files", {}))
+        base = read_record(backup_root, data["base"], keep=True)
+    except (OSError, json.JSONDecodeError):
+        return None, {}
+
+    files = dict(base.get("files", {}))
+    for rel_path in data.get("removed", ()):
+        files.pop(rel_path, None)
+    files.update(data.get("files", {}))
+    return snapshot, files
+
+
+def journal_base(backup_root, snapshot):
+    """Get the base journal a delta journal builds on, or None"""
+    try:
+        return read_record(backup_root, snapshot).get("base")
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def sorted_paths(backup_root, snapshot):
+    """Get the sorted paths of a full journal, kept with its cached record"""
+    data = read_record(backup_root, snapshot, keep=True)
+    cached = _bases.get(journal_path(backup_root, snapshot))
+    if cached is None or cached[1] is not data:
+        return sorted(data.get("files", {}))
+    if cached[2] is None:
+        cached[2] = sorted(data.get("files", {}))
+    return cached[2]
+
+
+def paths_under(paths, change):
+    """Yield the paths of a sorted list that are change or lie under it"""
+    index = bisect.bisect_left(paths, change)
+    if index < len(paths) and paths[index] == change:
+        yield change
+    prefix = change + os.sep
+    index = bisect.bisect_left(paths, prefix)
+    while index < len(paths) and paths[index].startswith(prefix):
+        yield paths[index]
+        index += 1
+
+
+def changed_files(backup_root, snapshot, changes):
+    """Get the paths of a snapshot's journal that are changes or lie under one
+
+    Changed folders are looked up in the sorted index of the full journal
+    behind the snapshot, so the cost follows the changes, not the tree.
+    """
+    if "" in changes:
+        return set(load_journal(backup_root, snapshot)[1])
+    try:
+        data = read_record(backup_root, snapshot, keep=True)
+        delta = {}
+        if "base" in data:
+            delta, snapshot = data, data["base"]
+        paths = sorted_paths(backup_root, snapshot)
+    except (OSError, json.JSONDecodeError):
+        return set()
+
+    found = {path for change in changes for path in paths_under(paths, change)}
+    found.difference_update(delta.get("removed", ()))
+    found.update(p for p in delta.get("files", {}) if in_changes(p, changes))
+    return found
+
+
+def delta_record(backup_root, previous, files, changes=None):
+    """Get the delta of files against the full journal behind previous, or None
+
+    With changes (the changed files since previous, see changed_files) the
+    delta of previous is updated with those paths only; without, files is
+    compared with the whole base. None means a full journal is due: the
+    base is unreadable, or too much changed since it for a delta to pay off.
+    """
+    try:
+        base, data = previous, read_record(backup_root, previous, keep=True)
+        delta = {}
+        if "base" in data:
+            base, delta = data["base"], data
+            data = read_record(backup_root, base, keep=True)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    base_files = data.get("files", {})
+    if changes is None:
+        changed = {
+            rel_path: entry
+            for rel_path, entry in files.items()
+            if base_files.get(rel_path) != entry
+        }
+        removed = {rel_path for rel_path in base_files if rel_path not in files}
+    else:
+        changed = {
+            rel_path: entry
+            for rel_path, entry in delta.get("files", {}).items()
+            if rel_path not in changes
+        }
+        removed = {p for p in delta.get("removed", ()) if p not in changes}
+        for rel_path in changes:
+            entry = files.get(rel_path)
+            if entry is None:
+                if rel_path in base_files:
+                    removed.add(rel_path)
+            elif base_files.get(rel_path) != entry:
+                changed[rel_path] = entry
+    if len(changed) + len(removed) > len(files) * MAX_DELTA_SHARE:
+        return None
+    return {"base": base, "files": changed, "removed": sorted(removed)}
+
+
+def save_journal(backup_root, snapshot, files, base=None, changes=None):
+    """Write the journal of a snapshot atomically
+
+    With base (the previous snapshot of a watch-mode run) only the changes
+    against the full journal behind it are written, when they are few;
+    changes limits the comparison to the changed files.
+    """
+    journal_dir = get_journal_dir(backup_root)
+    os.makedirs(journal_dir, exist_ok=True)
+
+    record = {"files": files}
+    if base:
+        record = delta_record(backup_root, base, files, changes) or record
+    journal_file = journal_path(backup_root, snapshot)
+    tmp_file = journal_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "snapshot": snapshot, **record}, f)
+    os.replace(tmp_file, journal_file)
+
+
+def journal_key(snapshot):
+    """Get the object key of a snapshot journal on a destination backend"""
+    return f"{JOURNAL_DIR}/{snapshot}.json"
+
+
+def list_remote_snapshots(backend):
+    """List completed snapshots (oldest first) of a backend destination"""
+    prefix = f"{JOURNAL_DIR}/"
+    return sorted(
+        key[len(prefix) : -len(".json")]
+        for key in backend.list(JOURNAL_DIR)
+        if key.startswith(prefix)
+        and key.endswith(".json")
+        and "/" not in key[len(prefix) :]
+    )
+
+
+def load_remote_journal(backend, snapshot=None):
+    """Load a snapshot journal from a backend (latest one by default)
+
+    Returns (snapshot_name, files) or (None, {}) like load_journal.
+    """
+    if snapshot is None:
+        snapshots = list_remote_snapshots(backend)
+        if not snapshots:
+            return None, {}
+        snapshot = snapshots[-1]
+
+    try:
+        data = json.loads(backend.get_bytes(journal_key(snapshot)))
+    except (FileNotFoundError, ValueError):
+        return None, {}
+    return snapshot, data.get("files", {})
+
+
+def save_remote_journal(backend, snapshot, files):
+    """Upload the journal of a snapshot; written last, it marks the run done"""
+    data = json.dumps({"version": 1, "snapshot": snapshot, "files": files})
+    backend.put_bytes(journal_key(snapshot), data.encode("utf-8"))
+
+
+def make_entry(stat_result, snapshot):
+    """Build a journal entry for a file stored in the given snapshot"""
+    return {
+        "size": stat_result.st_size,
+        "mtime_ns": stat_result.st_mtime_ns,
+        "ino": stat_result.st_ino,
+        "snapshot": snapshot,
+    }
+
+
+def in_changes(rel_path, changes):
+    """Check if a path is one of the changed paths or lies under one
+
+    The change "" is the source folder itself, which holds every path.
+    """
+    if "" in changes:
+        return True
+    path = rel_path
+    while path and path not in changes:
+        path = os.path.dirname(path)
+    return bool(path)
+
+
+def in_snapshot_folder(entry):
+    """Check if an entry's data is a plain file in its snapshot's folder"""
+    return not any(key in entry for key in ("chunks", "archive", "pack"))
+
+
+def is_unchanged(entry, stat_result):
+    """Check if a file still matches its journal entry"""
+    return (
+        entry is not None
+        and entry["size"] == stat_result.st_size
+        and entry["mtime_ns"] == stat_result.st_mtime_ns
+        and entry["ino"] == stat_result.st_ino
+    )
+
+
+def is_appended(entry, stat_result):
+    """Check if a file kept its inode and only got larger since its entry"""
+    return (
+        entry is not None
+        and entry["ino"] == stat_result.st_ino
+        and stat_result.st_size > entry["size"]
+    )
+
+
+def record_run(backup_root, snapshot, storage_format, stats):
+    """Append the throughput of a finished run to the run history"""
+    record = {
+        "snapshot": snapshot,
+        "storage_format": storage_format,
+        "files": stats["copied"],
+        "bytes": stats["bytes"],
+        "elapsed": stats["elapsed"],
+    }
+    os.makedirs(get_journal_dir(backup_root), exist_ok=True)
+    with open(
+        os.path.join(get_journal_dir(backup_root), RUNS_FILE), "a", encoding="utf-8"
+    ) as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def load_runs(backup_root, limit=None):
+    """Load the run history (oldest first), skipping unreadable lines"""
+    runs = []
+    try:
+        with open(
+            os.path.join(get_journal_dir(backup_root), RUNS_FILE), "r", encoding="utf-8"
+        ) as f:
+            for line in f:
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        return []
+    return runs[-limit:] if limit else runs
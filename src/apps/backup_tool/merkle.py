@@ -0,0 +1,277 @@
+"""
+Merkle-tree manifests of snapshots
+Every snapshot gets a tree of folder nodes in backup_<name>/.merkle/: a node
+lists the files of one folder (size and mtime) and the hash of each
+subfolder, and is stored under the hash of its own content, like git trees.
+A folder that did not change has the same hash in every snapshot, so its
+node is stored once and a diff only opens the nodes along changed paths.
+Watch-mode snapshots rebuild only the nodes along their changed paths too.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+import journal
+
+MERKLE_DIR = ".merkle"
+NODES_DIR = "nodes"
+ROOT_SUFFIX = ".root"
+EMPTY_NODE = {"dirs": {}, "files": {}}
+
+
+def get_merkle_dir(backup_root):
+    """Get the folder holding the Merkle trees of a backup_<name> root"""
+    return os.path.join(backup_root, MERKLE_DIR)
+
+
+def encode_node(node):
+    """Serialize a node canonically, so equal folders get equal hashes"""
+    return json.dumps(node, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def build_tree(files):
+    """Build the folder nodes of a {relative_path: (size, mtime_ns)} mapping
+
+    Returns (root_hash, {hash: node}).
+    """
+    folders = {"": {"dirs": {}, "files": {}}}
+    for rel_path, leaf in files.items():
+        if os.sep != "/":
+            rel_path = rel_path.replace(os.sep, "/")
+        parent, _, name = rel_path.rpartition("/")
+        node = folders.get(parent)
+        if node is None:
+            # Register the missing ancestors so every folder gets a node
+            folder = parent
+            while folder not in folders:
+                folders[folder] = {"dirs": {}, "files": {}}
+                folder = folder.rpartition("/")[0]
+            node = folders[parent]
+        node["files"][name] = list(leaf)
+
+    nodes = {}
+    # Deepest folders first, so a folder's children are hashed before it
+    for folder in sorted(folders, key=lambda f: f.count("/") + bool(f), reverse=True):
+        data = encode_node(folders[folder])
+        digest = hashlib.sha256(data).hexdigest()
+        nodes[digest] = folders[folder]
+        if folder:
+            parent, _, name = folder.rpartition("/")
+            folders[parent]["dirs"][name] = digest
+    return digest, nodes
+
+
+def update_tree(load, root, files, changes):
+    """Rebuild the folder nodes of an earlier tree along changed paths
+
+    load maps a hash to a node of the tree rooted at root; files is the new
+    journal and changes the files that may differ from that tree (changed
+    folders expanded, see journal.changed_files), so only those are visited.
+    Returns (root_hash, {hash: node}) like build_tree, with only the nodes
+    that were rebuilt.
+    """
+    changes = set(changes)
+    # Paths under another changed path are rebuilt with it
+    tops = [
+        path
+        for path in changes
+        if not journal.in_changes(os.path.dirname(path), changes)
+    ]
+    if not tops:
+        return root, {}
+
+    folders = {}
+
+    def open_folder(folder):
+        """Get the node of a folder of the earlier tree, loading its ancestors"""
+        if folder not in folders:
+            if folder:
+                parent, _, name = folder.rpartition("/")
+                digest = open_folder(parent)["dirs"].get(name)
+            else:
+                digest = root
+            folders[folder] = load(digest) if digest else {"dirs": {}, "files": {}}
+        return folders[folder]
+
+    for path in tops:
+        parent, _, name = path.replace(os.sep, "/").rpartition("/")
+        node = open_folder(parent)
+        node["files"].pop(name, None)
+        node["dirs"].pop(name, None)
+
+    for rel_path in changes:
+        entry = files.get(rel_path)
+        if entry is None:
+            continue
+        parent, _, name = rel_path.replace(os.sep, "/").rpartition("/")
+        folder = parent
+        while folder not in folders:
+            folders[folder] = {"dirs": {}, "files": {}}
+            folder = folder.rpartition("/")[0]
+        folders[parent]["files"][name] = [entry["size"], entry["mtime_ns"]]
+
+    nodes = {}
+    for folder in sorted(folders, key=lambda f: f.count("/") + bool(f), reverse=True):
+        node = folders[folder]
+        parent, _, name = folder.rpartition("/")
+        if folder and not node["files"] and not node["dirs"]:
+            folders[parent]["dirs"].pop(name, None)  # emptied: build_tree has no node
+            continue
+        digest = hashlib.sha256(encode_node(node)).hexdigest()
+        nodes[digest] = node
+        if folder:
+            folders[parent]["dirs"][name] = digest
+    return digest, nodes
+
+
+def journal_leaves(files):
+    """Get the (size, mtime_ns) leaves of a snapshot journal"""
+    return {
+        rel_path: (entry["size"], entry["mtime_ns"])
+        for rel_path, entry in files.items()
+    }
+
+
+def diff_trees(load_old, old_root, load_new, new_root, prefix=""):
+    """Yield ("added" | "removed" | "modified", path) between two trees
+
+    load_old and load_new map a hash to its node. Subtrees with the same
+    hash on both sides are skipped without being opened.
+    """
+    stack = [(prefix, old_root, new_root)]
+    while stack:
+        folder, old_hash, new_hash = stack.pop()
+        if old_hash == new_hash:
+            continue
+        old = load_old(old_hash) if old_hash else EMPTY_NODE
+        new = load_new(new_hash) if new_hash else EMPTY_NODE
+        base = f"{folder}/" if folder else ""
+
+        for name in sorted(old["files"].keys() | new["files"].keys()):
+            before, after = old["files"].get(name), new["files"].get(name)
+            if before is None:
+                yield "added", base + name
+            elif after is None:
+                yield "removed", base + name
+            elif before != after:
+                yield "modified", base + name
+
+        for name in sorted(old["dirs"].keys() | new["dirs"].keys(), reverse=True):
+            stack.append((base + name, old["dirs"].get(name), new["dirs"].get(name)))
+
+
+class MerkleStore:
+    """Content-addressed folder nodes and per-snapshot root hashes"""
+
+    def __init__(self, backup_root):
+        self.backup_root = backup_root
+        self.merkle_dir = get_merkle_dir(backup_root)
+        self.nodes_dir = os.path.join(self.merkle_dir, NODES_DIR)
+
+    def node_path(self, digest):
+        """Get the path of a node (fanned out by the first two hex digits)"""
+        return os.path.join(self.nodes_dir, digest[:2], digest)
+
+    def root_path(self, snapshot):
+        return os.path.join(self.merkle_dir, snapshot + ROOT_SUFFIX)
+
+    def load(self, digest):
+        with open(self.node_path(digest), "rb") as f:
+            return json.loads(f.read())
+
+    def save_tree(self, snapshot, files, base=None, changes=None):
+        """Store the tree of a snapshot journal and return its root hash
+
+        Only nodes no earlier snapshot stored are written. With the previous
+        snapshot and the changed files of a watch-mode run, only the nodes
+        along those paths are rebuilt.
+        """
+        root = None
+        if base and changes is not None and "" not in changes:
+            try:
+                root, nodes = update_tree(self.load, self.root(base), files, changes)
+            except (OSError, ValueError, KeyError):
+                root = None  # earlier tree unreadable: build the whole tree
+        if root is None:
+            root, nodes = build_tree(journal_leaves(files))
+        for digest, node in nodes.items():
+            path = self.node_path(digest)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encode_node(node))
+            os.replace(tmp_path, path)
+
+        tmp_path = self.root_path(snapshot) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(root)
+        os.replace(tmp_path, self.root_path(snapshot))
+        return root
+
+    def root(self, snapshot):
+        """Get the root hash of a snapshot, building the tree from its journal
+        when the snapshot predates the Merkle manifests"""
+        try:
+            with open(self.root_path(snapshot), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            pass
+        name, files = journal.load_journal(self.backup_root, snapshot)
+        if name is None:
+            raise KeyError(snapshot)
+        return self.save_tree(snapshot, files)
+
+    def prune(self, snapshots):
+        """Drop the trees of pruned snapshots and nodes no other tree uses
+
+        Returns the number of nodes removed.
+        """
+        for snapshot in snapshots:
+            try:
+                os.remove(self.root_path(snapshot))
+            except FileNotFoundError:
+                pass
+        if not os.path.isdir(self.nodes_dir):
+            return 0
+
+        live = set()
+        for name in os.listdir(self.merkle_dir):
+            if not name.endswith(ROOT_SUFFIX):
+                continue
+            with open(os.path.join(self.merkle_dir, name), "r", encoding="utf-8") as f:
+                stack = [f.read().strip()]
+            # Shared subtrees are walked once, however many snapshots use them
+            while stack:
+                digest = stack.pop()
+                if digest in live:
+                    continue
+                live.add(digest)
+                try:
+                    stack.extend(self.load(digest)["dirs"].values())
+                except (OSError, ValueError):
+                    continue  # a lost node only costs that tree its diffs
+
+        removed = 0
+        for bucket in os.scandir(self.nodes_dir):
+            for entry in os.scandir(bucket.path):
+                if entry.name not in live:
+                    os.remove(entry.path)
+                    removed += 1
+        return removed
+
+
+def record_tree(backup_root, snapshot, files, base=None, changes=None):
+    """Store the Merkle tree of a finished snapshot, logging failures
+
+    A missing tree is rebuilt from the journal on the first diff, so a
+    failure here never fails the backup.
+    """
+    try:
+        MerkleStore(backup_root).save_tree(snapshot, files, base, changes)
+    except OSError as e:
+        logging.warning(f"⚠️  Could not save the Merkle tree of {snapshot}: {e}")
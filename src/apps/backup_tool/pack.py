@@ -0,0 +1,100 @@
+"""
+Small-file pack files for the Backup Tool
+Files below a size threshold are appended to large pack files in
+backup_<name>/.packs instead of becoming one destination file each, which
+turns hundreds of thousands of create/write/close/utime calls into a few
+sequential appends. The snapshot journal is the index: each packed entry
+records its pack and offset, so a single file is restored with one seek.
+"""
+
+import hashlib
+import os
+
+PACKS_DIR = ".packs"
+MAX_PACK_SIZE = 256 * 1024 * 1024
+
+
+def get_packs_dir(backup_root):
+    """Get the folder holding the pack files of a backup_<name> root"""
+    return os.path.join(backup_root, PACKS_DIR)
+
+
+def load_file(source_path, holder, throttle=None):
+    """Read a small file into holder["data"] and its "sha256" (runs on a worker)"""
+    with open(source_path, "rb") as f:
+        if throttle:
+            f = throttle.reader(f)
+        holder["data"] = f.read()
+    holder["sha256"] = hashlib.sha256(holder["data"]).hexdigest()
+    return len(holder["data"])
+
+
+def read_packed(backup_root, entry):
+    """Get the content of a packed file"""
+    with open(os.path.join(get_packs_dir(backup_root), entry["pack"]), "rb") as f:
+        f.seek(entry["offset"])
+        data = f.read(entry["size"])
+    if len(data) != entry["size"]:
+        raise OSError(f"pack {entry['pack']} is truncated")
+    return data
+
+
+def restore_packed(backup_root, entry, dest_path):
+    """Write a packed file back out to dest_path (runs on a worker)"""
+    data = read_packed(backup_root, entry)
+    with open(dest_path, "wb") as out:
+        out.write(data)
+    os.utime(dest_path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+    return len(data)
+
+
+class PackWriter:
+    """Appends files to the pack files of one snapshot (collector thread only)"""
+
+    def __init__(self, backup_root, snapshot, max_pack_size=MAX_PACK_SIZE):
+        self.packs_dir = get_packs_dir(backup_root)
+        self.snapshot = snapshot
+        self.max_pack_size = max_pack_size
+        self.fp = None
+        self.name = None
+        self.packs = 0
+        self.files = 0
+
+    def _open_next(self):
+        self.close()
+        os.makedirs(self.packs_dir, exist_ok=True)
+        # Packs of an interrupted run stay as they are: the checkpoint
+        # points into them, so a resumed run starts a new pack
+        number = 1
+        while os.path.exists(self._path(number)):
+            number += 1
+        self.name = os.path.basename(self._path(number))
+        self.fp = open(self._path(number), "xb")
+        self.packs += 1
+
+    def _path(self, number):
+        return os.path.join(self.packs_dir, f"{self.snapshot}_{number:04d}.pack")
+
+    def append(self, data):
+        """Append one file; returns (pack_name, offset)"""
+        if self.fp is None or (
+            self.fp.tell() > 0 and self.fp.tell() + len(data) > self.max_pack_size
+        ):
+            self._open_next()
+
+        offset = self.fp.tell()
+        self.fp.write(data)
+        self.files += 1
+        return self.name, offset
+
+    def sync(self):
+        """Flush the appended files to disk before the checkpoint logs them"""
+        if self.fp is not None:
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+
+    def close(self):
+        if self.fp is not None:
+            os.fsync(self.fp.fileno())
+            self.fp.close()
+            self.fp = None
@@ -0,0 +1,272 @@
+"""
+Retention for the Backup Tool
+Applies a grandfather-father-son policy (keep N hourly, daily, weekly and
+monthly snapshots) to a backup_<name> root. Pruning is driven by the snapshot
+journals: it never walks snapshot trees to find what is still in use, only
+frees chunks and archives no surviving journal references, and first moves
+files that surviving incremental snapshots still point at.
+"""
+
+import logging
+import os
+import shutil
+
+import journal
+from archive import get_index_path
+from checkpoint import find_unfinished
+from chunk_store import CHUNKS_DIR
+from merkle import MerkleStore
+from pack import get_packs_dir
+
+# Policy name and the strftime key that groups snapshots into its buckets
+RETENTION_BUCKETS = (
+    ("hourly", "%Y-%m-%d %H"),
+    ("daily", "%Y-%m-%d"),
+    ("weekly", "%G-W%V"),
+    ("monthly", "%Y-%m"),
+)
+
+
+def policy_enabled(policy):
+    """Check if a policy keeps a limited number of snapshots"""
+    return any(policy.get(name, 0) > 0 for name, _ in RETENTION_BUCKETS)
+
+
+def select_snapshots(snapshots, policy):
+    """Split snapshot names into (keep, prune) following a GFS policy
+
+    Walking from newest to oldest, the newest snapshot of each hour, day,
+    ISO week and month is kept until that bucket's count runs out. The latest
+    snapshot and snapshots without a timestamp name are always kept.
+    """
+    if not policy_enabled(policy):
+        return list(snapshots), []
+
+    remaining = {name: policy.get(name, 0) for name, _ in RETENTION_BUCKETS}
+    last_key = {}
+    keep = set()
+    dated = []
+    for snapshot in snapshots:
+        taken = journal.snapshot_time(snapshot)
+        if taken is None:
+            keep.add(snapshot)
+        else:
+            dated.append((taken, snapshot))
+
+    dated.sort(reverse=True)
+    if dated:
+        keep.add(dated[0][1])
+    for taken, snapshot in dated:
+        for name, key_format in RETENTION_BUCKETS:
+            key = taken.strftime(key_format)
+            if remaining[name] > 0 and key != last_key.get(name):
+                last_key[name] = key
+                remaining[name] -= 1
+                keep.add(snapshot)
+
+    return (
+        [s for s in snapshots if s in keep],
+        [s for s in snapshots if s not in keep],
+    )
+
+
+def list_snapshot_folders(backup_root):
+    """List timestamp folders of a backup_<name> root, journaled or not"""
+    if not os.path.isdir(backup_root):
+        return []
+    return [
+        entry.name
+        for entry in os.scandir(backup_root)
+        if entry.is_dir()
+        and not entry.name.startswith(".")
+        and journal.snapshot_time(entry.name) is not None
+    ]
+
+
+def rehome_file(source, dest):
+    """Give a file kept by a pruned snapshot a new home in a surviving one
+
+    Hardlinks when possible, so the data exists in both places until the
+    surviving journal is saved and the pruned folder removed.
+    """
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if os.path.exists(dest):
+        os.remove(dest)  # leftover of a failed copy, never in a journal
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+
+
+def prune_snapshots(backup_root, policy, dry_run=False):
+    """Delete the snapshots a retention policy does not keep
+
+    Returns a stats dict, or None when pruning was skipped.
+    """
+    if not policy_enabled(policy):
+        return None
+
+    unfinished, _ = find_unfinished(backup_root)
+    if unfinished:
+        logging.warning(
+            f"⚠️  Backup {unfinished} is unfinished; pruning waits until it completes"
+        )
+        return None
+
+    journaled = journal.list_snapshots(backup_root)
+    snapshots = sorted(set(journaled) | set(list_snapshot_folders(backup_root)))
+    keep, prune = select_snapshots(snapshots, policy)
+    stats = {
+        "kept": len(keep),
+        "pruned": len(prune),
+        "rehomed": 0,
+        "chunks_freed": 0,
+        "archives_removed": 0,
+        "packs_removed": 0,
+        "bytes_freed": 0,
+    }
+    if not prune:
+        return stats
+
+    if dry_run:
+        for snapshot in prune:
+            logging.info(f"🗑️  Would prune {snapshot}")
+        return stats
+
+    pruned = set(prune)
+    journals = {}
+    for snapshot in journaled:
+        journals[snapshot] = journal.load_journal(backup_root, snapshot)[1]
+    survivors = [s for s in keep if s in journals]
+
+    # Incremental snapshots point at files physically held by older snapshots;
+    # the oldest survivor needing such a file becomes its new home.
+    new_home = {}
+    stuck = set()
+    for snapshot in survivors:
+        for rel_path, entry in journals[snapshot].items():
+            owner = entry.get("snapshot")
+            if owner not in pruned or not journal.in_snapshot_folder(entry):
+                continue
+            if (owner, rel_path) not in new_home:
+                try:
+                    rehome_file(
+                        os.path.join(backup_root, owner, rel_path),
+                        os.path.join(backup_root, snapshot, rel_path),
+                    )
+                    new_home[(owner, rel_path)] = snapshot
+                    stats["rehomed"] += 1
+                except OSError as e:
+                    logging.error(f"Cannot move '{rel_path}' out of {owner}: {e}")
+                    new_home[(owner, rel_path)] = None
+                    stuck.add(owner)
+
+    changed = set()
+    for snapshot in survivors:
+        for rel_path, entry in journals[snapshot].items():
+            home = new_home.get((entry.get("snapshot"), rel_path))
+            if home and journal.in_snapshot_folder(entry):
+                # Entries may be shared with a cached journal: replace it
+                journals[snapshot][rel_path] = dict(entry, snapshot=home)
+                changed.add(snapshot)
+    # Delta journals (watch mode) stay deltas; those of a pruned base move
+    # onto the oldest of them, which is written out in full first
+    bases = {s: journal.journal_base(backup_root, s) for s in survivors}
+    new_base = None
+    for snapshot in sorted(s for s in survivors if bases[s] in pruned):
+        journal.save_journal(backup_root, snapshot, journals[snapshot], new_base)
+        new_base = new_base or snapshot
+        changed.discard(snapshot)
+    for snapshot in sorted(changed, key=lambda s: bases[s] is not None):
+        journal.save_journal(backup_root, snapshot, journals[snapshot], bases[snapshot])
+
+    # Everything the survivors still reference, straight from their journals
+    live_chunks = set()
+    live_archives = set()
+    live_packs = set()
+    for snapshot in survivors + sorted(stuck & journals.keys()):
+        for entry in journals[snapshot].values():
+            if "chunks" in entry:
+                live_chunks.update(entry["chunks"])
+            if "archive" in entry:
+                live_archives.add(entry["archive"])
+            if "pack" in entry:
+                live_packs.add(entry["pack"])
+
+    # A snapshot whose files could not all be moved stays whole for now
+    for snapshot in stuck:
+        logging.warning(f"⚠️  Keeping {snapshot}: newer snapshots still need it")
+    prune = [s for s in prune if s not in stuck]
+    stats["kept"] += len(stuck)
+    stats["pruned"] = len(prune)
+
+    dead_chunks = set()
+    for snapshot in prune:
+        for entry in journals.get(snapshot, {}).values():
+            dead_chunks.update(entry.get("chunks", ()))
+    dead_chunks -= live_chunks
+
+    journal_dir = journal.get_journal_dir(backup_root)
+    for snapshot in prune:
+        if snapshot in journals:
+            os.remove(os.path.join(journal_dir, f"{snapshot}.json"))
+        shutil.rmtree(os.path.join(backup_root, snapshot), ignore_errors=True)
+        logging.info(f"🗑️  Pruned snapshot {snapshot}")
+
+    try:
+        MerkleStore(backup_root).prune(prune)
+    except OSError as e:
+        logging.warning(f"⚠️  Could not clean up the Merkle trees: {e}")
+
+    chunks_dir = os.path.join(backup_root, CHUNKS_DIR)
+    for digest in dead_chunks:
+        chunk_path = os.path.join(chunks_dir, digest[:2], digest)
+        try:
+            stats["bytes_freed"] += os.path.getsize(chunk_path)
+            os.remove(chunk_path)
+            stats["chunks_freed"] += 1
+        except OSError:
+            pass
+
+    # Archives of pruned snapshots, unless carried-over entries still use them
+    surviving = set(survivors) | stuck
+    for entry in os.scandir(backup_root):
+        name = entry.name
+        if (
+            name.endswith(".zip")
+            and entry.is_file()
+            and name[: -len(".zip")] not in surviving
+            and name not in live_archives
+            and journal.snapshot_time(name) is not None
+        ):
+            stats["bytes_freed"] += entry.stat().st_size
+            os.remove(entry.path)
+            stats["archives_removed"] += 1
+            try:
+                os.remove(get_index_path(entry.path))
+            except FileNotFoundError:
+                pass  # archive written before indexes existed
+
+    # Pack files hold small files of many snapshots; drop those nobody uses
+    packs_dir = get_packs_dir(backup_root)
+    if os.path.isdir(packs_dir):
+        for entry in os.scandir(packs_dir):
+            if entry.name.endswith(".pack") and entry.name not in live_packs:
+                stats["bytes_freed"] += entry.stat().st_size
+                os.remove(entry.path)
+                stats["packs_removed"] += 1
+
+    return stats
+
+
+def log_prune_stats(stats):
+    """Log the outcome of a prune run"""
+    if not stats or not stats["pruned"]:
+        return
+    logging.info(
+        f"🧹 Retention: kept {stats['kept']}, pruned {stats['pruned']} snapshots, "
+        f"moved {stats['rehomed']} files still in use, freed "
+        f"{stats['chunks_freed']} chunks, {stats['archives_removed']} archives and "
+        f"{stats['packs_removed']} packs "
+        f"({stats['bytes_freed'] / (1024 * 1024):.1f} MB)."
+    )
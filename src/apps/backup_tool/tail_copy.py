@@ -0,0 +1,102 @@
+"""
+Append-only tail copy for growing files
+Logs that grow by a few KB between runs but are gigabytes in total are
+rebuilt from the previous snapshot's copy plus the new tail: the old copy
+is cloned (reflink) or copied inside the destination, and only the appended
+bytes are read from the source.
+
+Growth counts as append-only when the file kept its inode, got larger, and
+the first and last blocks of its old length still match the previous copy.
+"""
+
+import os
+import shutil
+import threading
+
+import fast_copy
+import journal
+
+CHECK_BLOCK_SIZE = 64 * 1024
+TAIL_MIN_SIZE = 1024 * 1024  # smaller files are cheaper to copy whole
+
+
+def read_block(file_obj, offset, size):
+    file_obj.seek(offset)
+    return file_obj.read(size)
+
+
+def same_prefix(src, old, old_size):
+    """Check the first and last blocks of the old length against the old copy
+
+    An all-zero last block proves nothing (preallocated or sparse files),
+    so it never counts as a match.
+    """
+    head = min(CHECK_BLOCK_SIZE, old_size)
+    tail_offset = max(0, old_size - CHECK_BLOCK_SIZE)
+    last = read_block(src, tail_offset, old_size - tail_offset)
+    return (
+        last.strip(b"\x00") != b""
+        and last == read_block(old, tail_offset, old_size - tail_offset)
+        and read_block(src, 0, head) == read_block(old, 0, head)
+    )
+
+
+class TailCopier:
+    """Rebuilds grown append-only files from their previous copies"""
+
+    def __init__(self, enabled=True, throttle=None):
+        self.enabled = enabled
+        self.throttle = throttle
+        self._lock = threading.Lock()
+        self.files = 0
+        self.fallbacks = 0
+        self.bytes_reused = 0
+        self.bytes_appended = 0
+
+    def wants(self, stat_result, entry, previous_path):
+        """Check if a file looks like it only grew since its previous copy"""
+        return (
+            self.enabled
+            and journal.is_appended(entry, stat_result)
+            and entry["size"] >= TAIL_MIN_SIZE
+            and previous_path is not None
+            and os.path.isfile(previous_path)
+        )
+
+    def copy(self, source_path, dest_path, previous_path, old_size, new_size):
+        """Write source_path to dest_path from previous_path plus the new tail
+
+        Falls back to a plain copy when the old part changed after all.
+        Runs on a worker.
+        """
+        with open(source_path, "rb") as src:
+            with open(previous_path, "rb") as old:
+                appended = same_prefix(src, old, old_size)
+            if not appended:
+                size, _ = fast_copy.copy_file(source_path, dest_path, self.throttle)
+                with self._lock:
+                    self.fallbacks += 1
+                return size
+
+            # The old part never leaves the destination (reflink or
+            # server-side copy), so it is not charged to the throttle
+            fast_copy.copy_file(previous_path, dest_path)
+            src.seek(old_size)
+            reader = self.throttle.reader(src) if self.throttle else src
+            remaining = new_size - old_size
+            with open(dest_path, "r+b") as new:
+                new.seek(old_size)
+                while remaining > 0:
+                    data = reader.read(min(fast_copy.BUFFER_SIZE, remaining))
+                    if not data:
+                        raise OSError(f"'{source_path}' shrank during the copy")
+                    new.write(data)
+                    remaining -= len(data)
+                new.truncate(new_size)
+
+        shutil.copystat(source_path, dest_path)
+        with self._lock:
+            self.files += 1
+            self.bytes_reused += old_size
+            self.bytes_appended += new_size - old_size
+        return new_size - old_size
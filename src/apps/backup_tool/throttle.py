@@ -0,0 +1,155 @@
+"""
+I/O throttling for the Backup Tool
+A token bucket shared by all copy workers caps the bandwidth (MB/s) and the
+number of I/O operations per second, so a backup can run on a busy file
+server without starving interactive users. set_idle_priority() additionally
+moves the process to idle CPU and disk priority.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+
+# Largest single read/copy while throttled, so the limit stays smooth
+THROTTLED_CHUNK_SIZE = 1024 * 1024
+
+# ioprio_set syscall numbers (linux/ioprio.h has no libc wrapper)
+IOPRIO_SYSCALLS = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+
+class TokenBucket:
+    """Thread-safe token bucket; callers sleep off whatever they overdraw"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # Taking tokens up front and sleeping the debt keeps the total
+            # rate right however many workers share the bucket
+            self.tokens -= amount
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Throttle:
+    """Bandwidth and IOPS limits shared by every worker of a run"""
+
+    def __init__(self, mb_per_s=0, iops=0):
+        self.mb_per_s = mb_per_s
+        self.iops = iops
+        self.bandwidth = TokenBucket(mb_per_s * 1024 * 1024) if mb_per_s > 0 else None
+        self.operations = TokenBucket(iops) if iops > 0 else None
+
+    def acquire(self, nbytes, operations=1):
+        """Wait until nbytes and the given number of operations are allowed"""
+        if self.operations and operations:
+            self.operations.consume(operations)
+        if self.bandwidth and nbytes:
+            self.bandwidth.consume(nbytes)
+
+    def reader(self, file_obj):
+        """Wrap a binary file so each read waits for the throttle"""
+        return ThrottledReader(file_obj, self)
+
+    def __str__(self):
+        limits = []
+        if self.bandwidth:
+            limits.append(f"{self.mb_per_s:g} MB/s")
+        if self.operations:
+            limits.append(f"{self.iops:g} IOPS")
+        return ", ".join(limits)
+
+
+class ThrottledReader:
+    """File wrapper that charges every read to a Throttle"""
+
+    def __init__(self, file_obj, throttle):
+        self.file_obj = file_obj
+        self.throttle = throttle
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(THROTTLED_CHUNK_SIZE), b""))
+
+        # Large reads are charged in steps, so one read cannot burst past the limit
+        parts = []
+        while size > 0:
+            step = min(size, THROTTLED_CHUNK_SIZE)
+            self.throttle.acquire(step)
+            data = self.file_obj.read(step)
+            if not data:
+                break
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+
+def create_throttle(mb_per_s=0, iops=0):
+    """Build the run's throttle, or None when no limit is configured"""
+    if mb_per_s <= 0 and iops <= 0:
+        return None
+    return Throttle(mb_per_s, iops)
+
+
+def set_idle_priority():
+    """Lower the CPU and I/O priority of this process (and threads it starts)
+
+    Returns a short description of what was applied, for the log.
+    """
+    applied = []
+    if sys.platform == "win32":
+        PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+        kernel32 = ctypes.windll.kernel32
+        if kernel32.SetPriorityClass(
+            kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_BEGIN
+        ):
+            applied.append("background mode")
+        return applied
+
+    try:
+        os.nice(19 - os.nice(0))
+        applied.append("nice 19")
+    except OSError as e:
+        logging.warning(f"⚠️  Cannot lower CPU priority: {e}")
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if sys.platform.startswith("linux"):
+        number = IOPRIO_SYSCALLS.get(platform.machine())
+        if number is not None:
+            value = IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT
+            if libc.syscall(number, IOPRIO_WHO_PROCESS, 0, value) == 0:
+                applied.append("idle I/O class")
+    elif sys.platform == "darwin":
+        IOPOL_TYPE_DISK, IOPOL_SCOPE_PROCESS, IOPOL_THROTTLE = 0, 0, 3
+        if (
+            libc.setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_PROCESS, IOPOL_THROTTLE)
+            == 0
+        ):
+            applied.append("throttled I/O policy")
+    return applied
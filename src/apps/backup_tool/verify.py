@@ -0,0 +1,254 @@
+"""
+Integrity verification for the Backup Tool
+Re-reads a snapshot and checks it against its own manifest (chunk digests,
+zip CRCs, recorded sha256 of copied files) or against the source. Files are
+hashed on a thread pool with large sequential reads; hashlib and file reads
+release the GIL, so the pool keeps every core and disk busy.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import archive
+import journal
+import pack
+from chunk_store import ChunkStore
+from restore import ArchiveReader
+
+READ_SIZE = 8 * 1024 * 1024
+DEFAULT_VERIFY_WORKERS = os.cpu_count() or 4
+
+OK = "ok"
+MISMATCH = "mismatch"
+MISSING = "missing"
+CHANGED = "changed"  # source modified since the backup, not comparable
+
+
+def hash_stream(stream):
+    """Hash a binary stream; returns (sha256 hex digest, bytes read)"""
+    digest = hashlib.sha256()
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    size = 0
+    while True:
+        read = stream.readinto(buffer)
+        if not read:
+            break
+        digest.update(view[:read])
+        size += read
+    return digest.hexdigest(), size
+
+
+def hash_file(path):
+    """Hash a file with large sequential reads"""
+    with open(path, "rb", buffering=0) as f:
+        return hash_stream(f)
+
+
+class ChunkStream:
+    """Read-only stream over the chunks of a file in the chunk store"""
+
+    def __init__(self, store, digests):
+        self.store = store
+        self.digests = iter(digests)
+        self.current = None
+
+    def readinto(self, buffer):
+        while True:
+            if self.current is None:
+                digest = next(self.digests, None)
+                if digest is None:
+                    return 0
+                self.current = open(self.store.chunk_path(digest), "rb")
+            read = self.current.readinto(buffer)
+            if read:
+                return read
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SnapshotVerifier:
+    """Checks the files of one snapshot; every check runs on a worker thread"""
+
+    def __init__(self, backup_root, files):
+        self.backup_root = backup_root
+        self.store = (
+            ChunkStore(backup_root)
+            if any("chunks" in e for e in files.values())
+            else None
+        )
+        self.archives = ArchiveReader(backup_root)
+
+    def open_stored(self, rel_path, entry):
+        """Open the backed-up content of a file as a binary stream"""
+        if "chunks" in entry:
+            return ChunkStream(self.store, entry["chunks"])
+        if "pack" in entry:
+            return io.BytesIO(pack.read_packed(self.backup_root, entry))
+        if "archive" in entry:
+            zf = self.archives.get(entry["archive"])
+            return zf.open(archive.member_name(rel_path))
+        return open(
+            os.path.join(self.backup_root, entry["snapshot"], rel_path),
+            "rb",
+            buffering=0,
+        )
+
+    def check_manifest(self, rel_path, entry):
+        """Compare stored content with what the snapshot recorded about it"""
+        try:
+            with self.open_stored(rel_path, entry) as stream:
+                # Reading a zip member to the end also checks its CRC-32
+                digest, size = hash_stream(stream)
+        except FileNotFoundError:
+            return MISSING, 0, "stored data not found", None
+        except KeyError:
+            return MISSING, 0, "not in the archive", None
+
+        if size != entry["size"]:
+            return MISMATCH, size, f"size {size} != {entry['size']}", None
+        if "sha256" in entry and digest != entry["sha256"]:
+            return MISMATCH, size, "sha256 differs", None
+        return OK, size, None, None
+
+    def check_chunk(self, digest):
+        """Re-hash one chunk of the store and compare it with its name"""
+        try:
+            chunk_digest, size = hash_file(self.store.chunk_path(digest))
+        except FileNotFoundError:
+            return MISSING, 0, "chunk not found", None
+        if chunk_digest != digest:
+            return MISMATCH, size, "chunk content differs", None
+        return OK, size, None, None
+
+    def check_source(self, source_path, rel_path, entry):
+        """Compare stored content with the source file it was copied from"""
+        try:
+            source_stat = os.stat(source_path)
+        except FileNotFoundError:
+            return CHANGED, 0, "deleted from the source", None
+        if not journal.is_unchanged(entry, source_stat):
+            return CHANGED, 0, "modified since the backup", None
+
+        try:
+            with self.open_stored(rel_path, entry) as stream:
+                stored_digest, stored_size = hash_stream(stream)
+        except (FileNotFoundError, KeyError):
+            return MISSING, 0, "stored data not found", None
+        source_digest, source_size = hash_file(source_path)
+
+        read = stored_size + source_size
+        if stored_digest != source_digest:
+            return MISMATCH, read, "content differs from the source", None
+        return OK, read, None, stored_digest
+
+    def close(self):
+        self.archives.close()
+
+
+def verify_snapshot(
+    backup_root,
+    snapshot=None,
+    source_dir=None,
+    max_workers=DEFAULT_VERIFY_WORKERS,
+):
+    """Verify a snapshot against its manifest, or against source_dir if given
+
+    Source verification stores the sha256 of copied files in the journal, so
+    later manifest checks can detect silent corruption without the source.
+    Returns a stats dict, or None when no snapshot journal exists.
+    """
+    snapshot, files = journal.load_journal(backup_root, snapshot)
+    if not snapshot:
+        logging.error(f"❌ No snapshot journal found in {backup_root}")
+        return None
+
+    mode = "source" if source_dir else "manifest"
+    print(f"\n🔍 Verifying snapshot {snapshot} against its {mode}...\n")
+
+    stats = {OK: 0, MISMATCH: 0, MISSING: 0, CHANGED: 0, "bytes": 0}
+    problems = []
+    recorded = 0
+    verifier = SnapshotVerifier(backup_root, files)
+    started = time.perf_counter()
+
+    def collect(futures):
+        nonlocal recorded
+        for future in futures:
+            label, entry = pending.pop(future)
+            try:
+                status, size, detail, digest = future.result()
+            except Exception as e:
+                status, size, detail, digest = MISMATCH, 0, str(e), None
+            stats[status] += 1
+            stats["bytes"] += size
+            if status in (MISMATCH, MISSING):
+                problems.append((label, status, detail))
+                logging.error(f"  ✗ {label}: {detail}")
+            elif digest and entry is not None and "chunks" not in entry:
+                if entry.get("sha256") != digest:
+                    # Entries may be shared with a cached journal: replace it
+                    files[label] = dict(entry, sha256=digest)
+                    recorded += 1
+
+    workers = max(1, int(max_workers))
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def submit(label, entry, func, *args):
+            if len(pending) >= workers * 4:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[executor.submit(func, *args)] = (label, entry)
+
+        try:
+            if source_dir:
+                for rel_path, entry in files.items():
+                    submit(
+                        rel_path,
+                        entry,
+                        verifier.check_source,
+                        os.path.join(source_dir, rel_path),
+                        rel_path,
+                        entry,
+                    )
+            else:
+                # Each chunk is checked once, however many files share it
+                digests = set()
+                for rel_path, entry in files.items():
+                    if "chunks" in entry:
+                        digests.update(entry["chunks"])
+                    else:
+                        submit(
+                            rel_path, entry, verifier.check_manifest, rel_path, entry
+                        )
+                for digest in digests:
+                    submit(f"chunk {digest[:12]}", None, verifier.check_chunk, digest)
+
+            collect(wait(pending).done)
+        finally:
+            verifier.close()
+
+    if recorded:
+        journal.save_journal(backup_root, snapshot, files)
+
+    stats["elapsed"] = time.perf_counter() - started
+    stats["throughput_mb_s"] = (
+        stats["bytes"] / (1024 * 1024) / stats["elapsed"] if stats["elapsed"] else 0.0
+    )
+    stats["problems"] = problems
+    stats["recorded"] = recorded
+    return stats
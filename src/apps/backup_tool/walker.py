@@ -0,0 +1,63 @@
+"""
+Source tree walker for the Backup Tool
+Generator over os.scandir that yields files lazily, so memory stays flat
+no matter how many entries a folder holds.
+"""
+
+import logging
+import os
+
+
+def exclude_paths(exclude_dir):
+    """Normalize one folder or a list of folders to skip into a set"""
+    if not exclude_dir:
+        return set()
+    if isinstance(exclude_dir, str):
+        exclude_dir = [exclude_dir]
+    return {os.path.normpath(path) for path in exclude_dir}
+
+
+def walk_files(source_dir, exclude_dir=None, include_dir=None):
+    """Yield (relative_path, full_path, stat_result) for every file under source_dir
+
+    include_dir(relative_path) can prune whole folders before they are read.
+    Keeps one open scandir iterator per directory level instead of listing
+    whole folders. The stat result comes from the DirEntry (a single stat
+    call on POSIX); on Windows, where its inode is always 0, os.stat fills
+    it in so journal entries match across runs. Symlinked folders are not
+    followed, to avoid loops; symlinked files are backed up by content.
+    """
+    excluded = exclude_paths(exclude_dir)
+    stack = [(os.scandir(source_dir), "")]
+
+    try:
+        while stack:
+            iterator, rel_dir = stack[-1]
+            entry = next(iterator, None)
+            if entry is None:
+                iterator.close()
+                stack.pop()
+                continue
+
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # Never descend into the backup root if it lives in the source
+                    if excluded and os.path.normpath(entry.path) in excluded:
+                        continue
+                    if include_dir and not include_dir(rel_path):
+                        continue
+                    stack.append((os.scandir(entry.path), rel_path))
+                elif entry.is_file():
+                    stat_result = entry.stat()
+                    if not stat_result.st_ino:
+                        # Windows leaves the inode out of DirEntry.stat();
+                        # the journal and watch mode compare os.stat's
+                        stat_result = os.stat(entry.path)
+                    yield rel_path, entry.path, stat_result
+            except OSError as e:
+                logging.error(f"Cannot read '{entry.path}': {e}")
+    finally:
+        # Release open folder handles if the caller stops early
+        for iterator, _ in stack:
+            iterator.close()
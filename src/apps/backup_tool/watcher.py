@@ -0,0 +1,244 @@
+"""
+Change watching for the Backup Tool's watch mode
+Reports which source paths changed, using inotify on Linux (through ctypes,
+no extra dependency) and a polling scan elsewhere. watch_changes() debounces
+bursts and hands batches of changed paths to a callback, so each snapshot
+only looks at what changed.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from walker import exclude_paths, walk_files
+
+# inotify flags from linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+# Returned instead of a set when the watcher lost track and a full scan is due
+RESCAN = None
+SCAN_SHARE = 0.1  # most of the time polling may spend scanning the tree
+
+
+class InotifyWatcher:
+    """Watches every folder of the source with one inotify descriptor"""
+
+    def __init__(self, source_dir, include_dir=None, exclude_dir=None):
+        self.source_dir = source_dir
+        self.include_dir = include_dir
+        self.excluded = exclude_paths(exclude_dir)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        try:
+            self._add_tree("")
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add_watch(self, rel_dir):
+        path = os.path.join(self.source_dir, rel_dir)
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached")
+            return  # folder vanished meanwhile
+        self.watches[wd] = rel_dir
+
+    def _add_tree(self, rel_dir):
+        """Watch a folder and all folders under it"""
+        self._add_watch(rel_dir)
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            folder = os.path.join(self.source_dir, current)
+            try:
+                entries = list(os.scandir(folder))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                child = os.path.join(current, entry.name) if current else entry.name
+                if self.excluded and os.path.normpath(entry.path) in self.excluded:
+                    continue
+                if self.include_dir and not self.include_dir(child):
+                    continue
+                self._add_watch(child)
+                stack.append(child)
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds; return changed relative paths or RESCAN"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    return RESCAN
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+
+                rel_dir = self.watches.get(wd)
+                if rel_dir is None:
+                    continue
+                if not name:
+                    changed.add(rel_dir)
+                    continue
+
+                rel_path = os.path.join(rel_dir, os.fsdecode(name))
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    if not self.include_dir or self.include_dir(rel_path):
+                        self._add_tree(rel_path)
+                changed.add(rel_path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback that rescans the tree every interval and diffs stat results
+
+    A scan costs the size of the tree, so on large trees the interval is
+    stretched to keep scanning under SCAN_SHARE of the time.
+    """
+
+    def __init__(self, source_dir, include_dir=None, exclude_dir=None, interval=30.0):
+        self.source_dir = source_dir
+        self.include_dir = include_dir
+        self.exclude_dir = exclude_dir
+        self.interval = interval
+        self.stretched = False
+        self.state = self._scan()
+
+    def _scan(self):
+        started = time.monotonic()
+        state = {
+            rel_path: (stat_result.st_size, stat_result.st_mtime_ns)
+            for rel_path, _, stat_result in walk_files(
+                self.source_dir, self.exclude_dir, self.include_dir
+            )
+        }
+        now = time.monotonic()
+        interval = max(self.interval, (now - started) / SCAN_SHARE)
+        if interval > self.interval * 1.5 and not self.stretched:
+            logging.info(f"🐢 Scans are slow, polling every {interval:.0f}s instead")
+            self.stretched = True
+        self.next_scan = now + interval
+        return state
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds; return changed relative paths"""
+        delay = self.next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, delay))
+
+        state = self._scan()
+        changed = {p for p, s in state.items() if self.state.get(p) != s}
+        changed.update(p for p in self.state if p not in state)
+        self.state = state
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(source_dir, include_dir=None, exclude_dir=None, interval=30.0):
+    """Use inotify where available, polling otherwise"""
+    if sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyWatcher(source_dir, include_dir, exclude_dir)
+            logging.info(f"👀 Watching {len(watcher.watches)} folders with inotify")
+            return watcher
+        except (OSError, AttributeError) as e:
+            logging.warning(f"⚠️  inotify unavailable ({e}), falling back to polling")
+
+    logging.info(f"👀 Polling {source_dir} every {interval:.0f}s")
+    return PollingWatcher(source_dir, include_dir, exclude_dir, interval)
+
+
+def watch_changes(watcher, on_batch, debounce=2.0, max_delay=30.0):
+    """Feed batches of changed paths to on_batch until interrupted
+
+    A batch is flushed once no event arrived for `debounce` seconds, or
+    `max_delay` seconds after its first event when changes never settle.
+    on_batch receives RESCAN when the watcher lost events.
+    """
+    pending = set()
+    rescan = False
+    first_event = last_event = None
+
+    while True:
+        changed = watcher.poll(debounce)
+        now = time.monotonic()
+
+        if changed is RESCAN:
+            rescan = True
+        if changed is RESCAN or changed:
+            pending.update(changed or ())
+            first_event = first_event or now
+            last_event = now
+            if now - first_event < max_delay:
+                continue
+
+        if first_event and (
+            now - last_event >= debounce or now - first_event >= max_delay
+        ):
+            on_batch(RESCAN if rescan else pending)
+            pending = set()
+            rescan = False
+            first_event = last_event = None
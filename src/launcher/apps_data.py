@@ -95,11 +95,13 @@ def get_apps(base_dir: Path) -> dict:
                     "Backup completo de diretórios",
                     "Timestamp automático",
                     "Preserva estrutura de pastas",
+                    "Backup incremental (só arquivos alterados)",
                 ],
                 "image_path": base_dir / "demos" / "legacy" / "backup_tool.gif",
                 "path": base_dir / "apps" / "backup_tool" / "app.py",
                 "cwd": base_dir / "apps" / "backup_tool",
                 "requires_config": True,
+                "supports_dry_run": True,
                 "config_fields": {
                     "source_dir": {
                         "label": "Pasta de Origem",
@@ -107,10 +109,15 @@ def get_apps(base_dir: Path) -> dict:
                         "default": r"C:\Seu\Caminho\Origem",
                     },
                     "dest_dir": {
-                        "label": "Pasta de Destino",
+                        "label": "Pasta de Destino (vários destinos separados por ;, aceita s3://, sftp:// e file://; remotos sem checkpoint, retenção e catálogo)",
                         "type": "text",
                         "default": r"C:\Seu\Caminho\Destino",
                     },
+                    "s3_endpoint": {
+                        "label": "Endpoint S3 compatível (ex: http://localhost:9000, vazio = AWS)",
+                        "type": "text",
+                        "default": "",
+                    },
                     "include_extensions": {
                         "label": "Tipo de Arquivos para Backup",
                         "type": "multiselect",
@@ -122,6 +129,104 @@ def get_apps(base_dir: Path) -> dict:
                             ".py, .js, .html, .css, .json, .md": "Código (.py, .js, .html...)",
                         },
                     },
+                    "backup_mode": {
+                        "label": "Modo de Backup",
+                        "type": "select",
+                        "default": "full",
+                        "options": {
+                            "full": "Completo (copia tudo)",
+                            "incremental": "Incremental (só arquivos alterados)",
+                            "snapshot": "Snapshot (hardlinks, árvore completa)",
+                        },
+                    },
+                    "storage_format": {
+                        "label": "Formato do Destino",
+                        "type": "select",
+                        "default": "tree",
+                        "options": {
+                            "tree": "Pastas (cópia dos arquivos)",
+                            "chunks": "Chunk store (deduplicado)",
+                            "archive": "Arquivo .zip compactado",
+                        },
+                    },
+                    "ignore_file": {
+                        "label": "Arquivo de Regras (.backupignore)",
+                        "type": "text",
+                        "default": ".backupignore",
+                    },
+                    "max_workers": {
+                        "label": "Cópias Simultâneas (threads)",
+                        "type": "text",
+                        "default": "4",
+                    },
+                    "delta_min_size": {
+                        "label": "Transferência Delta a partir de (ex: 64MB, 0 = desligado)",
+                        "type": "text",
+                        "default": "0",
+                    },
+                    "pack_threshold": {
+                        "label": "Agrupar em Pacotes Arquivos Menores que (ex: 64KB, 0 = desligado)",
+                        "type": "text",
+                        "default": "0",
+                    },
+                    "remote_pack_threshold": {
+                        "label": "Destinos Remotos: Agrupar em Pacotes Arquivos Menores que (ex: 1MB, 0 = desligado)",
+                        "type": "text",
+                        "default": "1MB",
+                    },
+                    "split_min_size": {
+                        "label": "Copiar em Partes Paralelas Arquivos Maiores que (ex: 1GB, 0 = desligado)",
+                        "type": "text",
+                        "default": "0",
+                    },
+                    "max_mb_s": {
+                        "label": "Limite de Banda (MB/s, 0 = sem limite)",
+                        "type": "text",
+                        "default": "0",
+                    },
+                    "max_iops": {
+                        "label": "Limite de Operações de E/S por segundo (0 = sem limite)",
+                        "type": "text",
+                        "default": "0",
+                    },
+                    "idle_priority": {
+                        "label": "Prioridade Baixa (não atrapalhar o servidor)",
+                        "type": "select",
+                        "default": "no",
+                        "options": {
+                            "no": "Não (prioridade normal)",
+                            "yes": "Sim (CPU e disco em prioridade ociosa)",
+                        },
+                    },
+                    "record_checksums": {
+                        "label": "Registrar SHA-256 Durante a Cópia (verify detecta corrupção)",
+                        "type": "select",
+                        "default": "no",
+                        "options": {
+                            "no": "Não (cópia no kernel, verify só confere tamanhos)",
+                            "yes": "Sim (lê e grava cada arquivo no Python)",
+                        },
+                    },
+                    "keep_hourly": {
+                        "label": "Manter Snapshots por Hora (0 = nenhum; todos em 0 = sem limpeza)",
+                        "type": "text",
+                        "default": "0",
+                    },
+                    "keep_daily": {
+                        "label": "Manter Snapshots Diários (0 = nenhum; todos em 0 = sem limpeza)",
+                        "type": "text",
+                        "default": "0",
+                    },
+                    "keep_weekly": {
+                        "label": "Manter Snapshots Semanais (0 = nenhum; todos em 0 = sem limpeza)",
+                        "type": "text",
+                        "default": "0",
+                    },
+                    "keep_monthly": {
+                        "label": "Manter Snapshots Mensais (0 = nenhum; todos em 0 = sem limpeza)",
+                        "type": "text",
+                        "default": "0",
+                    },
                 },
             },
         ],
@@ -1,11 +1,13 @@
 """
 Dialog management for PyFlow Suite Launcher
-Handles all modal dialogs (app info, configuration, errors)
+Handles all modal dialogs (app info, configuration, reports, errors)
 """
 
 import flet as ft
+import os
 import subprocess
 import sys
+import threading
 
 
 class DialogManager:
@@ -25,12 +27,23 @@ class DialogManager:
             modal=True, title=ft.Text(""), content=ft.Text(""), actions=[]
         )
 
+        self.report_dialog = ft.AlertDialog(
+            modal=True, title=ft.Text(""), content=ft.Text(""), actions=[]
+        )
+
         self.error_dialog = ft.AlertDialog(
             modal=True, title=ft.Text(""), content=ft.Text(""), actions=[]
         )
 
         # Add to overlay
-        page.overlay.extend([self.info_dialog, self.config_dialog, self.error_dialog])
+        page.overlay.extend(
+            [
+                self.info_dialog,
+                self.config_dialog,
+                self.report_dialog,
+                self.error_dialog,
+            ]
+        )
 
     def launch_app(self, app_info):
         """Launch the application"""
@@ -134,6 +147,16 @@ class DialogManager:
                 )
             )
 
+        # Add Dry Run button if app can plan a run without executing it
+        if app_info.get("supports_dry_run"):
+            actions.append(
+                ft.OutlinedButton(
+                    "Simular",
+                    icon="query_stats",
+                    on_click=lambda e: self._run_dry_run(app_info, e.control),
+                )
+            )
+
         # Add Launch button
         actions.append(
             ft.FilledButton(
@@ -261,6 +284,20 @@ class DialogManager:
         self.error_dialog.open = True
         self.page.update()
 
+    def show_report(self, title, message):
+        """Show a report (e.g. a dry run) in a scrollable dialog"""
+        self.report_dialog.title = ft.Text(title)
+        self.report_dialog.content = ft.Column(
+            [ft.Text(message, font_family="monospace", selectable=True)],
+            scroll=ft.ScrollMode.AUTO,
+            tight=True,
+        )
+        self.report_dialog.actions = [
+            ft.TextButton("OK", on_click=lambda e: self._close_report())
+        ]
+        self.report_dialog.open = True
+        self.page.update()
+
     def _close_info(self):
         """Close info dialog"""
         self.info_dialog.open = False
@@ -271,6 +308,11 @@ class DialogManager:
         self.config_dialog.open = False
         self.page.update()
 
+    def _close_report(self):
+        """Close report dialog"""
+        self.report_dialog.open = False
+        self.page.update()
+
     def _close_error(self):
         """Close error dialog"""
         self.error_dialog.open = False
@@ -282,6 +324,56 @@ class DialogManager:
         self.page.update()
         self.show_config_dialog(app_info)
 
+    def _run_dry_run(self, app_info, button):
+        """Start the app's plan command in the background"""
+        if app_info.get("requires_config") and not self.config_mgr.load_config(
+            app_info["id"]
+        ):
+            self.show_error(
+                "Configuração necessária",
+                f"Por favor, configure o app '{app_info['name']}' antes de simular.",
+            )
+            return
+
+        # The plan walks the whole source; keep the UI responsive meanwhile
+        button.disabled = True
+        button.text = "Simulando..."
+        self.page.update()
+        threading.Thread(
+            target=self._dry_run_worker, args=(app_info, button), daemon=True
+        ).start()
+
+    def _dry_run_worker(self, app_info, button):
+        """Run the plan command and show its report (runs on a worker thread)"""
+        try:
+            result = subprocess.run(
+                [sys.executable, str(app_info["path"]), "plan"],
+                cwd=str(app_info["cwd"]),
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                timeout=600,
+                env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+            )
+        except Exception as e:
+            self._restore_button(button, "Simular")
+            self.show_error("Erro", f"Falha ao simular: {e}")
+            return
+
+        self._restore_button(button, "Simular")
+        if result.returncode != 0 or not result.stdout.strip():
+            # Errors are only logged to stderr
+            details = result.stderr.strip()[-2000:] or "Nenhum resultado."
+            self.show_error("Erro ao Simular", details)
+        else:
+            self.show_report("Simulação", result.stdout.strip())
+
+    def _restore_button(self, button, text):
+        """Re-enable a button disabled while a background task ran"""
+        button.disabled = False
+        button.text = text
+
     def _launch_coordinate_picker(self, app_info):
         """Launch coordinate picker utility"""
         script_path = app_info["cwd"] / "capture_coordinates.py"
@@ -0,0 +1,290 @@
+"""
+Tests for the Backup Tool's destination backends
+The S3 paths run against FakeS3Client, an in-memory stand-in for the parts
+of the boto3 client the backend uses, so no server or boto3 is needed.
+With boto3 and moto installed, S3EndpointTest also runs the real boto3
+calls against a local moto server given as the S3 endpoint.
+"""
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "src", "apps", "backup_tool")
+)
+
+from backends import (  # noqa: E402
+    MultipartUpload,
+    PackBuffer,
+    S3Backend,
+    join_key,
+    open_backend,
+)
+from copy_engine import CopyEngine  # noqa: E402
+
+try:
+    import boto3
+    from moto.server import ThreadedMotoServer
+except ImportError:
+    boto3 = None
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class FakeS3Client:
+    """In-memory S3 with the calls and checks S3Backend relies on"""
+
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket, Key, Range=None):
+        if (Bucket, Key) not in self.objects:
+            raise NoSuchKey(Key)
+        data = self.objects[(Bucket, Key)]
+        if Range is not None:
+            match = re.fullmatch(r"bytes=(\d+)-(\d+)", Range)
+            if not match or int(match.group(2)) < int(match.group(1)):
+                raise ValueError(f"invalid range {Range}")
+            data = data[int(match.group(1)) : int(match.group(2)) + 1]
+        return {"Body": FakeBody(data)}
+
+    def create_multipart_upload(self, Bucket, Key):
+        with self.lock:
+            upload_id = f"upload-{len(self.uploads) + 1}"
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(parts), "every uploaded part must be listed"
+        for part in MultipartUpload["Parts"]:
+            assert part["ETag"] == f'"etag-{part["PartNumber"]}"'
+        self.objects[(Bucket, Key)] = b"".join(parts[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(UploadId)
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class S3BackendTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeS3Client()
+        self.backend = S3Backend(
+            "s3://bucket/prefix", "bucket", "prefix", client=self.client
+        )
+
+    def test_keys_live_under_the_prefix(self):
+        self.backend.put_bytes("a/b.txt", b"data")
+        self.assertIn(("bucket", "prefix/a/b.txt"), self.client.objects)
+        self.assertEqual(self.backend.get_bytes("a/b.txt"), b"data")
+
+    def test_missing_object_is_file_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            self.backend.get_bytes("missing")
+
+    def test_get_range(self):
+        self.backend.put_bytes("pack", bytes(range(100)))
+        self.assertEqual(self.backend.get_range("pack", 10, 5), bytes(range(10, 15)))
+        self.assertEqual(self.backend.get_range("pack", 99, 1), bytes([99]))
+
+
+class MultipartUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeS3Client()
+        self.backend = S3Backend("s3://bucket", "bucket", "", client=self.client)
+        handle, self.path = tempfile.mkstemp()
+        self.data = os.urandom(10_000)
+        with os.fdopen(handle, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_parts_are_reassembled_in_order(self):
+        upload = MultipartUpload(self.backend, "big", self.path, part_size=3000)
+        self.assertEqual([part[0] for part in upload.ranges], [1, 2, 3, 4])
+        results = [upload.copy_range(*part) for part in reversed(upload.ranges)]
+        sizes = [upload.range_done(size) for size in results]
+        self.assertEqual(sizes[-1], len(self.data))
+        self.assertEqual(self.client.objects[("bucket", "big")], self.data)
+        self.assertEqual(self.client.uploads, {})
+
+    def test_failed_part_aborts_the_upload(self):
+        upload = MultipartUpload(self.backend, "big", self.path, part_size=3000)
+        for part in upload.ranges[:-1]:
+            upload.range_done(upload.copy_range(*part))
+        self.assertTrue(upload.fail())
+        self.assertEqual(len(self.client.aborted), 1)
+        self.assertNotIn(("bucket", "big"), self.client.objects)
+
+    def test_changed_source_is_not_completed(self):
+        upload = MultipartUpload(self.backend, "big", self.path, part_size=3000)
+        results = [upload.copy_range(*part) for part in upload.ranges]
+        with open(self.path, "ab") as f:
+            f.write(b"more")
+        with self.assertRaises(OSError):
+            for size in results:
+                upload.range_done(size)
+        self.assertEqual(len(self.client.aborted), 1)
+        self.assertNotIn(("bucket", "big"), self.client.objects)
+
+    def test_copy_engine_uploads_parts_in_parallel(self):
+        done = []
+        with CopyEngine(max_workers=4) as engine:
+            engine.submit_split(
+                MultipartUpload(self.backend, "big", self.path, part_size=1000),
+                on_success=done.append,
+            )
+        self.assertEqual(done, [len(self.data)])
+        self.assertEqual(engine.copied, 1)
+        self.assertEqual(self.client.objects[("bucket", "big")], self.data)
+
+
+@unittest.skipIf(boto3 is None, "needs boto3 and moto")
+class S3EndpointTest(unittest.TestCase):
+    """The real boto3 client against a local S3-compatible server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.env = mock.patch.dict(
+            os.environ,
+            {
+                "AWS_ACCESS_KEY_ID": "testing",
+                "AWS_SECRET_ACCESS_KEY": "testing",
+                "AWS_DEFAULT_REGION": "us-east-1",
+            },
+        )
+        cls.env.start()
+        cls.server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+        cls.server.start()
+        host, port = cls.server.get_host_and_port()
+        cls.endpoint = f"http://{host}:{port}"
+        boto3.client("s3", endpoint_url=cls.endpoint).create_bucket(Bucket="bucket")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.env.stop()
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.options = {"s3_endpoint": self.endpoint, "max_workers": 4}
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def write(self, rel_path, data):
+        path = os.path.join(self.base, "src", rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_multipart_upload_through_the_endpoint(self):
+        # S3 wants parts of 5 MB or more, except the last one
+        data = os.urandom(12 * 1024 * 1024)
+        path = self.write("big.bin", data)
+        with open_backend("s3://bucket/multi", self.options) as backend:
+            with CopyEngine(max_workers=4) as engine:
+                engine.submit_split(
+                    MultipartUpload(backend, "big.bin", path, part_size=5 << 20)
+                )
+            self.assertEqual(engine.errors, [])
+            self.assertEqual(backend.get_bytes("big.bin"), data)
+            self.assertEqual(
+                backend.get_range("big.bin", 5 << 20, 4), data[5 << 20 :][:4]
+            )
+            self.assertEqual(backend.list(""), ["big.bin"])
+
+    def test_backup_and_restore_through_the_endpoint(self):
+        import app
+        import restore
+
+        contents = {f"d{i % 3}/f{i}.txt": os.urandom(i * 100) for i in range(30)}
+        contents["large.bin"] = os.urandom(3 * 1024 * 1024)
+        for rel_path, data in contents.items():
+            self.write(rel_path, data)
+
+        url = "s3://bucket/backups"
+        stats = app.backup_remote(os.path.join(self.base, "src"), url, [], self.options)
+        self.assertEqual(stats["errors"], 0)
+        self.assertEqual(stats["copied"], len(contents))
+        self.assertGreater(stats["packed"], 0)
+
+        target = os.path.join(self.base, "restored")
+        with open_backend(url, self.options) as backend:
+            restored = restore.restore_snapshot(url, None, target, backend=backend)
+        self.assertEqual(restored["errors"], 0)
+        for rel_path, data in contents.items():
+            with open(os.path.join(target, rel_path), "rb") as f:
+                self.assertEqual(f.read(), data, rel_path)
+
+
+class PackBufferTest(unittest.TestCase):
+    def test_members_get_offsets_in_their_pack(self):
+        packer = PackBuffer("snap", max_pack_size=10)
+        first, second = {}, {}
+        self.assertIsNone(packer.add(b"abcd", "a", first))
+        self.assertIsNone(packer.add(b"efg", "b", second))
+        self.assertEqual((first["pack"], first["offset"]), ("snap_0001.pack", 0))
+        self.assertEqual((second["pack"], second["offset"]), ("snap_0001.pack", 4))
+        name, data, members = packer.flush()
+        self.assertEqual((name, data), ("snap_0001.pack", b"abcdefg"))
+        self.assertEqual([rel_path for rel_path, _ in members], ["a", "b"])
+        self.assertIsNone(packer.flush())
+
+    def test_full_pack_is_handed_back_before_it_overflows(self):
+        packer = PackBuffer("snap", max_pack_size=10)
+        packer.add(b"123456", "a", {})
+        entry = {}
+        name, data, members = packer.add(b"7890ab", "b", entry)
+        self.assertEqual((name, data), ("snap_0001.pack", b"123456"))
+        self.assertEqual((entry["pack"], entry["offset"]), ("snap_0002.pack", 0))
+        self.assertEqual(packer.flush()[1], b"7890ab")
+        self.assertEqual((packer.packs, packer.files), (2, 2))
+
+    def test_empty_files_share_an_offset(self):
+        packer = PackBuffer("snap")
+        entries = [{}, {}]
+        for index, entry in enumerate(entries):
+            packer.add(b"", f"empty{index}", entry)
+        self.assertEqual([entry["offset"] for entry in entries], [0, 0])
+
+
+class JoinKeyTest(unittest.TestCase):
+    def test_join_key_drops_empty_parts_and_slashes(self):
+        self.assertEqual(join_key("", "/a/", "b"), "a/b")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Tests for the Backup Tool's catalog lookups
+find answers from the latest version of each path, through the trigram
+index when SQLite has one, and catalogs of the previous schema migrate.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "src", "apps", "backup_tool")
+)
+
+import catalog  # noqa: E402
+
+
+def entry(size, mtime_ns=1):
+    return {"size": size, "mtime_ns": mtime_ns, "ino": 0, "snapshot": "s"}
+
+
+FILES = {
+    os.path.join("docs", "Report_2024.pdf"): entry(1),
+    os.path.join("docs", "Report%2024.pdf"): entry(2),
+    os.path.join("docs", "notes.txt"): entry(3),
+    os.path.join("src", "report.py"): entry(4),
+}
+
+
+class CatalogFindTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def found(self, db, pattern):
+        return [row[0] for row in db.find(pattern)]
+
+    def test_find_by_part_glob_and_literal_wildcards(self):
+        with catalog.Catalog(self.root) as db:
+            db.add_snapshot("s1", FILES)
+            self.assertEqual(
+                self.found(db, "REPORT"),
+                ["docs/Report%2024.pdf", "docs/Report_2024.pdf", "src/report.py"],
+            )
+            self.assertEqual(self.found(db, "report_"), ["docs/Report_2024.pdf"])
+            self.assertEqual(self.found(db, "*.txt"), ["docs/notes.txt"])
+            self.assertEqual(self.found(db, "re?ort.py"), ["src/report.py"])
+            self.assertEqual(self.found(db, "no"), ["docs/notes.txt"])
+
+    def test_find_shows_the_latest_surviving_version(self):
+        changed = dict(FILES, **{os.path.join("src", "report.py"): entry(9, 2)})
+        with catalog.Catalog(self.root) as db:
+            db.add_snapshot("s1", FILES)
+            db.add_snapshot("s2", changed)
+            self.assertEqual(
+                db.find("report.py"), [("src/report.py", 9, 2, "s2", "s2")]
+            )
+            db.forget(["s2"])
+            self.assertEqual(
+                db.find("report.py"), [("src/report.py", 4, 1, "s1", "s1")]
+            )
+
+    def test_previous_schema_is_migrated(self):
+        with catalog.Catalog(self.root) as db:
+            db.add_snapshot("s1", FILES)
+        # Catalogs of schema 1 had no latest column and no name index
+        db = sqlite3.connect(catalog.get_catalog_path(self.root))
+        with db:
+            db.execute("DROP TRIGGER paths_fts_delete")
+            db.execute("DROP TABLE paths_fts")
+            db.execute("ALTER TABLE paths DROP COLUMN latest")
+            db.execute("PRAGMA user_version = 1")
+        db.close()
+        with catalog.Catalog(self.root) as db:
+            self.assertEqual(self.found(db, "notes"), ["docs/notes.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Tests for resuming interrupted backups
+A run stopped partway leaves its checkpoint log; the next run must pick the
+same snapshot, keep the files the log lists without copying them again and
+finish with a journal covering the whole source.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "src", "apps", "backup_tool")
+)
+
+import app  # noqa: E402
+import checkpoint  # noqa: E402
+import journal  # noqa: E402
+import restore  # noqa: E402
+
+SNAPSHOT = "2024-01-01_10-00-00"
+
+
+def interrupt_after(count):
+    """Wrap iter_backup_files so the walk stops like a Ctrl+C after count files"""
+    walk = app.iter_backup_files
+
+    def interrupted(*args, **kwargs):
+        for i, item in enumerate(walk(*args, **kwargs)):
+            if i == count:
+                raise KeyboardInterrupt
+            yield item
+
+    return interrupted
+
+
+class ResumeTest(unittest.TestCase):
+    FILES = 40
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.source = os.path.join(self.base, "src")
+        self.root = os.path.join(self.base, "backup")
+        self.contents = {}
+        for i in range(self.FILES):
+            rel_path = os.path.join(f"d{i % 4}", f"f{i}.txt")
+            path = os.path.join(self.source, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(f"file {i} " * (i * 10))
+            self.contents[rel_path] = f"file {i} " * (i * 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def run_backup(self, options):
+        snapshot = app.choose_snapshot(self.root, options)
+        destination = os.path.join(self.root, snapshot)
+        os.makedirs(destination, exist_ok=True)
+        stats = app.perform_backup(self.source, destination, [], options)
+        journal.record_run(self.root, snapshot, options["storage_format"], stats)
+        return snapshot, stats
+
+    def copied_files(self, completed):
+        """Identity of the destination copies of the given finished files"""
+        identity = {}
+        for rel_path, entry in completed.items():
+            if "pack" not in entry:
+                st = os.stat(os.path.join(self.root, SNAPSHOT, rel_path))
+                identity[rel_path] = (st.st_ino, st.st_mtime_ns)
+        return identity
+
+    def check(self, options):
+        with mock.patch.object(app, "new_snapshot_name", return_value=SNAPSHOT):
+            with mock.patch.object(app, "iter_backup_files", interrupt_after(25)):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.run_backup(options)
+
+            # No journal yet, only the log of the files that were finished
+            self.assertEqual(journal.list_snapshots(self.root), [])
+            unfinished, header = checkpoint.find_unfinished(self.root)
+            self.assertEqual(unfinished, SNAPSHOT)
+            self.assertEqual(header["storage_format"], options["storage_format"])
+            completed = checkpoint.read_completed(self.root, SNAPSHOT)
+            self.assertEqual(len(completed), 25)
+            before = self.copied_files(completed)
+
+            # A crash while writing a record leaves a torn last line
+            log_path = os.path.join(
+                checkpoint.get_checkpoint_dir(self.root), f"{SNAPSHOT}.log"
+            )
+            with open(log_path, "a") as f:
+                f.write('{"path": "d0/f')
+
+            snapshot, stats = self.run_backup(options)
+
+        self.assertEqual(snapshot, SNAPSHOT)
+        self.assertEqual(stats["errors"], 0)
+        self.assertEqual(stats["resumed"], 25)
+        self.assertEqual(stats["copied"], self.FILES - len(completed))
+        self.assertEqual(self.copied_files(completed), before)
+
+        self.assertEqual(checkpoint.find_unfinished(self.root), (None, None))
+        self.assertEqual(journal.list_snapshots(self.root), [SNAPSHOT])
+        files = journal.load_journal(self.root, SNAPSHOT)[1]
+        self.assertEqual(set(files), set(self.contents))
+
+        target = os.path.join(self.base, "restored")
+        self.assertEqual(restore.restore_snapshot(self.root, None, target)["errors"], 0)
+        for rel_path, text in self.contents.items():
+            with open(os.path.join(target, rel_path)) as f:
+                self.assertEqual(f.read(), text, rel_path)
+
+    def test_resume_tree(self):
+        self.check({"backup_mode": "full", "storage_format": "tree"})
+
+    def test_resume_with_packs(self):
+        self.check(
+            {"backup_mode": "full", "storage_format": "tree", "pack_threshold": 200}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
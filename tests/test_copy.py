@@ -0,0 +1,98 @@
+"""
+Tests for the Backup Tool's copy paths
+A default run must keep the kernel copy methods of fast_copy, and files
+copied as byte ranges must come out identical to their source or fail.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "src", "apps", "backup_tool")
+)
+
+import app  # noqa: E402
+import fast_copy  # noqa: E402
+from copy_engine import CopyEngine  # noqa: E402
+
+
+class CopyMethodTest(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.source = os.path.join(self.base, "src")
+        os.makedirs(self.source)
+        for i in range(3):
+            with open(os.path.join(self.source, f"f{i}.bin"), "wb") as f:
+                f.write(os.urandom(100_000))
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def run_backup(self, **options):
+        destination = os.path.join(self.base, "backup", "2024-01-01_10-00-00")
+        os.makedirs(destination)
+        return app.perform_backup(self.source, destination, [], options)
+
+    def test_default_run_uses_the_fastest_method(self):
+        # The method fast_copy picks for this filesystem pair on its own
+        probe = os.path.join(self.base, "probe.bin")
+        _, expected = fast_copy.copy_file(os.path.join(self.source, "f0.bin"), probe)
+        stats = self.run_backup()
+        self.assertEqual(stats["methods"], {expected: 3})
+
+    def test_recorded_checksums_hash_the_copy(self):
+        stats = self.run_backup(record_checksums=True)
+        self.assertEqual(stats["methods"], {"hashed": 3})
+
+
+@unittest.skipUnless(fast_copy.RangeCopy.supported, "needs pread/pwrite")
+class RangeCopyTest(unittest.TestCase):
+    RANGE_SIZE = 64 * 1024
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.source = os.path.join(self.base, "big.bin")
+        self.dest = os.path.join(self.base, "copy.bin")
+        self.data = os.urandom(self.RANGE_SIZE * 7 + 1234)
+        with open(self.source, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def test_ranges_reassemble_the_file(self):
+        sizes = []
+        with CopyEngine(max_workers=4) as engine:
+            engine.submit_ranges(
+                self.source, self.dest, self.RANGE_SIZE, on_success=sizes.append
+            )
+        self.assertEqual(engine.errors, [])
+        self.assertEqual(engine.methods["ranges"], 1)
+        self.assertEqual(sizes, [len(self.data)])
+        with open(self.dest, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_wrong_write_fails_the_file(self):
+        ranged = fast_copy.RangeCopy(self.source, self.dest, self.RANGE_SIZE)
+        pwrite = os.pwrite
+
+        def bad_pwrite(fd, data, offset):
+            # The same number of bytes, but not the ones read
+            if offset == self.RANGE_SIZE * 3:
+                data = bytes(len(data))
+            return pwrite(fd, data, offset)
+
+        with mock.patch.object(fast_copy.os, "pwrite", bad_pwrite):
+            sizes = [ranged.copy_range(*part) for part in ranged.ranges]
+        for size in sizes[:-1]:
+            self.assertIsNone(ranged.range_done(size))
+        with self.assertRaisesRegex(OSError, f"at byte {self.RANGE_SIZE * 3}"):
+            ranged.range_done(sizes[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+Tests for the per-batch bookkeeping of watch-mode snapshots
+Delta journals, Merkle trees rebuilt along changed paths and the catalog
+updated from the changes must end up where a full rebuild would.
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "src", "apps", "backup_tool")
+)
+
+import app  # noqa: E402
+import catalog  # noqa: E402
+import journal  # noqa: E402
+import merkle  # noqa: E402
+
+
+def entry(size, mtime_ns=1):
+    return {"size": size, "mtime_ns": mtime_ns, "ino": 0, "snapshot": "s"}
+
+
+def change_some(files, rng, step):
+    """Edit, delete and add a few files; return (new files, changed paths)"""
+    files = dict(files)
+    changes = set()
+    for _ in range(rng.randint(1, 4)):
+        roll = rng.random()
+        if roll < 0.3:
+            rel_path = rng.choice(sorted(files))
+            files.pop(rel_path)
+            changes.add(rel_path)
+        elif roll < 0.6:
+            rel_path = rng.choice(sorted(files))
+            files[rel_path] = entry(files[rel_path]["size"] + 1, step)
+            changes.add(rel_path)
+        else:
+            # A changed folder: some of its files go, one new file appears
+            folder = rng.choice(["a", os.path.join("a", "b"), "c", "new"])
+            for rel_path in [p for p in files if p.startswith(folder + os.sep)]:
+                if rng.random() < 0.5:
+                    files.pop(rel_path)
+            files[os.path.join(folder, f"n{step}")] = entry(step)
+            changes.add(folder)
+    return files, changes
+
+
+def sample_files(rng, count=200):
+    folders = ["", "a", os.path.join("a", "b"), os.path.join("a", "b", "c"), "c"]
+    return {
+        os.path.join(rng.choice(folders), f"f{i}"): entry(rng.randint(0, 9))
+        for i in range(count)
+    }
+
+
+class IncrementalBookkeepingTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.rng = random.Random(7)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_batches(self, batches=30):
+        """Save snapshots the way watch mode does; yield (name, files, changes)
+
+        Changed folders are expanded to the files under them before and
+        after, like expand_changes does with the source and the journal.
+        """
+        files = sample_files(self.rng)
+        journal.save_journal(self.root, "s000", files)
+        merkle.MerkleStore(self.root).save_tree("s000", files)
+        yield "s000", files, None
+        previous = "s000"
+        for step in range(1, batches + 1):
+            files, changes = change_some(files, self.rng, step)
+            changes = journal.changed_files(self.root, previous, changes) | {
+                rel_path for rel_path in files if journal.in_changes(rel_path, changes)
+            }
+            name = f"s{step:03d}"
+            journal.save_journal(self.root, name, files, previous, changes)
+            yield name, files, changes
+            previous = name
+
+    def test_delta_journals_load_like_full_ones(self):
+        for name, files, _ in self.run_batches():
+            self.assertEqual(journal.load_journal(self.root, name), (name, files))
+        record = journal.read_record(self.root, name)
+        self.assertIn("base", record)
+        self.assertLess(len(record["files"]), len(files))
+
+    def test_changed_folders_expand_to_their_files(self):
+        folder = os.path.join("a", "b")
+        files = {
+            os.path.join(folder, "x"): entry(1),
+            os.path.join(folder, "y"): entry(2),
+            os.path.join("a", "bc"): entry(3),
+        }
+        files.update({f"f{i}": entry(i) for i in range(20)})
+        journal.save_journal(self.root, "s1", files)
+        changed = dict(files)
+        del changed[os.path.join(folder, "y")]
+        changed[os.path.join(folder, "n")] = entry(4)
+        changes = {os.path.join(folder, "y"), os.path.join(folder, "n")}
+        journal.save_journal(self.root, "s2", changed, "s1", changes)
+        self.assertIn("base", journal.read_record(self.root, "s2"))
+        self.assertEqual(
+            journal.changed_files(self.root, "s2", {folder}),
+            {os.path.join(folder, "x"), os.path.join(folder, "n")},
+        )
+
+    def test_root_change_covers_every_path(self):
+        previous = {os.path.join("a", "b.txt"): entry(1), "gone.txt": entry(2)}
+        self.assertTrue(journal.in_changes("gone.txt", {""}))
+        self.assertEqual(app.carry_over_entries(previous, {""}), {})
+        journal.save_journal(self.root, "s1", previous)
+        self.assertEqual(journal.changed_files(self.root, "s1", {""}), set(previous))
+
+    def test_large_changes_write_a_full_journal(self):
+        files = sample_files(self.rng)
+        journal.save_journal(self.root, "s1", files)
+        changed = {rel_path: entry(99) for rel_path in files}
+        journal.save_journal(self.root, "s2", changed, "s1")
+        self.assertNotIn("base", journal.read_record(self.root, "s2"))
+
+    def test_merkle_tree_updated_along_changes(self):
+        store = merkle.MerkleStore(self.root)
+        previous = None
+        for name, files, changes in self.run_batches():
+            if changes is not None:
+                root = store.save_tree(name, files, previous, changes)
+                full_root, _ = merkle.build_tree(merkle.journal_leaves(files))
+                self.assertEqual(root, full_root)
+            previous = name
+
+    def test_catalog_from_changes_matches_a_rebuild(self):
+        with catalog.Catalog(self.root) as db:
+            for name, files, changes in self.run_batches():
+                db.add_snapshot(name, files, changes)
+            incremental = self.versions(db)
+            db.rebuild()
+            self.assertEqual(self.versions(db), incremental)
+
+    def test_forgetting_the_newest_snapshot_reopens_versions(self):
+        with catalog.Catalog(self.root) as db:
+            db.add_snapshot("s1", {"x": entry(1)})
+            db.add_snapshot("s2", {"x": entry(2)})
+            db.forget(["s2"])
+            db.add_snapshot("s3", {"x": entry(1)})
+            self.assertEqual(db.history("x"), [(1, 1, None, "s1", "s3")])
+
+    @staticmethod
+    def versions(db):
+        rows = db.db.execute(
+            "SELECT p.path, v.size, v.mtime_ns, v.first_snapshot, v.last_snapshot "
+            "FROM versions v JOIN paths p ON p.id = v.path_id"
+        )
+        return sorted(
+            (path, size, mtime_ns, *db._snapshot_range(first, last))
+            for path, size, mtime_ns, first, last in rows
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
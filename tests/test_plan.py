@@ -0,0 +1,73 @@
+"""
+Tests for the Backup Tool's dry run
+plan_backup and the runners share one FileClassifier, so a plan made before
+a run must count the same files to copy and to reuse as the run itself.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "src", "apps", "backup_tool")
+)
+
+import app  # noqa: E402
+import journal  # noqa: E402
+
+
+class PlanMatchesRunTest(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.source = os.path.join(self.base, "src")
+        for folder in range(3):
+            os.makedirs(os.path.join(self.source, f"d{folder}"))
+            for i in range(20):
+                path = os.path.join(self.source, f"d{folder}", f"f{i}.txt")
+                with open(path, "w") as f:
+                    f.write("x" * i * 40)
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def backup(self, root, snapshot, options):
+        destination = os.path.join(root, snapshot)
+        os.makedirs(destination)
+        stats = app.perform_backup(self.source, destination, [], options)
+        journal.record_run(root, snapshot, options["storage_format"], stats)
+        return stats
+
+    def check(self, storage_format, backup_mode):
+        root = os.path.join(self.base, f"{storage_format}-{backup_mode}")
+        options = {
+            "backup_mode": backup_mode,
+            "storage_format": storage_format,
+            "pack_threshold": 200,
+        }
+        self.backup(root, "2024-01-01_10-00-00", options)
+        with open(os.path.join(self.source, "d1", "f3.txt"), "w") as f:
+            f.write("changed")
+        with open(os.path.join(self.source, "d2", "new.txt"), "w") as f:
+            f.write("y" * 500)
+
+        plan = app.plan_backup(self.source, root, [], options)
+        stats = self.backup(root, "2024-01-02_10-00-00", options)
+        self.assertEqual(plan["copy"], stats["copied"])
+        self.assertEqual(plan["unchanged"], stats["unchanged"] + stats["linked"])
+        if storage_format == "tree":
+            self.assertEqual(plan["packed"], stats["packed"])
+
+    def test_tree_incremental(self):
+        self.check("tree", "incremental")
+
+    def test_tree_snapshot(self):
+        self.check("tree", "snapshot")
+
+    def test_chunks(self):
+        self.check("chunks", "full")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+"""
+Tests for the Backup Tool's retention
+select_snapshots must follow the GFS buckets, and pruning a chain of
+hardlinked or incremental snapshots must leave every file of the kept
+snapshots readable, even when its data lived in a pruned one.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "src", "apps", "backup_tool")
+)
+
+import app  # noqa: E402
+import journal  # noqa: E402
+import restore  # noqa: E402
+from retention import prune_snapshots, select_snapshots  # noqa: E402
+
+
+class SelectSnapshotsTest(unittest.TestCase):
+    SNAPSHOTS = [
+        "2024-01-30_09-00-00",
+        "2024-01-31_09-00-00",
+        "2024-02-01_09-00-00",
+        "2024-02-01_18-00-00",
+        "2024-02-02_09-00-00",
+        "2024-02-02_09-30-00",
+        "2024-02-02_10-00-00",
+    ]
+
+    def test_zero_counts_keep_everything(self):
+        keep, prune = select_snapshots(self.SNAPSHOTS, {"hourly": 0, "daily": 0})
+        self.assertEqual((keep, prune), (self.SNAPSHOTS, []))
+        self.assertEqual(select_snapshots(self.SNAPSHOTS, {}), (self.SNAPSHOTS, []))
+
+    def test_newest_of_each_day(self):
+        keep, prune = select_snapshots(self.SNAPSHOTS, {"daily": 2})
+        self.assertEqual(keep, ["2024-02-01_18-00-00", "2024-02-02_10-00-00"])
+        self.assertEqual(len(prune), 5)
+
+    def test_buckets_add_up(self):
+        keep, _ = select_snapshots(
+            self.SNAPSHOTS, {"hourly": 2, "daily": 0, "monthly": 2}
+        )
+        self.assertEqual(
+            keep,
+            ["2024-01-31_09-00-00", "2024-02-02_09-30-00", "2024-02-02_10-00-00"],
+        )
+
+    def test_weeks_follow_iso_weeks(self):
+        # 2024-01-28 is a Sunday, so 2024-01-29 starts a new ISO week
+        snapshots = [
+            "2024-01-27_10-00-00",
+            "2024-01-28_10-00-00",
+            "2024-01-29_10-00-00",
+        ]
+        keep, prune = select_snapshots(snapshots, {"weekly": 2})
+        self.assertEqual(keep, snapshots[1:])
+        self.assertEqual(prune, snapshots[:1])
+
+    def test_latest_and_undated_are_always_kept(self):
+        snapshots = ["2023-05-01_10-00-00", "2024-02-02_10-00-00", "manual"]
+        keep, prune = select_snapshots(snapshots, {"monthly": 1})
+        self.assertEqual(keep, ["2024-02-02_10-00-00", "manual"])
+        self.assertEqual(prune, ["2023-05-01_10-00-00"])
+
+
+class PruneChainTest(unittest.TestCase):
+    DAYS = ["2024-01-01_10-00-00", "2024-01-02_10-00-00", "2024-01-03_10-00-00"]
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.source = os.path.join(self.base, "src")
+        self.contents = {}
+        for folder in range(2):
+            for i in range(10):
+                self.write(os.path.join(f"d{folder}", f"f{i}.txt"), f"{folder}-{i}" * i)
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def write(self, rel_path, text):
+        path = os.path.join(self.source, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        self.contents[rel_path] = text
+
+    def remove(self, rel_path):
+        os.remove(os.path.join(self.source, rel_path))
+        del self.contents[rel_path]
+
+    def backup_chain(self, root, options):
+        """Take one snapshot per day, editing the source in between"""
+        expected = {}
+        for day, snapshot in enumerate(self.DAYS):
+            if day:
+                self.write(os.path.join("d0", f"f{day}.txt"), f"edited on day {day}")
+                self.write(os.path.join("d1", f"new{day}.txt"), "new")
+                self.remove(os.path.join("d1", f"f{day}.txt"))
+            destination = os.path.join(root, snapshot)
+            os.makedirs(destination)
+            stats = app.perform_backup(self.source, destination, [], options)
+            self.assertEqual(stats["errors"], 0)
+            journal.record_run(root, snapshot, options["storage_format"], stats)
+            expected[snapshot] = dict(self.contents)
+        return expected
+
+    def assert_restores(self, root, snapshot, contents):
+        target = os.path.join(self.base, "restored", snapshot)
+        stats = restore.restore_snapshot(root, snapshot, target)
+        self.assertEqual(stats["errors"], 0)
+        restored = {}
+        for folder, _, names in os.walk(target):
+            for name in names:
+                path = os.path.join(folder, name)
+                with open(path) as f:
+                    restored[os.path.relpath(path, target)] = f.read()
+        self.assertEqual(restored, contents)
+
+    def check(self, backup_mode, storage_format="tree"):
+        root = os.path.join(self.base, "backup")
+        options = {"backup_mode": backup_mode, "storage_format": storage_format}
+        expected = self.backup_chain(root, options)
+
+        stats = prune_snapshots(root, {"daily": 2})
+        self.assertEqual((stats["kept"], stats["pruned"]), (2, 1))
+        self.assertEqual(journal.list_snapshots(root), self.DAYS[1:])
+        self.assertFalse(os.path.exists(os.path.join(root, self.DAYS[0])))
+        for snapshot in self.DAYS[1:]:
+            self.assert_restores(root, snapshot, expected[snapshot])
+        return stats
+
+    def test_incremental_chain(self):
+        stats = self.check("incremental")
+        # Files unchanged since the first day lived only in the pruned folder
+        self.assertGreater(stats["rehomed"], 0)
+
+    def test_hardlinked_chain(self):
+        self.check("snapshot")
+
+    def test_chunk_store(self):
+        self.check("full", "chunks")
+
+    def test_dry_run_deletes_nothing(self):
+        root = os.path.join(self.base, "backup")
+        options = {"backup_mode": "incremental", "storage_format": "tree"}
+        expected = self.backup_chain(root, options)
+        stats = prune_snapshots(root, {"daily": 1}, dry_run=True)
+        self.assertEqual(stats["pruned"], 2)
+        self.assertEqual(journal.list_snapshots(root), self.DAYS)
+        self.assert_restores(root, self.DAYS[0], expected[self.DAYS[0]])
+
+
+if __name__ == "__main__":
+    unittest.main()